@@ -0,0 +1,58 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import argparse
+import sys
+from hidtools.recording import (BINARY_EXTENSION, build_index, convert, is_binary_path, is_compressed_path,
+                                open_file, open_recording)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a HID recording between the text and the binary format')
+    parser.add_argument('recording', metavar='recording.hid',
+                        type=str, help='Path to device recording')
+    parser.add_argument('output', metavar='output-file',
+                        type=str, help='The file to write to')
+    parser.add_argument('--format', choices=['text', 'binary'], default=None,
+                        help=f'The output format (default: binary if the output file ends in {BINARY_EXTENSION}, text otherwise)')
+    parser.add_argument('--index', action='store_true', default=False,
+                        help='Write a sidecar index for the output file, see hid-parse --start')
+    args = parser.parse_args()
+
+    if args.index and is_compressed_path(args.output):
+        parser.error('compressed recordings cannot be indexed')
+
+    if args.format is not None:
+        binary = args.format == 'binary'
+    else:
+        binary = is_binary_path(args.output)
+
+    with open_recording(args.recording) as recording:
+        with open_file(args.output, 'wb' if binary else 'w') as out:
+            convert(recording, out, binary)
+
+    if args.index:
+        build_index(args.output)
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 8):
+        sys.exit('Python 3.8 or later required')
+
+    main()
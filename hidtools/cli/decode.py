@@ -24,6 +24,7 @@ import re
 import sys
 import hidtools.hid
 import hidtools.hidraw
+import hidtools.recording
 import logging
 import yaml
 logging.basicConfig(format='%(levelname)s: %(name)s: %(message)s',
@@ -63,6 +64,21 @@ def open_hidraw(path):
         return [device.report_descriptor]
 
 
+def open_binary_recording(path):
+    with open(path, 'rb') as fd:
+        if not hidtools.recording.is_binary_recording(fd):
+            return None
+        logger.debug(f'{path} is a binary recording')
+        recording = hidtools.recording.BinaryRecordingReader(fd)
+        return [d.report_descriptor for d in recording.devices.values()]
+
+
+def open_compressed_recording(path):
+    logger.debug(f'{path} is a compressed recording')
+    with hidtools.recording.open_recording(path) as recording:
+        return [d.report_descriptor for d in recording.devices.values()]
+
+
 def open_binary(path):
     # This will misidentify a few files (e.g. UTF-16) as binary but for the
     # inputs we need to accept it doesn't matter
@@ -117,6 +133,12 @@ def open_report_descriptor(path):
         return open_devnode_rdesc(path)
     if re.match('/dev/hidraw[0-9]+', abspath):
         return open_hidraw(path)
+    if hidtools.recording.is_compressed_path(path):
+        return open_compressed_recording(path)
+    rdesc = open_binary_recording(path)
+    if rdesc is not None:
+        return rdesc
+
     rdesc = open_binary(path)
     if rdesc is not None:
         return rdesc
@@ -0,0 +1,56 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import argparse
+import sys
+from hidtools.recording import build_index, index_path, is_compressed_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the sidecar index of HID recordings, see hid-parse --start')
+    parser.add_argument('recording', metavar='recording.hid', nargs='+',
+                        type=str, help='Path to an uncompressed device recording')
+    parser.add_argument('--stride', metavar='events', default=1024, type=int,
+                        help='The number of events between two index entries (default: 1024)')
+    args = parser.parse_args()
+
+    if args.stride < 1:
+        parser.error('--stride must be at least 1')
+    for path in args.recording:
+        if path == '-' or is_compressed_path(path):
+            parser.error(f'{path}: only uncompressed files can be indexed')
+
+    status = 0
+    for path in args.recording:
+        try:
+            index = build_index(path, args.stride)
+        except (OSError, ValueError) as e:
+            print(f'{path}: {e}', file=sys.stderr)
+            status = 1
+            continue
+        print(f'{index_path(path)}: {len(index)} entries')
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 8):
+        sys.exit('Python 3.8 or later required')
+
+    main()
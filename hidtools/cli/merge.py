@@ -0,0 +1,87 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import argparse
+import contextlib
+import sys
+from hidtools.recording import (BINARY_EXTENSION, build_index, indexed_path, is_binary_path, is_compressed_path,
+                                merge_recordings, open_file, open_recording, split_recording)
+
+
+def merge(inputs, output, binary):
+    with contextlib.ExitStack() as stack:
+        readers = [stack.enter_context(open_recording(path)) for path in inputs]
+        for path, reader in zip(inputs, readers):
+            if reader.origin is None and len(readers) > 1:
+                print(f'{path}: no capture origin, the timestamps are merged as they are', file=sys.stderr)
+        out = stack.enter_context(open_file(output, 'wb' if binary else 'w'))
+        merge_recordings(readers, out, binary)
+    return [output]
+
+
+def split(input, output, binary):
+    with contextlib.ExitStack() as stack:
+        reader = stack.enter_context(open_recording(input))
+        paths = {idx: indexed_path(output, idx) for idx in reader.devices}
+        files = {idx: stack.enter_context(open_file(path, 'wb' if binary else 'w'))
+                 for idx, path in paths.items()}
+        split_recording(reader, files, binary)
+    return list(paths.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge HID recordings into one multi-device recording, or split one')
+    parser.add_argument('output', metavar='output-file',
+                        type=str, help='The file to write to. With --split, the device index is inserted into the file name')
+    parser.add_argument('recording', metavar='recording.hid', nargs='+',
+                        type=str, help='Path to device recording')
+    parser.add_argument('--split', action='store_true', default=False,
+                        help='Split a multi-device recording into one recording per device')
+    parser.add_argument('--format', choices=['text', 'binary'], default=None,
+                        help=f'The output format (default: binary if the output file ends in {BINARY_EXTENSION}, text otherwise)')
+    parser.add_argument('--index', action='store_true', default=False,
+                        help='Write a sidecar index for each output file, see hid-parse --start')
+    args = parser.parse_args()
+
+    if args.split and len(args.recording) > 1:
+        parser.error('--split takes exactly one recording')
+
+    if args.index and is_compressed_path(args.output):
+        parser.error('compressed recordings cannot be indexed')
+
+    if args.format is not None:
+        binary = args.format == 'binary'
+    else:
+        binary = is_binary_path(args.output)
+
+    if args.split:
+        outputs = split(args.recording[0], args.output, binary)
+    else:
+        outputs = merge(args.recording, args.output, binary)
+
+    if args.index:
+        for path in outputs:
+            build_index(path)
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 8):
+        sys.exit('Python 3.8 or later required')
+
+    main()
@@ -19,9 +19,11 @@
 #
 
 import argparse
+import io
 import sys
-import hidtools.hid
-from parse import parse as _parse
+from hidtools.recording import (Recording, RecordingDevice, format_timestamp, is_binary_recording,
+                                load_index, open_file, parse_text_event)
+from hidtools.tap import DEFAULT_TAP_NAME, EventTapReader
 
 
 def get_report(time, report, rdesc):
@@ -54,57 +56,79 @@ def get_report(time, report, rdesc):
     return indent.join(output.split('\n'))
 
 
-def parse_event(line, rdesc_object):
-    e, time, size, report = line.split(' ', 3)
-    report = [int(item, 16) for item in report.split(' ')]
-    assert int(size) == len(report)
-    rdesc = rdesc_object.get(report[0], len(report))
-    if rdesc is None:
-        return None
+def dump_device(device, f_out):
+    """
+    Print the report descriptor of a
+    :class:`hidtools.recording.RecordingDevice`.
+    """
+    rdesc_object = device.report_descriptor
+    rdesc_object.dump(f_out)
 
-    return get_report(time, report, rdesc)
+    if rdesc_object.win8:
+        f_out.write("**** win 8 certified ****\n")
 
 
-def dump_report(line, rdesc_object, f_out):
+def dump_report(timestamp, data, device, f_out):
     """
-    Translate the given report to a human readable format.
+    Print one event of a :class:`hidtools.recording.RecordingDevice`,
+    nothing if the device has no report of this ID and size.
     """
-    event = parse_event(line, rdesc_object)
-    if event:
-        f_out.write(event)
+    rdesc = device.report_descriptor.get(data[0], len(data))
+    if rdesc is not None:
+        f_out.write(get_report(format_timestamp(timestamp), data, rdesc))
         f_out.write("\n")
 
 
-def parse_hid(f_in, f_out, print_events=True):
-    rdesc_dict = {}
+def parse_recording(recording, f_out, print_events=True):
+    """
+    Print the report descriptors and the events of a
+    :class:`hidtools.recording.Recording` (or a view of one) or a
+    :class:`hidtools.tap.EventTapReader` in a human-readable format.
+    """
+    for device in recording.devices.values():
+        dump_device(device, f_out)
+
+    if not print_events:
+        return
+
+    for idx, timestamp, data in recording:
+        dump_report(timestamp, data, recording.devices[idx], f_out)
+
+
+def parse_text_recording(f_in, f_out, print_events=True, start=None, end=None):
+    """
+    Print a text recording line by line, see :func:`parse_recording`.
+    Each report descriptor is printed as soon as it was read, so a
+    recording that is still being written, e.g. by ``hid-recorder`` into
+    a pipe, is printed as it arrives. Lines that are not part of the
+    recording format are copied to ``f_out``, comments are skipped.
+
+    :param int start: the first timestamp in nanoseconds to print or ``None``
+    :param int end: the timestamp in nanoseconds to stop at or ``None``
+    """
+    devices = {}
     device_index = 0
-    while True:
-        line = f_in.readline()
-        if line.startswith("#"):
-            continue
-        elif line.startswith("R:"):
-            rdesc_object = hidtools.hid.ReportDescriptor.from_string(line.lstrip("R: "))
-            rdesc_object.dump(f_out)
-
-            rdesc_dict[device_index] = rdesc_object
-
-            win8 = rdesc_object.win8
-            if win8:
-                f_out.write("**** win 8 certified ****\n")
-        elif line.startswith("D:"):
-            r = _parse('D:{d:d}', line)
-            assert(r is not None)
-            device_index = r['d']
-        elif line.startswith("E:"):
-            if print_events:
-                dump_report(line, rdesc_dict[device_index], f_out)
-        elif line == '':
-            # End of file
-            break
-        elif line.startswith("N:") or \
-                line.startswith("P:") or \
-                line.startswith("I:"):
+    for line in f_in:
+        tag = line[:2]
+        if line.startswith('#') or tag in ('T:', 'N:', 'P:', 'I:'):
             continue
+        elif tag == 'R:':
+            length, _, data = line[2:].strip().partition(' ')
+            rdesc = bytes.fromhex(data)
+            if len(rdesc) != int(length):
+                raise ValueError(f'Invalid report descriptor length in "{line.strip()}"')
+            devices[device_index] = RecordingDevice(rdesc=rdesc)
+            dump_device(devices[device_index], f_out)
+        elif tag == 'D:':
+            device_index = int(line[2:])
+        elif tag == 'E:':
+            if not print_events:
+                continue
+            timestamp, data = parse_text_event(line)
+            if end is not None and timestamp >= end:
+                break
+            if start is None or timestamp >= start:
+                dump_report(timestamp, data, devices[device_index], f_out)
         else:
             f_out.write(line)
 
@@ -112,19 +136,51 @@ def parse_hid(f_in, f_out, print_events=True):
 def main():
     parser = argparse.ArgumentParser(description='Parse a HID recording and display it in human-readable format')
     parser.add_argument('recording', metavar='recording.hid', nargs='?',
-                        help='Path to device recording (stdin if missing)',
-                        type=argparse.FileType('r'), default=sys.stdin)
+                        help='Path to device recording (stdin if missing), may be compressed',
+                        type=str, default='-')
     parser.add_argument('--report-descriptor-only', action='store_true',
                         help='Only print the Report Descriptor',
                         default=False)
+    parser.add_argument('--start', metavar='seconds', type=float, default=None,
+                        help='Only print the events from this timestamp on, using the recording\'s index if there is one')
+    parser.add_argument('--end', metavar='seconds', type=float, default=None,
+                        help='Only print the events before this timestamp')
+    parser.add_argument('--tap', metavar='name', nargs='?', const=DEFAULT_TAP_NAME, default=None, type=str,
+                        help=f'Print the events of a running hid-recorder --tap instead of a recording (default name: {DEFAULT_TAP_NAME})')
     args = parser.parse_args()
-    with args.recording as f:
+
+    if args.tap is not None:
+        if args.recording != '-' or args.start is not None or args.end is not None:
+            parser.error('--tap cannot be combined with a recording, --start or --end')
+        # the events are printed as they arrive
+        sys.stdout.reconfigure(line_buffering=True)
         try:
-            parse_hid(f, sys.stdout, not args.report_descriptor_only)
-        except KeyboardInterrupt:
-            pass
-        except BrokenPipeError:
+            with EventTapReader(args.tap) as tap:
+                parse_recording(tap, sys.stdout, not args.report_descriptor_only)
+        except FileNotFoundError:
+            print(f'No tap named {args.tap}, is hid-recorder --tap running?', file=sys.stderr)
+            sys.exit(1)
+        except (KeyboardInterrupt, BrokenPipeError):
             pass
+        return
+
+    start = round(args.start * 1000000000) if args.start is not None else None
+    end = round(args.end * 1000000000) if args.end is not None else None
+    try:
+        f = open_file(args.recording, 'rb')
+        if not is_binary_recording(f) and (start is None or load_index(args.recording) is None):
+            # without an index to seek with, text is printed as it is read
+            with io.TextIOWrapper(f, encoding='utf-8') as lines:
+                parse_text_recording(lines, sys.stdout, not args.report_descriptor_only, start, end)
+            return
+        if args.recording != '-':
+            f.close()
+        with Recording(args.recording) as recording:
+            parse_recording(recording[start:end], sys.stdout, not args.report_descriptor_only)
+    except KeyboardInterrupt:
+        pass
+    except BrokenPipeError:
+        pass
 
 
 if __name__ == "__main__":
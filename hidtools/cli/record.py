@@ -19,22 +19,30 @@
 
 import select
 import argparse
+import heapq
+import itertools
+import queue
+import signal
 import sys
 import os
+import threading
+import time
 
-from hidtools.hidraw import HidrawDevice
+from hidtools.hidraw import HidrawDevice, RecordingWriter, ReportFilter, enumerate_devices
+from hidtools.tap import DEFAULT_TAP_NAME, EventTap
+from hidtools.recording import (BinaryRecordingWriter, BINARY_EXTENSION, build_index, indexed_path, is_binary_path,
+                                is_compressed_path, format_text_annotation, format_timestamp, open_file,
+                                write_text_header, write_text_event, write_text_origin)
 
 
 def list_devices():
     outfile = sys.stdout if os.isatty(sys.stdout.fileno()) else sys.stderr
     devices = {}
-    for fname in os.listdir('/dev/'):
-        if not fname.startswith('hidraw'):
-            continue
-
-        with open(f'/dev/{fname}') as f:
-            d = HidrawDevice(f)
-            devices[int(fname[6:])] = d.name
+    for info in enumerate_devices():
+        try:
+            devices[int(os.path.basename(info.path)[6:])] = info.name
+        except ValueError:
+            pass
 
     if not devices:
         print('No devices found', file=sys.stderr)
@@ -59,61 +67,649 @@ def list_devices():
         sys.exit(1)
 
 
+class _WriterThread(threading.Thread):
+    """
+    A thread that passes everything queued with :meth:`put` to
+    ``handler`` and flushes the :class:`hidtools.hidraw.RecordingWriter`
+    when its deadline expires.
+    """
+    def __init__(self, writer, handler, name):
+        super().__init__(name=name, daemon=True)
+        self.writer = writer
+        self.handler = handler
+        self._queue = queue.Queue()
+
+    def run(self):
+        while True:
+            timeout = self.writer.timeout()
+            try:
+                item = self._queue.get(timeout=timeout / 1000 if timeout is not None else None)
+            except queue.Empty:
+                self.writer.flush_if_due()
+                continue
+            if item is None:
+                break
+            self.handler(*item)
+            self.writer.flush_if_due()
+        self.writer.close()
+
+    def put(self, *item):
+        self._queue.put(item)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def stop(self):
+        """
+        Handle everything queued so far, flush the writer and exit the
+        thread.
+        """
+        self._queue.put(None)
+        self.join()
+
+
+class AnnotationOutput(object):
+    """
+    Decodes the events and writes the decoded reports into a separate
+    file, leaving only the raw events in the recording. The decoding
+    happens in a background thread so that it does not delay the capture.
+
+    Each decoded report is preceded by a ``# D: <index> E: <timestamp>``
+    line that matches it to the event in the recording.
+
+    .. attribute:: decode_time
+
+        The time spent decoding the events in nanoseconds
+
+    :param str path: the file to write to
+    :param list devices: the list of :class:`hidtools.hidraw.HidrawDevice`
+        as indexed in the :class:`Recorder`
+    """
+    def __init__(self, path, devices):
+        self.path = path
+        self.file = open_file(path, 'w')
+        self.writer = RecordingWriter(self.file)
+        self.decode_time = 0
+        for idx, device in enumerate(devices):
+            self.writer.write(f'# D: {idx} {device.name}\n')
+        self._thread = _WriterThread(self.writer, self._write, f'decoder {path}')
+        self._thread.start()
+
+    def _write(self, idx, device, events):
+        writer = self.writer
+        report_descriptor = device.report_descriptor
+        for e in events:
+            start = time.perf_counter_ns()
+            annotation = format_text_annotation(report_descriptor, e.bytes)
+            self.decode_time += time.perf_counter_ns() - start
+            if annotation:
+                writer.write(f'# D: {idx} E: {format_timestamp(e.timestamp)}\n')
+                writer.write(annotation)
+
+    def write(self, idx, device, events):
+        """
+        Queue the events of the device with recorder index ``idx`` for
+        decoding.
+
+        :param list events: a list of :class:`hidtools.hidraw.HidrawEvent`
+        """
+        self._thread.put(idx, device, events)
+
+    @property
+    def queue_depth(self):
+        """
+        The number of batches waiting to be decoded
+        """
+        return self._thread.qsize()
+
+    def close(self):
+        self._thread.stop()
+        if self.path != '-':
+            self.file.close()
+
+
+class RecordingOutput(object):
+    """
+    One output stream of a :class:`Recorder`, i.e. a file holding one or
+    more devices.
+
+    :param str path: the file to write to, ``-`` for stdout
+    :param bool binary: True for the binary format
+    :param list devices: a list of ``(index, HidrawDevice)`` tuples for the
+        devices written to this output. The index is the device index in
+        the recorder.
+    :param annotations: an :class:`AnnotationOutput` to send the events
+        to for decoding or ``None``. If not ``None``, the text format
+        omits the decoded reports.
+    :param int segment_size: if not ``None``, start a new file once the
+        current one holds this many characters (bytes for the binary
+        format, before compression)
+    :param float segment_duration: if not ``None``, start a new file once
+        the events span this many seconds
+    :param bool index: if True, write the sidecar index for each file once
+        it is complete, see :class:`hidtools.recording.RecordingIndex`
+    :param int origin: the capture origin written to the header of each
+        file, in nanoseconds since the epoch, or ``None``
+
+    If ``segment_size`` or ``segment_duration`` is given, the files are
+    named after ``path`` with the segment number inserted, see
+    :func:`hidtools.recording.indexed_path`. Every file starts with the
+    device headers so each segment is a complete recording. The segment
+    limits are checked before each batch of events.
+
+    .. attribute:: decode_time
+
+        The time spent decoding the events in nanoseconds
+
+    .. attribute:: segment
+
+        The number of the segment currently written
+    """
+    def __init__(self, path, binary, devices, annotations=None, segment_size=None, segment_duration=None,
+                 index=False, origin=None):
+        self.path = path
+        self.origin = origin
+        self.binary = binary
+        self.annotations = annotations
+        self.devices = devices
+        self.segment_size = segment_size
+        self.segment_duration = int(segment_duration * 1000000000) if segment_duration is not None else None
+        self.segmented = segment_size is not None or segment_duration is not None
+        if self.segmented and path == '-':
+            raise ValueError('Segmented recordings need a file name')
+        self.index = index
+        if index and (path == '-' or is_compressed_path(path)):
+            raise ValueError('Only uncompressed files can be indexed')
+        self._index_threads = []
+        self.segment = 0
+        self.decode_time = 0
+        # recorder index to index in this file
+        self.indices = {idx: pos for pos, (idx, d) in enumerate(devices)}
+        self._dropped = {idx: 0 for idx, d in devices}
+
+        self.file = open_file(self._segment_path(), 'wb' if binary else 'w')
+        self.writer = RecordingWriter(self.file)
+        self._write_header()
+
+    def _segment_path(self):
+        if not self.segmented:
+            return self.path
+        return indexed_path(self.path, self.segment)
+
+    def _write_header(self):
+        self._last_index = None
+        self._segment_timestamp = None
+
+        if self.binary:
+            self.recording = BinaryRecordingWriter(self.writer, [d for idx, d in self.devices], self.origin)
+        else:
+            write_text_origin(self.writer, self.origin)
+            for pos, (idx, device) in enumerate(self.devices):
+                if len(self.devices) > 1:
+                    self.writer.write(f'D: {pos}\n')
+                    self._last_index = pos
+                write_text_header(self.writer, device)
+        self.writer.flush()
+        # the segment size does not include the headers
+        self._segment_start = self.writer.size
+
+    def _build_index(self):
+        if self.index:
+            # the segments are indexed while the recording continues
+            thread = threading.Thread(target=build_index, args=(self._segment_path(),), daemon=True)
+            thread.start()
+            self._index_threads.append(thread)
+
+    def _close_file(self):
+        if self.path != '-':
+            # compressed files are only complete once closed
+            self.file.close()
+        self._build_index()
+        for thread in self._index_threads:
+            thread.join()
+
+    def _rotate(self):
+        self.writer.flush()
+        self.file.close()
+        self._index_threads = [t for t in self._index_threads if t.is_alive()]
+        self._build_index()
+        self.segment += 1
+        self.file = open_file(self._segment_path(), 'wb' if self.binary else 'w')
+        self.writer.file = self.file
+        self._write_header()
+
+    def write(self, idx, device, events):
+        """
+        Write the events of the device with recorder index ``idx``.
+
+        :param list events: a list of :class:`hidtools.hidraw.HidrawEvent`
+        """
+        if self.annotations is not None:
+            self.annotations.write(idx, device, events)
+
+        if self.segmented:
+            timestamp = events[0].timestamp
+            if self._segment_timestamp is None:
+                self._segment_timestamp = timestamp
+            elif ((self.segment_size is not None and
+                   self.writer.size - self._segment_start >= self.segment_size) or
+                  (self.segment_duration is not None and
+                   timestamp - self._segment_timestamp >= self.segment_duration)):
+                self._rotate()
+                self._segment_timestamp = timestamp
+
+        pos = self.indices[idx]
+        if self.binary:
+            for e in events:
+                self.recording.write_event(pos, e.timestamp, e.bytes)
+            return
+
+        writer = self.writer
+        if len(self.indices) > 1 and self._last_index != pos:
+            writer.write(f'D: {pos}\n')
+            self._last_index = pos
+
+        dropped = device.events.dropped - self._dropped[idx]
+        if dropped:
+            writer.write(f'# {dropped} events dropped\n')
+            self._dropped[idx] = device.events.dropped
+
+        if self.annotations is not None:
+            for e in events:
+                write_text_event(writer, None, e.timestamp, e.bytes)
+            return
+
+        rdesc = device.report_descriptor
+        for e in events:
+            start = time.perf_counter_ns()
+            annotation = format_text_annotation(rdesc, e.bytes)
+            self.decode_time += time.perf_counter_ns() - start
+            if annotation:
+                writer.write(annotation)
+            write_text_event(writer, None, e.timestamp, e.bytes)
+
+    def timeout(self):
+        """
+        See :meth:`hidtools.hidraw.RecordingWriter.timeout`
+        """
+        return self.writer.timeout()
+
+    def flush_if_due(self):
+        self.writer.flush_if_due()
+
+    @property
+    def queue_depth(self):
+        """
+        The number of batches waiting to be written
+        """
+        return 0
+
+    def close(self):
+        self.writer.close()
+        self._close_file()
+
+
+class ThreadedRecordingOutput(RecordingOutput):
+    """
+    A :class:`RecordingOutput` that decodes, formats and writes the
+    events in a separate thread, so that neither the decoding nor slow
+    storage hold up the capture.
+    """
+    def __init__(self, path, binary, devices, annotations=None, segment_size=None, segment_duration=None,
+                 index=False, origin=None):
+        super().__init__(path, binary, devices, annotations, segment_size, segment_duration, index, origin)
+        self._thread = _WriterThread(self.writer, super().write, f'writer {path}')
+        self._thread.start()
+
+    def write(self, idx, device, events):
+        self._thread.put(idx, device, events)
+
+    @property
+    def queue_depth(self):
+        return self._thread.qsize()
+
+    def timeout(self):
+        return None
+
+    def flush_if_due(self):
+        pass
+
+    def close(self):
+        self._thread.stop()
+        self._close_file()
+
+
+class Recorder(object):
+    """
+    Records events from a set of :class:`hidtools.hidraw.HidrawDevice`
+    through :class:`select.epoll`. Each wakeup reads all pending events
+    of each ready device in one batch.
+
+    Event timestamps are taken when the event is read and all devices
+    share the same time offset, the time the recorder was created, so
+    writing the events in the order they are read keeps the output ordered
+    by timestamp. The wall-clock time of that offset is written to the
+    recordings as their capture origin, see :mod:`hidtools.recording`.
+
+    :param list devices: a list of :class:`hidtools.hidraw.HidrawDevice`,
+        opened with ``nonblocking=True``
+    :param str path: the file to write to, ``-`` for stdout
+    :param bool binary: True for the binary format
+    :param bool per_device: True to write each device into a separate
+        file, see :func:`hidtools.recording.indexed_path`
+    :param bool threads: True to write each file from a separate thread
+    :param str annotations: the file to write the decoded reports to,
+        see :class:`AnnotationOutput`. If ``None``, the decoded reports
+        are written to the text recording.
+    :param int max_batch: the maximum number of events read from one
+        device per wakeup
+    :param float stats_interval: if not ``None``, call :meth:`print_stats`
+        every ``stats_interval`` seconds while recording
+    :param int segment_size: split each output into files of this size,
+        see :class:`RecordingOutput`
+    :param float segment_duration: split each output into files spanning
+        this many seconds, see :class:`RecordingOutput`
+    :param bool index: write a sidecar index for each file, see
+        :class:`RecordingOutput`
+    :param str tap: if not ``None``, also publish the events to a
+        :class:`hidtools.tap.EventTap` of this name for other processes
+        to read
+    :param bool snapshot: if True, keep the events in the devices'
+        :attr:`hidtools.hidraw.HidrawDevice.events` instead of writing them
+        as they are read, and only write the events still kept there when
+        the recorder is closed. Create the devices with a ``capacity`` or
+        ``max_age`` to keep e.g. the events of the last minute only.
+
+    .. attribute:: wakeups
+
+        The number of times the recorder woke up to read events
+
+    .. attribute:: origin
+
+        The capture origin in nanoseconds since the epoch
+    """
+    def __init__(self, devices, path='-', binary=False, per_device=False, threads=False,
+                 annotations=None, max_batch=256, stats_interval=None, segment_size=None, segment_duration=None,
+                 index=False, tap=None, snapshot=False):
+        self.devices = devices
+        self.max_batch = max_batch
+        self.snapshot = snapshot
+        self.stats_interval = stats_interval
+        self.wakeups = 0
+        self._stats_time = time.monotonic()
+        self._stats_wakeups = 0
+        self._device_stats = [d.stats.copy() for d in devices]
+        self._output_stats = {}
+
+        time_offset = time.monotonic_ns()
+        self.origin = time.time_ns()
+        for device in devices:
+            device.time_offset = time_offset
+
+        # created first, it fails if another recorder uses the same name
+        self.tap = None
+        self._tap_published = 0
+        if tap is not None:
+            self.tap = EventTap(devices, tap, origin=self.origin)
+
+        self.annotations = None
+        if annotations is not None:
+            self.annotations = AnnotationOutput(annotations, devices)
+
+        output_class = ThreadedRecordingOutput if threads else RecordingOutput
+        self.outputs = []
+        self._output_for = {}
+        if per_device and len(devices) > 1:
+            for idx, device in enumerate(devices):
+                output = output_class(indexed_path(path, idx), binary, [(idx, device)], self.annotations,
+                                      segment_size, segment_duration, index, self.origin)
+                self.outputs.append(output)
+                self._output_for[idx] = output
+        else:
+            output = output_class(path, binary, list(enumerate(devices)), self.annotations,
+                                  segment_size, segment_duration, index, self.origin)
+            self.outputs.append(output)
+            self._output_for = {idx: output for idx in range(len(devices))}
+
+    def _timeout(self):
+        timeouts = [t / 1000 for t in (o.timeout() for o in self.outputs) if t is not None]
+        if self.stats_interval is not None:
+            timeouts.append(max(0, self._stats_time + self.stats_interval - time.monotonic()))
+        return min(timeouts) if timeouts else -1
+
+    def print_stats(self, file=sys.stderr):
+        """
+        Print the event rate, batch sizes and drops of each device and the
+        decoding and writing times of each output since the last call. The
+        largest batch, the longest gap between events and the dropped
+        events are counted since the start of the recording.
+        The counters themselves are available in
+        :attr:`hidtools.hidraw.HidrawDevice.stats`, :attr:`wakeups` and the
+        outputs' ``decode_time`` and ``writer``.
+        """
+        now = time.monotonic()
+        elapsed = max(now - self._stats_time, 1e-9)
+        wakeups = self.wakeups - self._stats_wakeups
+        print(f'# {elapsed:.1f}s, {wakeups} wakeups', file=file)
+        for idx, device in enumerate(self.devices):
+            stats, prev = device.stats, self._device_stats[idx]
+            events = stats.events - prev.events
+            reads = stats.reads - prev.reads
+            batch = events / reads if reads else 0
+            # overflows can only be detected when draining the queue
+            overflows = ''
+            if not os.get_blocking(device.device.fileno()):
+                overflows = f'{stats.overflows - prev.overflows} possible kernel overflows, '
+            print(f'#   D: {idx} {device.name}: {events / elapsed:.1f} events/s, '
+                  f'{batch:.1f} events/batch (max {stats.max_batch} since start), '
+                  f'{stats.filtered - prev.filtered} filtered, '
+                  f'{overflows}'
+                  f'{device.events.dropped} dropped since start, '
+                  f'longest gap {stats.max_interval / 1000000000:.3f}s since start',
+                  file=file)
+            self._device_stats[idx] = stats.copy()
+        outputs = list(self.outputs)
+        if self.annotations is not None:
+            outputs.append(self.annotations)
+        for output in outputs:
+            current = (output.decode_time, output.writer.write_time, output.writer.written)
+            decode_time, write_time, written = (c - p for c, p in zip(current, self._output_stats.get(output, (0, 0, 0))))
+            print(f'#   {output.path}: decoding {decode_time / 1000000:.1f}ms, '
+                  f'writing {write_time / 1000000:.1f}ms, '
+                  f'{written} written, queue depth {output.queue_depth}',
+                  file=file)
+            self._output_stats[output] = current
+        if self.tap is not None:
+            print(f'#   tap {self.tap.name}: {self.tap.published - self._tap_published} published',
+                  file=file)
+            self._tap_published = self.tap.published
+        self._stats_time = now
+        self._stats_wakeups = self.wakeups
+
+    def run(self):
+        """
+        Record until interrupted or until all devices are gone.
+        """
+        epoll = select.epoll()
+        fds = {}
+        for idx, device in enumerate(self.devices):
+            fd = device.device.fileno()
+            epoll.register(fd, select.EPOLLIN)
+            fds[fd] = idx
+
+        try:
+            while fds:
+                ready = epoll.poll(self._timeout())
+                if ready:
+                    self.wakeups += 1
+                for fd, mask in ready:
+                    idx = fds[fd]
+                    device = self.devices[idx]
+                    try:
+                        first, count = device.read_events(self.max_batch)
+                    except OSError:
+                        # the device is gone
+                        epoll.unregister(fd)
+                        del fds[fd]
+                        continue
+                    if mask & (select.EPOLLHUP | select.EPOLLERR):
+                        epoll.unregister(fd)
+                        del fds[fd]
+
+                    if self.snapshot:
+                        # the events are kept until close()
+                        if self.tap is not None and count:
+                            self.tap.write(idx, device.events[first:first + count])
+                        continue
+
+                    events = device.consume_events()
+                    if events:
+                        if self.tap is not None:
+                            self.tap.write(idx, events)
+                        self._output_for[idx].write(idx, device, events)
+
+                for output in self.outputs:
+                    output.flush_if_due()
+
+                if (self.stats_interval is not None and
+                   time.monotonic() - self._stats_time >= self.stats_interval):
+                    self.print_stats()
+        finally:
+            epoll.close()
+
+    def close(self):
+        """
+        Write all pending events and close the output files. In snapshot
+        mode, this writes the events still kept by the devices.
+        """
+        if self.snapshot:
+            streams = [[(idx, e) for e in device.consume_events()] for idx, device in enumerate(self.devices)]
+            events = heapq.merge(*streams, key=lambda e: e[1].timestamp)
+            for idx, group in itertools.groupby(events, key=lambda e: e[0]):
+                self._output_for[idx].write(idx, self.devices[idx], [e for _, e in group])
+        for output in self.outputs:
+            output.close()
+        if self.annotations is not None:
+            self.annotations.close()
+        if self.tap is not None:
+            self.tap.close()
+
+
+def _sigterm(signum, frame):
+    # handled like ^C so pending events are written before we exit
+    raise KeyboardInterrupt
+
+
 def main():
     parser = argparse.ArgumentParser(description='Record a HID device')
     parser.add_argument('device', metavar='/dev/hidrawX',
                         nargs="*", type=argparse.FileType('r'),
                         help='Path to the hidraw device node')
     parser.add_argument('--output', metavar='output-file',
-                        nargs=1, default=[sys.stdout],
-                        type=argparse.FileType('w'),
-                        help='The file to record to (default: stdout)')
+                        nargs=1, default=[None], type=str,
+                        help='The file to record to (default: stdout), compressed if the name ends in .xz, .gz, .bz2 or .zst')
+    parser.add_argument('--format', choices=['text', 'binary'], default=None,
+                        help=f'The recording format (default: binary if the output file ends in {BINARY_EXTENSION}, text otherwise)')
+    parser.add_argument('--per-device', action='store_true', default=False,
+                        help='Record each device into a separate file, named after the output file with the device index inserted')
+    parser.add_argument('--writer-threads', action='store_true', default=False,
+                        help='Decode and write each output file from a separate thread')
+    parser.add_argument('--segment-size', metavar='bytes', default=None, type=int,
+                        help='Start a new output file once the current one reaches this size')
+    parser.add_argument('--segment-duration', metavar='seconds', default=None, type=float,
+                        help='Start a new output file once the current one spans this many seconds')
+    parser.add_argument('--index', action='store_true', default=False,
+                        help='Write a sidecar index for each output file so hid-parse and hid-replay can seek in it')
+    parser.add_argument('--report-id', metavar='id', action='append', type=int, default=None,
+                        help='Only record reports with this report ID, may be given multiple times')
+    parser.add_argument('--exclude-report-id', metavar='id', action='append', type=int, default=[],
+                        help='Do not record reports with this report ID, may be given multiple times')
+    parser.add_argument('--report-size', metavar='bytes', action='append', type=int, default=None,
+                        help='Only record reports of this size in bytes, including the report ID, may be given multiple times')
+    parser.add_argument('--exclude-vendor-reports', action='store_true', default=False,
+                        help='Do not record reports of vendor-defined application collections')
+    parser.add_argument('--stats', metavar='seconds', default=None, type=float,
+                        help='Print the event rates, batch sizes, drops and output times to stderr at this interval')
+    parser.add_argument('--annotations', metavar='annotation-file', default=None, type=str,
+                        help='Decode the events in the background and write the decoded reports to this file instead of the recording')
+    parser.add_argument('--buffer-size', metavar='events', default=None, type=int,
+                        help='Only keep the last this many events of each device in memory and write them when stopped')
+    parser.add_argument('--buffer-age', metavar='seconds', default=None, type=float,
+                        help='Only keep the events of the last this many seconds in memory and write them when stopped')
+    parser.add_argument('--tap', metavar='name', nargs='?', const=DEFAULT_TAP_NAME, default=None, type=str,
+                        help=f'Publish the events to a shared memory tap for hid-parse --tap and other readers (default name: {DEFAULT_TAP_NAME})')
     args = parser.parse_args()
 
-    devices = {}
-    last_index = -1
-    poll = select.poll()
-    is_first_event = True
-
     # argparse always gives us a list for nargs 1
-    output = args.output[0]
+    path = args.output[0]
+    if path is None:
+        path = '-'
+    if args.per_device and path == '-':
+        parser.error('--per-device requires --output')
+    if (args.segment_size is not None or args.segment_duration is not None) and path == '-':
+        parser.error('--segment-size and --segment-duration require --output')
+    if args.index and (path == '-' or is_compressed_path(path)):
+        parser.error('--index requires an uncompressed --output file')
+    if args.buffer_size is not None and args.buffer_size < 1:
+        parser.error('--buffer-size must be at least 1')
+    if args.buffer_age is not None and args.buffer_age <= 0:
+        parser.error('--buffer-age must be positive')
+    if args.annotations is not None and args.annotations == path:
+        parser.error('--annotations must not be the output file')
+    binary = args.format == 'binary' or (args.format is None and path != '-' and is_binary_path(path))
 
-    try:
-        if not args.device:
-            args.device = [open(list_devices())]
+    signal.signal(signal.SIGTERM, _sigterm)
 
-        for idx, fd in enumerate(args.device):
-            device = HidrawDevice(fd)
-            if len(args.device) > 1:
-                print(f'D: {idx}', file=output)
-            device.dump(output)
-            poll.register(fd, select.POLLIN)
-            devices[fd.fileno()] = (idx, device)
+    if not args.device:
+        args.device = [open(list_devices())]
 
-        if len(devices) == 1:
-            last_index = 0
+    report_filter = None
+    if (args.report_id is not None or args.exclude_report_id or args.report_size is not None or
+       args.exclude_vendor_reports):
+        report_filter = ReportFilter(report_ids=args.report_id,
+                                     exclude_report_ids=args.exclude_report_id,
+                                     sizes=args.report_size)
+        if args.exclude_vendor_reports:
+            report_filter.predicate = lambda report: not ReportFilter.is_vendor_report(report)
 
-        while True:
-            events = poll.poll()
-            for fd, event in events:
-                idx, device = devices[fd]
-                device.read_events()
-                if last_index != idx:
-                    print(f'D: {idx}', file=output)
-                    last_index = idx
-                device.dump(output)
-
-                if is_first_event:
-                    is_first_event = False
-                    for idx, d in devices.values():
-                        d.time_offset = device.time_offset
+    snapshot = args.buffer_size is not None or args.buffer_age is not None
+    if snapshot:
+        capacity = args.buffer_size
+    else:
+        # events are written out as soon as they are read, there is no need
+        # to keep more than a few around
+        capacity = 1024
+
+    try:
+        devices = [HidrawDevice(fd, capacity=capacity, max_age=args.buffer_age, nonblocking=True,
+                                report_filter=report_filter)
+                   for fd in args.device]
+    except ValueError as e:
+        # report IDs for a device without numbered reports
+        print(f'Cannot filter by report ID: {e}', file=sys.stderr)
+        sys.exit(1)
 
+    try:
+        recorder = Recorder(devices, path, binary, per_device=args.per_device,
+                            threads=args.writer_threads, annotations=args.annotations,
+                            stats_interval=args.stats, segment_size=args.segment_size,
+                            segment_duration=args.segment_duration, index=args.index, tap=args.tap,
+                            snapshot=snapshot)
+    except FileExistsError:
+        print(f'A tap named {args.tap} exists already, see --tap', file=sys.stderr)
+        sys.exit(1)
+    try:
+        recorder.run()
     except KeyboardInterrupt:
         pass
+    finally:
+        recorder.close()
+        if args.stats is not None:
+            recorder.print_stats()
 
 
 if __name__ == '__main__':
-    if sys.version_info < (3, 6):
-        sys.exit('Python 3.6 or later required')
+    if sys.version_info < (3, 8):
+        sys.exit('Python 3.8 or later required')
 
     main()
@@ -18,12 +18,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from datetime import datetime, timedelta
 import argparse
 import sys
 import time
 import hidtools.uhid
-from parse import parse, findall
+from hidtools.recording import Recording
 
 import logging
 logging.basicConfig(format='%(levelname)s: %(name)s: %(message)s',
@@ -33,40 +32,21 @@ logger = logging.getLogger('hidtools.replay')
 
 
 class HIDReplay(object):
-    def __init__(self, filename):
+    def __init__(self, filename, start=None, end=None):
         self._devices = {}
         self.filename = filename
         self.replayed_count = 0
-        with open(filename) as f:
-            idx = 0
-            for line in f:
-                line = line.strip()
-                if line.startswith('D:'):
-                    r = parse('D: {idx:d}', line)
-                    assert r is not None
-                    idx = r['idx']
-                    continue
-                if idx not in self._devices:
-                    self._devices[idx] = hidtools.uhid.UHIDDevice()
-                dev = self._devices[idx]
-                if line.startswith('N:'):
-                    r = parse('N: {name}', line)
-                    assert r is not None
-                    dev.name = r['name']
-                elif line.startswith('I:'):
-                    r = parse('I: {bus:x} {vid:x} {pid:x}', line)
-                    assert r is not None
-                    dev.info = [r['bus'], r['vid'], r['pid']]
-                elif line.startswith('P:'):
-                    r = parse('P: {phys}', line)
-                    if r is not None:
-                        dev.phys = r['phys']
-                elif line.startswith('R:'):
-                    r = parse('R: {length:d} {desc}', line)
-                    assert r is not None
-                    length = r['length']
-                    dev.rdesc = r['desc']
-                    assert len(dev.rdesc) == length
+        self.recording = Recording(filename)
+        # the events in the time window to replay, in nanoseconds
+        self.events = self.recording[start:end]
+        for idx, d in self.recording.devices.items():
+            dev = hidtools.uhid.UHIDDevice()
+            dev.name = d.name
+            dev.info = [d.bustype, d.vendor_id, d.product_id]
+            if d.phys is not None:
+                dev.phys = d.phys
+            dev.rdesc = d.rdesc
+            self._devices[idx] = dev
 
         for d in self._devices.values():
             d.create_kernel_device()
@@ -87,46 +67,30 @@ class HIDReplay(object):
     def __exit__(self, exc_type, exc_value, traceback):
         for d in self._devices.values():
             d.destroy()
+        self.recording.close()
 
     def inject_events(self, wait_max_seconds=2):
         t = None
         timestamp_offset = 0
-        with open(self.filename) as f:
-            idx = 0
-            dev = None
-            if idx in self._devices:
-                dev = self._devices[idx]
-            for l in f:
-                if l.startswith('D:'):
-                    r = parse('D: {idx:d}', l)
-                    assert r is not None
-                    dev = self._devices[r['idx']]
-                elif l.startswith('E:'):
-                    r = parse('E: {sec:d}.{usec:d} {len:2d}{data}', l)
-                    assert r is not None
-                    length = r['len']
-                    timestamp = r['sec'] + r['usec'] / 1000000
-                    r_ = findall(' {:S}', r['data'])
-                    data = [int(x[0], 16) for x in r_]
-                    assert len(data) == int(length)
-                    now = datetime.today()
-                    if t is None:
-                        t = now
-                        timestamp_offset = timestamp
-                    target_time = t + timedelta(seconds=timestamp - timestamp_offset)
-                    sleep = 0
-                    if target_time > now:
-                        sleep = target_time - now
-                        sleep = sleep.seconds + sleep.microseconds / 1000000
-                    if sleep < 0.01:
-                        pass
-                    elif sleep < wait_max_seconds:
-                        time.sleep(sleep)
-                    else:
-                        t = now
-                        timestamp_offset = timestamp
-                        time.sleep(wait_max_seconds)
-                    dev.call_input_event(data)
+        for idx, timestamp, data in self.events:
+            dev = self._devices[idx]
+            now = time.monotonic_ns()
+            if t is None:
+                t = now
+                timestamp_offset = timestamp
+            target_time = t + timestamp - timestamp_offset
+            sleep = 0
+            if target_time > now:
+                sleep = (target_time - now) / 1000000000
+            if sleep < 0.01:
+                pass
+            elif sleep < wait_max_seconds:
+                time.sleep(sleep)
+            else:
+                t = now
+                timestamp_offset = timestamp
+                time.sleep(wait_max_seconds)
+            dev.call_input_event(data)
         self.replayed_count += 1
 
     def replay_one_sequence(self):
@@ -146,12 +110,18 @@ def main():
                         type=str, help='Path to device recording')
     parser.add_argument('--verbose', action='store_true',
                         default=False, help='Show debugging information')
+    parser.add_argument('--start', metavar='seconds', type=float, default=None,
+                        help='Start replaying at this timestamp, using the recording\'s index if there is one')
+    parser.add_argument('--end', metavar='seconds', type=float, default=None,
+                        help='Stop replaying at this timestamp')
     args = parser.parse_args()
     if args.verbose:
         base_logger.setLevel(logging.DEBUG)
 
     try:
-        with HIDReplay(args.recording) as replay:
+        start = round(args.start * 1000000000) if args.start is not None else None
+        end = round(args.end * 1000000000) if args.end is not None else None
+        with HIDReplay(args.recording, start, end) as replay:
             while True:
                 replay.replay_one_sequence()
     except PermissionError:
@@ -161,7 +131,7 @@ def main():
 
 
 if __name__ == '__main__':
-    if sys.version_info < (3, 6):
-        sys.exit('Python 3.6 or later required')
+    if sys.version_info < (3, 8):
+        sys.exit('Python 3.8 or later required')
 
     main()
@@ -19,6 +19,8 @@
 #
 
 import copy
+import functools
+import struct
 import sys
 from hidtools.hut import HUT
 from hidtools.util import twos_comp, to_twos_comp
@@ -623,6 +625,82 @@ class _HidRDescItem(object):
                 pass
 
 
+class HidCollection(object):
+    """
+    Represents one Collection in a report descriptor. Collections form a
+    tree, the top-level collections (usually of type ``APPLICATION``) have
+    no parent.
+
+    .. attribute:: index
+
+        The index of this collection in
+        :attr:`ReportDescriptor.collections`, in the order the collections
+        appear in the report descriptor
+
+    .. attribute:: type
+
+        The collection type as string, one of ``PHYSICAL``,
+        ``APPLICATION`` or ``LOGICAL``
+
+    .. attribute:: usage
+
+        The 32-bit Usage of this collection (Usage Page in the upper 16
+        bits) or ``None``
+
+    .. attribute:: parent
+
+        The parent :class:`HidCollection` or ``None``
+
+    .. attribute:: children
+
+        A list of the :class:`HidCollection` nested in this collection
+
+    .. attribute:: fields
+
+        A list of the :class:`HidField` that are directly in this
+        collection, i.e. not in one of the :attr:`children`
+    """
+    def __init__(self, index, type, usage, parent):
+        self.index = index
+        self.type = type
+        self.usage = usage
+        self.parent = parent
+        self.children = []
+        self.fields = []
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def usage_name(self):
+        """
+        The Usage name for this collection (e.g. "Finger") or ``None``
+        """
+        if self.usage is None:
+            return None
+
+        try:
+            return HUT[self.usage >> 16][self.usage & 0xFFFF]
+        except KeyError:
+            return f'0x{self.usage:04x}'
+
+    @property
+    def application(self):
+        """
+        The ``APPLICATION`` :class:`HidCollection` this collection belongs
+        to or ``None``
+        """
+        c = self
+        while c is not None and c.type != 'APPLICATION':
+            c = c.parent
+        return c
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def __repr__(self):
+        return f'{self.type.capitalize()} ({self.usage_name}) {self.index}'
+
+
 class HidField(object):
     """
     Represents one field in a HID report. A field is one element of a HID
@@ -656,6 +734,11 @@ class HidField(object):
     .. attribute:: count
 
         Report Count for this HID field
+
+    .. attribute:: collection_node
+
+        The innermost :class:`HidCollection` this HID field is in, or
+        ``None``
     """
     def __init__(self,
                  report_ID,
@@ -683,6 +766,7 @@ class HidField(object):
         self.logical_max = logical_max
         self.size = item_size
         self.count = count
+        self.collection_node = None
 
     def copy(self):
         """
@@ -693,7 +777,8 @@ class HidField(object):
             c.usages = self.usages[:]
         return c
 
-    def _usage_name(self, usage):
+    @staticmethod
+    def _usage_name(usage):
         usage_page = usage >> 16
         value = usage & 0x0000FFFF
         if usage_page in HUT:
@@ -838,15 +923,30 @@ class HidField(object):
         if len(data) != self.count:
             raise Exception("-EINVAL")
 
+        self._check_range(data)
+
         for idx in range(self.count):
             v = data[idx]
-            if self.usage_name not in ['Contact Id', 'Contact Max', 'Contact Count']:
-                if v < self.logical_min or v > self.logical_max:
-                    raise RangeError(self, v)
             if self.logical_min < 0:
                 v = to_twos_comp(v, self.size)
             self._fill_value(report, v, idx)
 
+    @property
+    def _range_exempt(self):
+        return self.usage_name in ['Contact Id', 'Contact Max', 'Contact Count']
+
+    def _check_range(self, data):
+        """
+        Raise a :class:`RangeError` if any value in ``data`` is outside
+        the logical range of this field.
+        """
+        if self._range_exempt:
+            return
+
+        for v in data:
+            if v < self.logical_min or v > self.logical_max:
+                raise RangeError(self, v)
+
     @property
     def is_array(self):
         """
@@ -966,6 +1066,19 @@ class HidReport(object):
         The HidFields comprising this report
 
     """
+    # struct format characters for byte-aligned fields, indexed by
+    # (size in bits, signed)
+    _struct_formats = {
+        (8, False): 'B',
+        (8, True): 'b',
+        (16, False): 'H',
+        (16, True): 'h',
+        (32, False): 'I',
+        (32, True): 'i',
+        (64, False): 'Q',
+        (64, True): 'q',
+    }
+
     def __init__(self, report_ID, application):
         self.fields = []
         self.report_ID = report_ID
@@ -974,6 +1087,10 @@ class HidReport(object):
         self._bitsize = 0
         if self.numbered:
             self._bitsize = 8
+        self._struct = None
+        self._struct_slots = None
+        self._contacts = None
+        self._format_layouts = {}
 
     def append(self, field):
         """
@@ -984,6 +1101,9 @@ class HidReport(object):
         self.fields.append(field)
         field.start = self._bitsize
         self._bitsize += field.size
+        self._struct_slots = None
+        self._contacts = None
+        self._format_layouts = {}
 
     def extend(self, fields):
         """
@@ -996,6 +1116,129 @@ class HidReport(object):
         for f in fields:
             f.start = self._bitsize
             self._bitsize += f.size * f.count
+        self._struct_slots = None
+        self._contacts = None
+        self._format_layouts = {}
+
+    def _compile(self):
+        """
+        Precompile a :class:`struct.Struct` for all fields of this report
+        that are byte-aligned 8, 16, 32 or 64 bit fields. The bytes used
+        by any other field are skipped as padding, those fields fall back
+        to the bit extraction in :class:`HidField`.
+
+        This fills in ``_struct_slots``, one entry per field: either the
+        index of the field's first value in the unpacked tuple, or
+        ``None`` if the field is const or not byte-aligned.
+        """
+        fmt = '<'
+        offset = 0  # number of bytes covered by fmt so far
+        count = 0  # number of values in the unpacked tuple
+        slots = []
+        for f in self.fields:
+            code = None
+            if not f.is_const and f.start % 8 == 0 and f.start // 8 >= offset:
+                code = self._struct_formats.get((f.size, f.logical_min < 0))
+            if code is None:
+                slots.append(None)
+                continue
+
+            pad = f.start // 8 - offset
+            if pad:
+                fmt += f'{pad}x'
+            fmt += f'{f.count}{code}'
+            offset = f.start // 8 + f.count * f.size // 8
+            slots.append(count)
+            count += f.count
+
+        self._struct = struct.Struct(fmt) if count else None
+        self._struct_slots = slots
+
+    def get_values(self, data):
+        """
+        Extract the values of all fields of this report from ``data``.
+
+        Byte-aligned fields are extracted with a single
+        :meth:`struct.Struct.unpack_from`, all other fields use
+        :meth:`HidField.get_values`.
+
+        :param data: a list of 8-bit integers or a bytes-like object that
+            is this report
+        :returns: a list with one entry per :attr:`fields`, either the list
+            of values as returned by :meth:`HidField.get_values` or
+            ``None`` for const fields
+        """
+        if self._struct_slots is None:
+            self._compile()
+
+        unpacked = None
+        if self._struct is not None and len(data) >= self._struct.size:
+            if not isinstance(data, (bytes, bytearray, memoryview)):
+                data = bytes(data)
+            unpacked = self._struct.unpack_from(data)
+
+        values = []
+        for f, slot in zip(self.fields, self._struct_slots):
+            if f.is_const:
+                values.append(None)
+            elif slot is not None and unpacked is not None:
+                values.append(list(unpacked[slot:slot + f.count]))
+            else:
+                values.append(f.get_values(data))
+        return values
+
+    def fill_values(self, report, values):
+        """
+        The reverse of :meth:`get_values`: set all fields in ``report`` to
+        the given values.
+
+        Byte-aligned fields are written with a single
+        :meth:`struct.Struct.pack_into` if ``report`` is a
+        :class:`bytearray`, all other fields use
+        :meth:`HidField.fill_values`. Bits not covered by any non-const
+        field are reset to zero, except for the Report ID.
+
+        :param report: a :class:`bytearray` or list of 8-bit integers of at
+            least :attr:`size` elements, modified in place
+        :param list values: one entry per :attr:`fields` in the format
+            returned by :meth:`get_values`. Entries for const fields are
+            ignored.
+        """
+        if self._struct_slots is None:
+            self._compile()
+
+        if len(values) != len(self.fields):
+            raise Exception("-EINVAL")
+
+        packed = self._struct is not None and isinstance(report, bytearray)
+        if packed:
+            args = []
+            for f, slot, v in zip(self.fields, self._struct_slots, values):
+                if slot is None:
+                    continue
+                if len(v) != f.count:
+                    raise Exception("-EINVAL")
+                f._check_range(v)
+                if f._range_exempt:
+                    # write negative values as two's complement like
+                    # HidField.fill_values() does
+                    mask = (1 << f.size) - 1
+                    if f.logical_min < 0:
+                        v = [(x & mask) - mask - 1 if x & mask > mask >> 1 else x & mask for x in v]
+                    else:
+                        v = [x & mask if x < 0 else x for x in v]
+                args.extend(v)
+            try:
+                self._struct.pack_into(report, 0, *args)
+            except struct.error as e:
+                raise Exception(f'fill_values(): {e}')
+            if self.numbered:
+                report[0] = self.report_ID
+
+        for f, slot, v in zip(self.fields, self._struct_slots, values):
+            if f.is_const or (packed and slot is not None):
+                continue
+            f.fill_values(report, v)
 
     @property
     def application_name(self):
@@ -1033,70 +1276,106 @@ class HidReport(object):
     def __iter__(self):
         return iter(self.fields)
 
-    def _fix_xy_usage_for_mt_devices(self, usage):
-        if usage not in self.prev_seen_usages:
+    @staticmethod
+    def _fix_xy_usage_for_mt_devices(usage, prev_seen_usages):
+        if usage not in prev_seen_usages:
             return usage
 
         # multitouch devices might have 2 X for CX, TX
-        if usage == 'X' and ('Y' not in self.prev_seen_usages or
-                             'CY' in self.prev_seen_usages):
+        if usage == 'X' and ('Y' not in prev_seen_usages or
+                             'CY' in prev_seen_usages):
             usage = 'CX'
 
         # multitouch devices might have 2 Y for CY, TY
-        if usage == 'Y' and ('X' not in self.prev_seen_usages or
-                             'CX' in self.prev_seen_usages):
+        if usage == 'Y' and ('X' not in prev_seen_usages or
+                             'CX' in prev_seen_usages):
             usage = 'CY'
 
         return usage
 
-    def _format_one_event(self, data, global_data, hidInputItem, r_out):
-        """
-        Fill in the report array ``r_out`` with the data for this input
-        item. ``r_out`` is modified in place with the values from ``data``
-        or ``global_data`` (as fallback) that apply to this input item.
-
-        :param object data: an object with attributes matching the HID usage names
-            in this report. Where an attribute is undefined, the
-            `global_data` is used instead.
-        :param object global_data: an object with attributes matching the
-            HID usage names, used whenever the `data` doesn't have an
-            attribute defined.
-        :param HidField hidInputItem: the input item of this report to set
-        :param list r_out: the integer array of values for this report,
-            modified in-place.
-        """
-        if hidInputItem.is_const:
-            return
-
-        usage = hidInputItem.usage_name
-
-        usage = self._fix_xy_usage_for_mt_devices(usage)
-
-        if (self.prev_collection is not None and
-           self.prev_collection != hidInputItem.collection and
-           usage in self.prev_seen_usages):
-            if len(data) > 0:
-                data.pop(0)
-            self.prev_seen_usages.clear()
+    @staticmethod
+    def _enters_collection(prev, cur):
+        """
+        ``True`` if :class:`HidCollection` ``cur`` is neither ``prev`` nor
+        one of its parents, i.e. going from a field in ``prev`` to a field in
+        ``cur`` enters a new collection rather than returning to the
+        enclosing one.
+        """
+        while prev is not None and prev is not cur:
+            prev = prev.parent
+        return prev is not cur
+
+    def _compile_contacts(self):
+        """
+        Precompute how the fields of this report map to the objects passed
+        to :meth:`create_report`. On a multitouch device, each contact is
+        usually in its own collection. A new contact starts whenever a
+        field enters a new :class:`HidCollection` and its usage was already
+        seen in the current contact.
+
+        This fills in ``_contacts``, one entry per field: ``None`` for
+        const fields, otherwise a tuple of ``(new_contact, attribute)``
+        where ``attribute`` is the usage name as attribute (e.g.
+        ``contactcount`` for "Contact Count").
+        """
+        contacts = []
+        prev_seen_usages = []
+        prev_collection = None
+        for f in self.fields:
+            if f.is_const:
+                contacts.append(None)
+                continue
 
-        value = 0
-        # Match the HID usage with our attributes, so
-        # Contact Count -> contactcount, etc.
-        field = usage.replace(' ', '').lower()
+            usage = self._fix_xy_usage_for_mt_devices(f.usage_name, prev_seen_usages)
+            new_contact = (usage in prev_seen_usages and
+                           self._enters_collection(prev_collection, f.collection_node))
+            if new_contact:
+                prev_seen_usages = []
+
+            # Match the HID usage with our attributes, so
+            # Contact Count -> contactcount, etc.
+            contacts.append((new_contact, usage.replace(' ', '').lower()))
+            prev_collection = f.collection_node
+            prev_seen_usages.append(usage)
+
+        self._contacts = contacts
+
+    def _compile_format(self, split_lines):
+        """
+        Precompute the static parts of :meth:`format_report` for
+        ``split_lines``: one entry per field, ``None`` for const and array
+        fields, otherwise a tuple of ``(newline, usage_name,
+        value_format)`` where ``newline`` is ``True`` if the field enters a
+        new :class:`HidCollection`.
+        """
+        layout = []
+        prev_seen_usages = []
+        prev_collection = None
+        first = True
+        for f in self.fields:
+            if f.is_const or f.is_array:
+                layout.append(None)
+                continue
 
-        if len(data) > 0 and hasattr(data[0], field):
-            value = getattr(data[0], field)
-        elif global_data is not None and hasattr(global_data, field):
-            value = getattr(global_data, field)
+            value_format = "{:d}"
+            if f.size > 1:
+                value_format = f'{{:{str(len(str(1 << f.size)) + 1)}d}}'
+            if f.usage_page_name == 'Button':
+                usage_name = 'Button' if f.usage_name == 'B1' else ''
+            else:
+                usage_name = self._fix_xy_usage_for_mt_devices(f.usage_name, prev_seen_usages)
 
-        try:
-            value[0]
-        except TypeError:
-            value = [value]
+            newline = (split_lines and not first and
+                       self._enters_collection(prev_collection, f.collection_node))
+            if newline:
+                prev_seen_usages = []
+            first = False
+            prev_collection = f.collection_node
+            prev_seen_usages.append(usage_name)
+            layout.append((newline, usage_name, value_format))
 
-        hidInputItem.fill_values(r_out, value)
-        self.prev_collection = hidInputItem.collection
-        self.prev_seen_usages.append(usage)
+        self._format_layouts[split_lines] = layout
+        return layout
 
     def create_report(self, data, global_data):
         """
@@ -1116,21 +1395,43 @@ class HidReport(object):
         The HidReport will create the report according to the device's
         report descriptor.
         """
-        self.prev_seen_usages = []
-        self.prev_collection = None
-        r = [0] * self.size
+        if self._contacts is None:
+            self._compile_contacts()
+
+        r = bytearray(self.size)
 
         if self.numbered:
             r[0] = self.report_ID
 
-        for item in self:
-            self._format_one_event(data, global_data, item, r)
+        values = []
+        for contact in self._contacts:
+            if contact is None:
+                values.append(None)
+                continue
+
+            new_contact, field = contact
+            if new_contact and len(data) > 0:
+                data.pop(0)
+
+            value = 0
+            if len(data) > 0 and hasattr(data[0], field):
+                value = getattr(data[0], field)
+            elif global_data is not None and hasattr(global_data, field):
+                value = getattr(global_data, field)
+
+            try:
+                value[0]
+            except TypeError:
+                value = [value]
+            values.append(value)
+
+        self.fill_values(r, values)
 
         if len(data) > 0:
             # remove the last item we just processed
             data.pop(0)
 
-        return r
+        return list(r)
 
     def format_report(self, data, split_lines=True):
         """
@@ -1145,49 +1446,37 @@ class HidReport(object):
 
         output = ''
 
-        self.prev_seen_usages = []
-        self.prev_collection = None
+        try:
+            layout = self._format_layouts[split_lines]
+        except KeyError:
+            layout = self._compile_format(split_lines)
+
         sep = ''
         if self.numbered:
             assert self.report_ID == data[0]
             output += f'ReportID: {self.report_ID} '
             sep = '/'
         prev = None
-        for report_item in self:
+        for report_item, values, fmt in zip(self, self.get_values(data), layout):
             if report_item.is_const:
                 output += f'{sep} # '
                 continue
 
-            # get the value and consumes bits
-            values = report_item.get_values(data)
-
             if not report_item.is_array:
-                value_format = "{:d}"
-                if report_item.size > 1:
-                    value_format = f'{{:{str(len(str(1 << report_item.size)) + 1)}d}}'
+                newline, usage_name, value_format = fmt
                 if isinstance(values[0], str):
                     value_format = "{}"
-                if report_item.usage_page_name == 'Button':
-                    if report_item.usage_name == 'B1':
-                        usage_name = 'Button'
-                        usage = f' {usage_name}:'
-                    else:
-                        usage_name = ''
-                        sep = ''
-                        usage = ''
-                else:
-                    usage_name = self._fix_xy_usage_for_mt_devices(report_item.usage_name)
+                if usage_name:
                     usage = f' {usage_name}:'
+                else:
+                    # Buttons other than B1
+                    sep = ''
+                    usage = ''
 
-                # if we don't get a key error this is a duplicate in
-                # this report descriptor and we need a linebreak
-                if (split_lines and
-                   self.prev_collection is not None and
-                   self.prev_collection != report_item.collection):
-                    self.prev_seen_usages = []
+                # a new collection, e.g. the next touch in a multitouch
+                # report, starts on a new line
+                if newline:
                     output += '\n'
-                self.prev_collection = report_item.collection
-                self.prev_seen_usages.append(usage_name)
 
                 # do not reapeat the usage name if several are in a row
                 if (prev and
@@ -1224,6 +1513,112 @@ class HidReport(object):
         return output
 
 
+class HidMultitouchDecoder(object):
+    """
+    Decodes the reports of a multitouch device into a fixed set of contact
+    slots. The slot layout is computed once from the report descriptor:
+    each collection with a ``Contact Id`` field (usually a ``Finger``
+    Logical collection) is one slot, all fields in that collection or its
+    children are that slot's values. ::
+
+        decoder = HidMultitouchDecoder(rdesc.input_reports[1])
+        print(decoder.usages)  # ['Tip Switch', 'Contact Id', 'X', 'Y']
+        contact_count, scan_time, slots = decoder.decode(data)
+        for tip, contact_id, x, y in slots:
+            ...
+
+    Note that devices in hybrid mode send the contacts across several
+    reports, only the first of which has a non-zero contact count.
+
+    :param HidReport report: the Input report to decode
+
+    .. attribute:: report
+
+        The :class:`HidReport` this decoder is for
+
+    .. attribute:: slots
+
+        The list of :class:`HidCollection`, one for each contact slot
+
+    .. attribute:: usages
+
+        The list of usage names for the values of each slot, in order.
+        Multitouch devices that have two X or Y usages per contact have
+        the second one named ``CX`` or ``CY``.
+    """
+    def __init__(self, report):
+        self.report = report
+        self.slots = []
+        self.usages = []
+        self._contact_count = None
+        self._scan_time = None
+
+        fields = report.fields
+        for f in fields:
+            if (not f.is_const and f.usage_name == 'Contact Id' and
+               f.collection_node not in self.slots):
+                self.slots.append(f.collection_node)
+
+        # field index and value index for each (slot, usage)
+        layout = [{} for _ in self.slots]
+        for idx, f in enumerate(fields):
+            if f.is_const or f.is_array:
+                continue
+
+            slot = self._find_slot(f.collection_node)
+            if slot is None:
+                if f.usage_name == 'Contact Count' and self._contact_count is None:
+                    self._contact_count = idx
+                elif f.usage_name == 'Scan Time' and self._scan_time is None:
+                    self._scan_time = idx
+                continue
+
+            seen = layout[slot]
+            for i in range(f.count):
+                name = f.get_usage_name(i) if f.usages and i < len(f.usages) else f.usage_name
+                usage = HidReport._fix_xy_usage_for_mt_devices(str(name), seen)
+                if usage in seen:
+                    continue
+                seen[usage] = (idx, i)
+                if usage not in self.usages:
+                    self.usages.append(usage)
+
+        self._layout = [[seen.get(u) for u in self.usages] for seen in layout]
+
+    def _find_slot(self, collection):
+        while collection is not None:
+            try:
+                return self.slots.index(collection)
+            except ValueError:
+                collection = collection.parent
+        return None
+
+    def decode(self, data):
+        """
+        Decode the given report into its contact slots.
+
+        :param data: a list of 8-bit integers or a bytes-like object that
+            is this report
+        :returns: a tuple of ``(contact_count, scan_time, slots)`` where
+            ``slots`` is a list with one list of values per slot, each in
+            the order of :attr:`usages`. A value is ``None`` where the slot
+            does not have that usage, ``contact_count`` and ``scan_time``
+            are ``None`` if the report does not have them.
+        """
+        values = self.report.get_values(data)
+
+        contact_count = None
+        if self._contact_count is not None:
+            contact_count = values[self._contact_count][0]
+        scan_time = None
+        if self._scan_time is not None:
+            scan_time = values[self._scan_time][0]
+
+        slots = [[values[loc[0]][loc[1]] if loc is not None else None for loc in slot]
+                 for slot in self._layout]
+        return contact_count, scan_time, slots
+
+
 class ReportDescriptor(object):
     """
     Represents a fully parsed HID report descriptor.
@@ -1250,6 +1645,19 @@ class ReportDescriptor(object):
     .. attribute:: feature_reports
 
         All :class:`HidReport` of type ``Feature``, addressable by the report ID
+
+    .. attribute:: reports
+
+        The ``Input``, ``Output`` and ``Feature`` reports, addressable by the
+        report type name, i.e. ``reports['Feature']`` is
+        :attr:`feature_reports`
+
+    .. attribute:: collections
+
+        All :class:`HidCollection` in the order they appear in the report
+        descriptor, addressable by :attr:`HidCollection.index`. The
+        top-level collections are those without a
+        :attr:`HidCollection.parent`.
     """
     class _Globals(object):
         """
@@ -1294,12 +1702,23 @@ class ReportDescriptor(object):
         self.input_reports = {}
         self.feature_reports = {}
         self.output_reports = {}
+        self.reports = {
+            'Input': self.input_reports,
+            'Output': self.output_reports,
+            'Feature': self.feature_reports,
+        }
         self.win8 = False
         self.rdesc_items = items
+        self.collections = []
+        self._collections_by_usage = {}
+        self._reports_by_application = {}
+        self._fields_by_usage = {}
+        self._fields_by_usage_name = None
 
         # variables only used during parsing
         self.global_stack = []
         self.collection = [0, 0, 0]  # application, physical, logical
+        self.collection_stack = []
         self.local = ReportDescriptor._Locals()
         self.glob = ReportDescriptor._Globals()
         self.current_report = {}
@@ -1318,16 +1737,24 @@ class ReportDescriptor(object):
         del self.local
         del self.current_report
         del self.collection
+        del self.collection_stack
 
-    def get(self, reportID, reportSize):
+    def get(self, reportID, reportSize, type='Input'):
         """
-        Return the input report with the given Report ID or ``None``
+        Return the report with the given Report ID or ``None``
+
+        :param int reportID: the Report ID, usually the first byte of the
+            report
+        :param int reportSize: the size of the report in bytes
+        :param str type: the report type, one of ``Input``, ``Output``,
+            ``Feature``
         """
+        reports = self.reports[type]
         try:
-            report = self.input_reports[reportID]
+            report = reports[reportID]
         except KeyError:
             try:
-                report = self.input_reports[-1]
+                report = reports[-1]
             except KeyError:
                 return None
 
@@ -1340,18 +1767,48 @@ class ReportDescriptor(object):
     def get_report_from_application(self, application):
         """
         Return the Input report that matches the application or ``None``
+
+        :param application: the 32-bit application usage or its name, e.g.
+            "Touch Screen"
         """
-        for r in self.input_reports.values():
-            if r.application == application or r.application_name == application:
-                return r
-        return None
+        return self._reports_by_application.get(application)
+
+    def find_fields(self, usage):
+        """
+        Return the location of every field with the given usage, e.g. to
+        check whether a device has a ``Resolution Multiplier``. ::
+
+            for type, report_ID, offset, size, index in rdesc.find_fields('Wheel'):
+                ...
+
+        :param usage: the 32-bit usage or its name, e.g. "Contact Count"
+        :returns: a list of ``(report type, report ID, bit offset, size,
+            index)`` tuples, where report type is one of ``Input``,
+            ``Output``, ``Feature``, the size is in bits and index is the
+            index of the :class:`HidField` in :attr:`HidReport.fields`. For
+            array fields, the bit offset is that of the first element.
+        """
+        if isinstance(usage, str):
+            if self._fields_by_usage_name is None:
+                self._fields_by_usage_name = {}
+                for u, locations in self._fields_by_usage.items():
+                    name = str(HidField._usage_name(u))
+                    self._fields_by_usage_name.setdefault(name, []).extend(locations)
+            return self._fields_by_usage_name.get(usage, [])
+
+        return self._fields_by_usage.get(usage, [])
+
+    def get_collections(self, usage):
+        """
+        Return the list of :class:`HidCollection` with the given usage,
+        e.g. all ``Finger`` collections of a touchscreen.
+
+        :param usage: the 32-bit usage or its name, e.g. "Finger"
+        """
+        return self._collections_by_usage.get(usage, [])
 
     def _get_current_report(self, type):
-        report_lists = {
-            'Input': self.input_reports,
-            'Output': self.output_reports,
-            'Feature': self.feature_reports,
-        }
+        report_lists = self.reports
 
         try:
             cur = self.current_report[type]
@@ -1367,6 +1824,9 @@ class ReportDescriptor(object):
             except KeyError:
                 cur = HidReport(self.local.report_ID, self.glob.application)
                 report_lists[type][self.local.report_ID] = cur
+                if type == 'Input':
+                    self._reports_by_application.setdefault(cur.application, cur)
+                    self._reports_by_application.setdefault(cur.application_name, cur)
         return cur
 
     def _concatenate_usages(self):
@@ -1411,6 +1871,16 @@ class ReportDescriptor(object):
                     self.glob.logical = self.local.usages[-1]
             except IndexError:
                 pass
+
+            usage = self.local.usages[-1] if self.local.usages else None
+            parent = self.collection_stack[-1] if self.collection_stack else None
+            node = HidCollection(len(self.collections), c, usage, parent)
+            self.collections.append(node)
+            self.collection_stack.append(node)
+            if usage is not None:
+                self._collections_by_usage.setdefault(usage, []).append(node)
+                self._collections_by_usage.setdefault(str(node.usage_name), []).append(node)
+
             # reset the usage list
             self.local.usages = []
             self.local.usage_sizes = []
@@ -1418,6 +1888,9 @@ class ReportDescriptor(object):
             self.local.usage_min_size = 0
             self.local.usage_max = 0
             self.local.usage_max_size = 0
+        elif item == "End Collection":
+            if self.collection_stack:
+                self.collection_stack.pop()
         elif item == "Usage Minimum":
             self.local.usage_min = value
             self.local.usage_min_size = size
@@ -1454,7 +1927,19 @@ class ReportDescriptor(object):
                                                self.glob.logical_max,
                                                self.glob.item_size,
                                                self.glob.count)
+            first_index = len(self.current_input_report.fields)
             self.current_input_report.extend(inputItems)
+            for idx, f in enumerate(inputItems, start=first_index):
+                if f.is_const:
+                    continue
+                location = (item, self.local.report_ID, f.start, f.size, idx)
+                for u in f.usages if f.is_array else [f.usage]:
+                    self._fields_by_usage.setdefault(u, []).append(location)
+            if self.collection_stack:
+                node = self.collection_stack[-1]
+                node.fields.extend(inputItems)
+                for f in inputItems:
+                    f.collection_node = node
             if item == "Feature" and len(self.local.usages) > 0 and \
                     self.local.usages[-1] == 0xff0000c5:
                 self.win8 = True
@@ -1522,6 +2007,17 @@ class ReportDescriptor(object):
 
         return ReportDescriptor(items)
 
+    @classmethod
+    def from_bytes_cached(cls, rdesc):
+        """
+        Like :meth:`from_bytes` but returns the same object for identical
+        report descriptors, so a descriptor shared by many devices is only
+        parsed once. The returned object must not be modified.
+
+        :param bytes rdesc: the bytes of this report descriptor
+        """
+        return _parse_cached(bytes(rdesc))
+
     @classmethod
     def from_string(cls, rdesc):
         """
@@ -1575,7 +2071,7 @@ class ReportDescriptor(object):
 
         return ReportDescriptor(items)
 
-    def create_report(self, data, global_data=None, reportID=None, application=None):
+    def create_report(self, data, global_data=None, reportID=None, application=None, type='Input'):
         """
         Convert the data object to an array of ints representing the report.
         Each property of the given data object is matched against the field
@@ -1594,6 +2090,10 @@ class ReportDescriptor(object):
 
         The UHIDDevice will create the report according to the device's
         report descriptor.
+
+        The report is looked up by ``application`` (``Input`` reports only)
+        or by ``reportID`` in the reports of the given ``type``, one of
+        ``Input``, ``Output``, ``Feature``.
         """
         # make sure the data is iterable
         try:
@@ -1608,11 +2108,30 @@ class ReportDescriptor(object):
         else:
             if reportID is None:
                 reportID = -1
-            rdesc = self.input_reports[reportID]
+            rdesc = self.reports[type][reportID]
 
         return rdesc.create_report(data, global_data)
 
-    def format_report(self, data, split_lines=True):
+    def get_values(self, data, type='Input'):
+        """
+        Extract the values of all fields from the report provided as a list
+        of 8-bit integers or bytes-like object. The report is looked up by
+        its Report ID in the reports of the given ``type``, see
+        :meth:`HidReport.get_values` for the returned values.
+
+        :param data: the bytes that are this report
+        :param str type: the report type, one of ``Input``, ``Output``,
+            ``Feature``
+        :returns: a tuple of ``(HidReport, values)`` or ``None`` if no
+            report matches
+        """
+        report = self.get(data[0], len(data), type)
+        if report is None:
+            return None
+
+        return report, report.get_values(data)
+
+    def format_report(self, data, split_lines=True, type='Input'):
         """
         Format the HID Report provided as a list of 8-bit integers into a
         human-readable format.
@@ -1621,9 +2140,16 @@ class ReportDescriptor(object):
         :param boolean split_lines: ``True`` if the format can be split
             across multiple lines. This makes for easier reading but harder
             automated processing.
+        :param str type: the report type, one of ``Input``, ``Output``,
+            ``Feature``
         """
-        report = self.get(data[0], len(data))
+        report = self.get(data[0], len(data), type)
         if report is None:
             return None
 
         return report.format_report(data, split_lines)
+
+
+@functools.lru_cache(maxsize=64)
+def _parse_cached(rdesc):
+    return ReportDescriptor.from_bytes(rdesc)
@@ -18,13 +18,14 @@
 #
 
 import array
-import datetime
+import asyncio
 import fcntl
-import io
 import os
 import struct
 import sys
+import time
 from hidtools.hid import ReportDescriptor
+from hidtools.recording import write_text_header, write_text_event
 
 
 def _ioctl(fd, EVIOC, code, return_type, buf=None):
@@ -126,8 +127,15 @@ def _HIDIOCGRAWNAME(fd):
 
 class HidrawEvent(object):
     """
-    A single event from a hidraw device. The first event always has a timestamp of 0.0,
-    all other events are offset accordingly.
+    A single event from a hidraw device.
+
+    .. attribute:: timestamp
+
+        Timestamp in nanoseconds as integer, taken from
+        :func:`time.monotonic_ns` and relative to the device's
+        :attr:`HidrawDevice.time_offset`. With the default offset the first
+        event has a timestamp of 0, a recorder that sets the offset when it
+        starts gives all events a timestamp relative to that start instead.
 
     .. attribute:: sec
 
@@ -137,14 +145,347 @@ class HidrawEvent(object):
 
         Timestamp microseconds
 
+    .. attribute:: nsec
+
+        Timestamp nanoseconds, i.e. the sub-second part of :attr:`timestamp`
+
     .. attribute:: bytes
 
-        The data bytes read for this event
+        The data bytes read for this event, a :class:`bytes` object
     """
-    def __init__(self, sec, usec, bytes):
-        self.sec, self.usec = sec, usec
+    __slots__ = ('timestamp', 'bytes')
+
+    def __init__(self, timestamp, bytes):
+        self.timestamp = timestamp
         self.bytes = bytes
 
+    @property
+    def sec(self):
+        return self.timestamp // 1000000000
+
+    @property
+    def nsec(self):
+        return self.timestamp % 1000000000
+
+    @property
+    def usec(self):
+        return self.nsec // 1000
+
+
+class HidrawEventStore(object):
+    """
+    A compact sequence of events. The timestamps are kept in an
+    ``array('q')`` and all payloads are concatenated into a single
+    :class:`bytearray`, so storing an event does not allocate any Python
+    object.
+
+    Indexing returns a :class:`HidrawEvent` created on demand, slicing
+    returns a list of :class:`HidrawEvent`. ::
+
+        store = HidrawEventStore()
+        store.append(1000, b'\\x01\\x02')
+        print(store[-1].bytes)
+
+    By default the store grows forever. If ``capacity`` or ``max_age`` is
+    given, the store is a ring buffer and the oldest events are dropped
+    once more than ``capacity`` events are stored or once they are older
+    than ``max_age`` seconds compared to the newest event.
+
+    Indices are absolute: the first event appended is always index 0, even
+    after it was dropped. ``len()`` is the number of events appended so
+    far, :attr:`first` is the index of the oldest event still available.
+    Iterating only returns the events still available.
+
+    :param int capacity: the maximum number of events to keep
+    :param float max_age: the maximum age of an event in seconds
+
+    .. attribute:: capacity
+
+        The maximum number of events kept or ``None``
+
+    .. attribute:: max_age
+
+        The maximum age of events kept in nanoseconds or ``None``
+
+    .. attribute:: dropped
+
+        The number of events dropped before they were released, see
+        :meth:`release`
+    """
+    def __init__(self, capacity=None, max_age=None):
+        if capacity is not None and capacity < 1:
+            raise ValueError('capacity must be at least 1')
+
+        self.capacity = capacity
+        self.max_age = int(max_age * 1000000000) if max_age is not None else None
+        self.dropped = 0
+        self._timestamps = array.array('q')
+        # offsets[i] is where event i starts in the payload, the last
+        # element is the end of the last event
+        self._offsets = array.array('Q', [0])
+        self._payload = bytearray()
+        # absolute index of self._timestamps[0]
+        self._base = 0
+        # index into self._timestamps of the oldest event still available
+        self._head = 0
+        # absolute index up to which events have been released
+        self._released = 0
+
+    def __len__(self):
+        return self._base + len(self._timestamps)
+
+    @property
+    def first(self):
+        """
+        The absolute index of the oldest event still available
+        """
+        return self._base + self._head
+
+    def __iter__(self):
+        for i in range(self._head, len(self._timestamps)):
+            yield self._event(i)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            first = self.first
+            return [self._event(i - self._base) for i in range(*key.indices(len(self)))
+                    if i >= first]
+
+        if key < 0:
+            key += len(self)
+        if not self.first <= key < len(self):
+            raise IndexError('event index out of range')
+        return self._event(key - self._base)
+
+    def _event(self, idx):
+        start, end = self._offsets[idx], self._offsets[idx + 1]
+        return HidrawEvent(self._timestamps[idx], bytes(self._payload[start:end]))
+
+    def append(self, timestamp, data):
+        """
+        Append an event to the store, dropping the oldest events if the
+        store is a ring buffer.
+
+        :param int timestamp: the event timestamp in nanoseconds
+        :param data: a bytes-like object with the event's data
+        """
+        self._payload += data
+        self._timestamps.append(timestamp)
+        self._offsets.append(len(self._payload))
+
+        if self.capacity is not None:
+            excess = len(self._timestamps) - self._head - self.capacity
+            if excess > 0:
+                self._drop(excess)
+
+        if self.max_age is not None:
+            oldest = timestamp - self.max_age
+            timestamps = self._timestamps
+            idx = self._head
+            while timestamps[idx] < oldest:
+                idx += 1
+            if idx > self._head:
+                self._drop(idx - self._head)
+
+    def release(self, index):
+        """
+        Mark all events before the absolute ``index`` as processed, e.g.
+        because they were written to a file. Released events that are
+        dropped later are not counted in :attr:`dropped`.
+        """
+        self._released = max(self._released, index)
+
+    def _drop(self, count):
+        first = self.first
+        self.dropped += max(0, min(first + count, len(self)) - max(first, self._released))
+        self._head += count
+
+        # Removing from the front of the arrays is expensive, so only
+        # compact once more than half of the storage is unused.
+        if self._head * 2 > len(self._timestamps):
+            head = self._head
+            base_offset = self._offsets[head]
+            del self._timestamps[:head]
+            self._offsets = array.array('Q', (o - base_offset for o in self._offsets[head:]))
+            del self._payload[:base_offset]
+            self._base += head
+            self._head = 0
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used by the event timestamps and payloads
+        """
+        return (len(self._payload) +
+                self._timestamps.itemsize * len(self._timestamps) +
+                self._offsets.itemsize * len(self._offsets))
+
+
+class ReportFilter(object):
+    """
+    Selects the events a :class:`HidrawDevice` stores, by report ID,
+    report size or a predicate on the :class:`hidtools.hid.HidReport`. ::
+
+        # drop the vendor-defined reports of a composite device
+        dev.report_filter = ReportFilter(predicate=lambda r: not ReportFilter.is_vendor_report(r))
+
+    The filter is compiled once per device into a table indexed by the
+    first byte of the event, checking an event is a table lookup.
+
+    An event is kept if all of the given conditions are true. The report
+    IDs are compared to the first byte of the event, they cannot be used
+    for devices without numbered reports. Reports not declared in the
+    report descriptor are not passed to the predicate.
+
+    :param report_ids: if not ``None``, only keep the reports with these
+        report IDs
+    :param exclude_report_ids: drop the reports with these report IDs
+    :param sizes: if not ``None``, only keep the events with one of these
+        sizes in bytes
+    :param predicate: if not ``None``, a callable taking an ``Input``
+        :class:`hidtools.hid.HidReport` that returns ``False`` for the
+        reports to drop
+    """
+    def __init__(self, report_ids=None, exclude_report_ids=(), sizes=None, predicate=None):
+        self.report_ids = frozenset(report_ids) if report_ids is not None else None
+        self.exclude_report_ids = frozenset(exclude_report_ids)
+        self.sizes = frozenset(sizes) if sizes is not None else None
+        self.predicate = predicate
+
+    @staticmethod
+    def is_vendor_report(report):
+        """
+        :returns: ``True`` if the report belongs to a vendor-defined
+            application collection, i.e. one on a usage page of ``0xff00``
+            or above
+        """
+        return report.application is not None and (report.application >> 16) >= 0xff00
+
+    def compile(self, device):
+        """
+        Compile this filter for the device.
+
+        :param device: a :class:`HidrawDevice`, or ``None`` to compile a
+            filter without a predicate for any device with numbered reports
+        :returns: a tuple of ``(table, sizes)`` where ``table[first_byte]``
+            is nonzero for the events to keep and ``sizes`` is the set of
+            sizes to keep or ``None``
+        :raises ValueError: if this filter has report IDs but the device
+            does not use numbered reports
+        """
+        table = bytearray(b'\x01' * 256)
+        reports = {}
+        if device is not None:
+            reports = device.report_descriptor.input_reports
+        elif self.predicate is not None:
+            raise ValueError('A filter with a predicate needs a device')
+
+        if -1 in reports:
+            # no report IDs, the first byte is data
+            if self.report_ids is not None or self.exclude_report_ids:
+                raise ValueError(f'{device.name} does not use report IDs')
+            if self.predicate is not None and not self.predicate(reports[-1]):
+                table = bytearray(256)
+            return bytes(table), self.sizes
+
+        for report_id in range(256):
+            if self.report_ids is not None and report_id not in self.report_ids:
+                table[report_id] = 0
+            elif report_id in self.exclude_report_ids:
+                table[report_id] = 0
+            elif (self.predicate is not None and report_id in reports and
+                  not self.predicate(reports[report_id])):
+                table[report_id] = 0
+        return bytes(table), self.sizes
+
+
+class HidrawStats(object):
+    """
+    Counters for the events read by a :class:`HidrawDevice`, see
+    :attr:`HidrawDevice.stats`. The counters only ever increase, use
+    :meth:`copy` and subtract to get the values for an interval::
+
+        before = dev.stats.copy()
+        ...
+        rate = (dev.stats.events - before.events) / interval
+
+    .. attribute:: events
+
+        The number of events read, including the filtered ones
+
+    .. attribute:: bytes
+
+        The number of bytes read
+
+    .. attribute:: filtered
+
+        The number of events rejected by the
+        :attr:`HidrawDevice.report_filter`
+
+    .. attribute:: reads
+
+        The number of calls to :meth:`HidrawDevice.read_events` that read
+        at least one event, i.e. the number of batches
+
+    .. attribute:: max_batch
+
+        The largest number of events read in one batch
+
+    .. attribute:: batches
+
+        A histogram of the batch sizes: ``batches[n]`` is the number of
+        batches of ``2**(n-1)`` up to ``2**n - 1`` events
+
+    .. attribute:: overflows
+
+        The number of batches of at least :attr:`KERNEL_QUEUE_SIZE`
+        events. The kernel drops the oldest report once its queue is full,
+        so events may have been lost before such a batch. Only a
+        nonblocking :class:`HidrawDevice` reads more than one event per
+        batch, for a blocking device this counter stays at 0 whether or
+        not the kernel queue overflowed.
+
+    .. attribute:: max_interval
+
+        The longest time between two consecutive events in nanoseconds
+    """
+    #: The number of reports the kernel queues per reader
+    KERNEL_QUEUE_SIZE = 64
+
+    def __init__(self):
+        self.events = 0
+        self.bytes = 0
+        self.filtered = 0
+        self.reads = 0
+        self.max_batch = 0
+        self.batches = [0] * 8
+        self.overflows = 0
+        self.max_interval = 0
+
+    def copy(self):
+        """
+        :returns: a copy of these counters
+        """
+        stats = HidrawStats()
+        stats.__dict__.update(self.__dict__)
+        stats.batches = list(self.batches)
+        return stats
+
+    def _add_batch(self, count, nbytes, max_interval):
+        self.events += count
+        self.bytes += nbytes
+        self.reads += 1
+        if count > self.max_batch:
+            self.max_batch = count
+        bucket = count.bit_length()
+        if bucket >= len(self.batches):
+            self.batches.extend([0] * (bucket + 1 - len(self.batches)))
+        self.batches[bucket] += 1
+        if count >= self.KERNEL_QUEUE_SIZE:
+            self.overflows += 1
+        if max_interval > self.max_interval:
+            self.max_interval = max_interval
+
 
 class HidrawDevice(object):
     """
@@ -158,6 +499,18 @@ class HidrawDevice(object):
                 print(f'We received {len(dev.events)} events so far')
 
     :param File device: a file-like object pointing to ``/dev/hidrawX``
+    :param int capacity: if not ``None``, keep at most this many events in
+        :attr:`events`. If both ``capacity`` and ``max_age`` are ``None``,
+        :attr:`events` keeps every event read, even after :meth:`dump` or
+        :meth:`consume_events` returned it, so long-running readers should
+        set one of them to bound the memory use.
+    :param float max_age: if not ``None``, only keep the events of the last
+        ``max_age`` seconds in :attr:`events`
+    :param bool nonblocking: if True, switch the file descriptor to
+        nonblocking mode so that :meth:`read_events` reads all pending
+        events in one call
+    :param ReportFilter report_filter: if not ``None``, only store the
+        events accepted by this filter, see :attr:`report_filter`
 
     .. attribute:: name
 
@@ -176,22 +529,37 @@ class HidrawDevice(object):
 
         16-bit numerical product ID
 
+    .. attribute:: rdesc
+
+        The report descriptor as :class:`bytes`
+
     .. attribute:: report_descriptor
 
-        The :class:`hidtools.hid.ReportDescriptor` for this device
+        The :class:`hidtools.hid.ReportDescriptor` for this device, parsed
+        on first access. Devices with identical report descriptors share
+        the same object.
 
     .. attribute:: events
 
-        All events accumulated so far, a list of :class:`HidrawEvent`
+        All events accumulated so far, a :class:`HidrawEventStore` that
+        returns :class:`HidrawEvent` objects when indexed
+
+    .. attribute:: stats
+
+        The :class:`HidrawStats` for the events read so far
 
-    ... attribute:: time_offset
+    .. attribute:: time_offset
 
-        The offset to be used for recording events. By default the offset is
-        the timestamp of the first event. When recording multiple devices,
-        the time_offset from the first device to receive an event should be
-        copied to the other device to ensure all recordings are in sync.
+        The offset subtracted from the :func:`time.monotonic_ns` time of
+        each event to get its timestamp. If ``None`` when the first event
+        is read, it is set to the time of that event. When recording
+        multiple devices, set the same offset on all devices before
+        reading to keep their timestamps in sync, as
+        :class:`hidtools.cli.record.Recorder` does. The recorder also
+        stores the wall-clock time of this offset as the capture origin
+        of its recordings, see :mod:`hidtools.recording`.
     """
-    def __init__(self, device):
+    def __init__(self, device, capacity=None, max_age=None, nonblocking=False, report_filter=None):
         fd = device.fileno()
         self.device = device
         self.name = _HIDIOCGRAWNAME(fd)
@@ -202,77 +570,216 @@ class HidrawDevice(object):
         rsize, desc = _HIDIOCGRDESC(fd, size)
         assert rsize == size
         assert len(desc) == rsize
-        self.report_descriptor = ReportDescriptor.from_bytes([x for x in desc])
+        self.rdesc = bytes(desc)
+        self._report_descriptor = None
 
-        self.events = []
+        self.events = HidrawEventStore(capacity, max_age)
+
+        # hidraw never returns more than one report per read(), so a
+        # single reusable buffer is enough
+        self._read_buffer = bytearray(4096)
+        self._read_view = memoryview(self._read_buffer)
+
+        self._nonblocking = nonblocking
+        if nonblocking:
+            os.set_blocking(fd, False)
 
         self._dump_offset = -1
+        self._dump_dropped = 0
         self.time_offset = None
+        self.stats = HidrawStats()
+        self._last_read = None
+        self._eof = False
+        self._filter_table = None
+        self._filter_sizes = None
+        self._report_filter = None
+        self.report_filter = report_filter
 
     def __repr__(self):
         return f'{self.name} bus: {self.bustype:02x} vendor: {self.vendor_id:04x} product: {self.product_id:04x}'
 
-    def read_events(self):
+    @property
+    def report_descriptor(self):
+        if self._report_descriptor is None:
+            self._report_descriptor = ReportDescriptor.from_bytes_cached(self.rdesc)
+        return self._report_descriptor
+
+    @property
+    def report_filter(self):
+        """
+        The :class:`ReportFilter` applied to the events as they are read
+        or ``None``. Events rejected by the filter are not stored in
+        :attr:`events`, they are only counted in
+        :attr:`HidrawStats.filtered`. Setting the filter compiles it for
+        this device's report descriptor and raises a :class:`ValueError`
+        if it does not apply to this device, see :meth:`ReportFilter.compile`.
+        """
+        return self._report_filter
+
+    @report_filter.setter
+    def report_filter(self, report_filter):
+        if report_filter is None:
+            self._filter_table, self._filter_sizes = None, None
+        else:
+            self._filter_table, self._filter_sizes = report_filter.compile(self)
+        self._report_filter = report_filter
+
+    def read_events(self, max_batch=None):
         """
         Read events from the device and store them in the device.
 
-        This function simply calls :func:`os.read`, it is the caller's task to
-        either make sure the device is set nonblocking or to handle any
-        :class:`KeyboardInterrupt` if this call does end up blocking.
+        This function simply calls :func:`os.readv` into a preallocated
+        buffer, it is the caller's task to either make sure the device is set
+        nonblocking or to handle any :class:`KeyboardInterrupt` if this call
+        does end up blocking.
+
+        ``hidraw`` returns one report per read. If the device was created
+        with ``nonblocking=True``, this function keeps reading until no more
+        reports are pending (or ``max_batch`` reports were read), otherwise
+        it returns after the first report.
 
+        :param int max_batch: the maximum number of events to read in
+            nonblocking mode, ``None`` for no limit
         :returns: a tuple of ``(index, count)`` of the :attr:`events` added.
         """
 
-        index = max(0, len(self.events) - 1)
-
-        loop = True
-        while loop:
-            data = os.read(self.device.fileno(), 4096)
-            if not data:
+        index = len(self.events)
+
+        fd = self.device.fileno()
+        buffers = [self._read_buffer]
+        view = self._read_view
+        bufsize = len(self._read_buffer)
+        drain = self._nonblocking
+        table, sizes = self._filter_table, self._filter_sizes
+        batch = 0
+        nbytes = 0
+        filtered = 0
+        last = self._last_read
+        max_interval = 0
+
+        while True:
+            try:
+                size = os.readv(fd, buffers)
+            except BlockingIOError:
+                break
+            if not size:
+                self._eof = True
                 break
-            if len(data) < 4096:
-                loop = False
 
-            now = datetime.datetime.now()
-            if self.time_offset is None:
-                self.time_offset = now
-            tdelta = now - self.time_offset
-            bytes = struct.unpack('B' * len(data), data)
+            now = time.monotonic_ns()
+            if last is not None and now - last > max_interval:
+                max_interval = now - last
+            last = now
+            batch += 1
+            nbytes += size
 
-            self.events.append(HidrawEvent(tdelta.seconds, tdelta.microseconds, bytes))
+            if table is not None and not (table[view[0]] and (sizes is None or size in sizes)):
+                filtered += 1
+            else:
+                if self.time_offset is None:
+                    self.time_offset = now
+                self.events.append(now - self.time_offset, view[:size])
+
+            if not drain:
+                if size < bufsize:
+                    break
+            elif max_batch is not None and batch >= max_batch:
+                break
 
         count = len(self.events) - index
+        if batch:
+            self._last_read = last
+            self.stats._add_batch(batch, nbytes, max_interval)
+            self.stats.filtered += filtered
 
         return index, count
 
-    def _dump_event(self, event, file):
-        report_id = event.bytes[0]
-
-        rdesc = self.report_descriptor.get(report_id, len(event.bytes))
-        if rdesc is not None:
-            indent_2nd_line = 2
-            output = rdesc.format_report(event.bytes)
+    async def aiter_events(self, decode=False):
+        """
+        Asynchronously iterate over the events read from the device. The
+        device's file descriptor is switched to nonblocking mode and
+        registered with the running :mod:`asyncio` event loop until the
+        iteration ends. ::
+
+            async for event in dev.aiter_events():
+                print(event.timestamp, event.bytes.hex())
+
+        The iteration ends when the device reaches the end of file and
+        raises the :class:`OSError` if reading fails, e.g. because the
+        device was unplugged. The file descriptor is restored and
+        unregistered once the generator is closed. When leaving the loop
+        early, close it explicitly with ``await gen.aclose()`` to do so
+        immediately.
+
+        Events are still stored in :attr:`events`, create the device with a
+        ``capacity`` to bound its memory use. Only events read after the
+        iteration started are returned, events that were dropped from
+        :attr:`events` before they were returned are skipped.
+
+        :param bool decode: if True, yield tuples of ``(event, values)``
+            where ``values`` is the result of
+            :meth:`hidtools.hid.ReportDescriptor.get_values` for the event
+        :returns: an asynchronous generator of :class:`HidrawEvent`
+        """
+        loop = asyncio.get_running_loop()
+        fd = self.device.fileno()
+        was_blocking = os.get_blocking(fd)
+        ready = asyncio.Event()
+        error = None
+
+        def readable():
+            nonlocal error
             try:
-                first_row = output.split('\n')[0]
-            except IndexError:
-                pass
-            else:
-                # we have a multi-line output, find where the fields are split
-                try:
-                    slash = first_row.index('/')
-                except ValueError:
-                    pass
-                else:
-                    # the `+1` below is to make a better visual effect
-                    indent_2nd_line = slash + 1
-            indent = f'\n#{" " * indent_2nd_line}'
-            output = indent.join(output.split('\n'))
-            print(f'# {output}')
-
-        data = map(lambda x: f'{x:02x}', event.bytes)
-        print(f'E: {event.sec:06d}.{event.usec:06d} {len(event.bytes)} {" ".join(data)}', file=file, flush=True)
-
-    def dump(self, file=sys.stdout, from_the_beginning=False):
+                self.read_events()
+            except OSError as e:
+                # e.g. the device was unplugged, stop listening and let the
+                # iterator raise the error
+                error = e
+                loop.remove_reader(fd)
+            if self._eof:
+                loop.remove_reader(fd)
+            ready.set()
+
+        nonblocking = self._nonblocking
+        os.set_blocking(fd, False)
+        self._nonblocking = True
+        loop.add_reader(fd, readable)
+        index = len(self.events)
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                end = len(self.events)
+                events = self.events[index:end]
+                index = end
+                for e in events:
+                    if decode:
+                        yield e, self.report_descriptor.get_values(e.bytes)
+                    else:
+                        yield e
+                if error is not None:
+                    raise error
+                if self._eof:
+                    return
+        finally:
+            loop.remove_reader(fd)
+            os.set_blocking(fd, was_blocking)
+            self._nonblocking = nonblocking
+
+    def consume_events(self):
+        """
+        Return the events that have not been dumped or consumed yet and
+        mark them as such. Use this instead of :meth:`dump` to write the
+        events in a different format.
+
+        :returns: a list of :class:`HidrawEvent`
+        """
+        events = self.events[max(self._dump_offset, 0):]
+        self._dump_offset = len(self.events)
+        self.events.release(self._dump_offset)
+        return events
+
+    def dump(self, file=sys.stdout, from_the_beginning=False, flush=True):
         """
         Format this device in a file format in the form of ::
 
@@ -280,36 +787,273 @@ class HidrawDevice(object):
             N: the device name
             I: 3 124 abcd # bustype, vendor, product
             # comments are allowed
-            E: 00001.000002 AB 12 34 56 # sec, usec, length, data
+            E: 000001.000002000 4 12 34 56 78 # sec, nsec, length, data
             ...
 
+        See :mod:`hidtools.recording` for details on the format.
+
         This method is designed to be called repeatedly and only print the
         new events on each call. To repeat the dump from the beginning, set
-        ``from_the_beginning`` to True.
+        ``from_the_beginning`` to True, this prints all events still
+        available in :attr:`events`.
 
-        :param File file: the output file to write to
+        If events were dropped from :attr:`events` before they could be
+        printed, a comment with the number of dropped events is printed.
+
+        :param File file: the output file to write to, either a file-like
+            object or a :class:`RecordingWriter`
         :param bool from_the_beginning: if True, print everything again
              instead of continuing where we left off
+        :param bool flush: if True, flush ``file`` once all events are
+             written. Set this to False when ``file`` is a
+             :class:`RecordingWriter` that decides itself when to flush.
         """
 
         if from_the_beginning:
             self._dump_offset = -1
 
         if self._dump_offset == -1:
-            print(f'# {self.name}', file=file)
-            output = io.StringIO()
-            self.report_descriptor.dump(output)
-            for line in output.getvalue().split('\n'):
-                print(f'# {line}', file=file)
-            output.close()
-
-            rd = " ".join([f'{b:02x}' for b in self.report_descriptor.bytes])
-            sz = len(self.report_descriptor.bytes)
-            print(f'R: {sz} {rd}', file=file)
-            print(f'N: {self.name}', file=file)
-            print(f'I: {self.bustype:x} {self.vendor_id:04x} {self.product_id:04x}', file=file, flush=True)
+            write_text_header(file, self)
             self._dump_offset = 0
 
-        for e in self.events[self._dump_offset:]:
-            self._dump_event(e, file)
-        self._dump_offset = len(self.events)
+        dropped = self.events.dropped - self._dump_dropped
+        if dropped:
+            file.write(f'# {dropped} events dropped\n')
+            self._dump_dropped = self.events.dropped
+
+        for e in self.consume_events():
+            write_text_event(file, self.report_descriptor, e.timestamp, e.bytes)
+
+        if flush:
+            file.flush()
+
+
+class HidrawDeviceInfo(object):
+    """
+    A ``hidraw`` device as described in sysfs, see
+    :func:`enumerate_devices`. Creating this object does not open the
+    device node, the report descriptor is only read when :attr:`rdesc` is
+    accessed.
+
+    .. attribute:: path
+
+        The device node, e.g. ``/dev/hidraw0``
+
+    .. attribute:: sysfs_path
+
+        The sysfs directory of the device, e.g. ``/sys/class/hidraw/hidraw0``
+
+    .. attribute:: name
+
+        The device name
+
+    .. attribute:: bustype
+
+        The numerical bus type, see :attr:`HidrawDevice.bustype`
+
+    .. attribute:: vendor_id
+
+        16-bit numerical vendor ID
+
+    .. attribute:: product_id
+
+        16-bit numerical product ID
+
+    .. attribute:: phys
+
+        The physical path of the device, may be empty
+    """
+    def __init__(self, path, sysfs_path, name, bustype, vendor_id, product_id, phys=''):
+        self.path = path
+        self.sysfs_path = sysfs_path
+        self.name = name
+        self.bustype = bustype
+        self.vendor_id = vendor_id
+        self.product_id = product_id
+        self.phys = phys
+
+    def __repr__(self):
+        return f'{self.name} bus: {self.bustype:02x} vendor: {self.vendor_id:04x} product: {self.product_id:04x}'
+
+    @property
+    def rdesc(self):
+        """
+        The report descriptor as :class:`bytes`, read from sysfs
+        """
+        with open(os.path.join(self.sysfs_path, 'device', 'report_descriptor'), 'rb') as fd:
+            return fd.read()
+
+    @classmethod
+    def from_sysfs(cls, sysfs_path, dev='/dev'):
+        """
+        Create the device info from the ``uevent`` file in ``sysfs_path``.
+
+        :param str sysfs_path: the sysfs directory of the hidraw node, e.g.
+            ``/sys/class/hidraw/hidraw0``
+        :param str dev: the directory holding the device nodes
+        :returns: a :class:`HidrawDeviceInfo` or ``None`` if the ``uevent``
+            file does not describe a HID device
+        """
+        properties = {}
+        with open(os.path.join(sysfs_path, 'device', 'uevent')) as fd:
+            for line in fd:
+                key, _, value = line.rstrip('\n').partition('=')
+                properties[key] = value
+
+        try:
+            # HID_ID=0003:0000046D:0000C52B
+            bustype, vendor_id, product_id = (int(v, 16) for v in properties['HID_ID'].split(':'))
+        except (KeyError, ValueError):
+            return None
+
+        node = os.path.basename(os.path.normpath(sysfs_path))
+        return cls(os.path.join(dev, node), sysfs_path,
+                   properties.get('HID_NAME', ''),
+                   bustype, vendor_id & 0xFFFF, product_id & 0xFFFF,
+                   properties.get('HID_PHYS', ''))
+
+
+def enumerate_devices(sysfs='/sys/class/hidraw', dev='/dev'):
+    """
+    List the ``hidraw`` devices on this machine from sysfs, without opening
+    the device nodes. ::
+
+        for info in enumerate_devices():
+            print(info.path, info.name)
+
+        with open(info.path, 'rb') as fd:
+            device = HidrawDevice(fd)
+
+    :param str sysfs: the sysfs class directory for ``hidraw``
+    :param str dev: the directory holding the device nodes
+    :returns: a list of :class:`HidrawDeviceInfo`, sorted by device number
+    """
+    try:
+        nodes = os.listdir(sysfs)
+    except FileNotFoundError:
+        return []
+
+    def number(node):
+        try:
+            return int(node[len('hidraw'):])
+        except ValueError:
+            return -1
+
+    devices = []
+    for node in sorted(nodes, key=number):
+        if not node.startswith('hidraw'):
+            continue
+        try:
+            info = HidrawDeviceInfo.from_sysfs(os.path.join(sysfs, node), dev)
+        except OSError:
+            # the device disappeared while we were looking
+            continue
+        if info is not None:
+            devices.append(info)
+    return devices
+
+
+class RecordingWriter(object):
+    """
+    A write buffer for recordings. Text (or bytes, for binary recordings)
+    written is kept in memory and only written to the underlying file once
+    more than ``max_size`` characters are pending or once the oldest
+    pending text is older than ``max_delay`` seconds. ::
+
+        with RecordingWriter(sys.stdout) as writer:
+            while True:
+                poll.poll(writer.timeout())
+                ...
+                device.dump(writer, flush=False)
+                writer.flush_if_due()
+
+    Since the delay is only checked on :meth:`write` and
+    :meth:`flush_if_due`, callers that block should wait at most
+    :meth:`timeout` milliseconds.
+
+    :param File file: the file to write to
+    :param int max_size: flush once this many characters are pending
+    :param float max_delay: flush once the pending text is this many
+        seconds old
+
+    .. attribute:: written
+
+        The number of characters (or bytes) written to the file so far
+
+    .. attribute:: write_time
+
+        The time spent writing to and flushing the file in nanoseconds
+    """
+    def __init__(self, file, max_size=65536, max_delay=1.0):
+        self.file = file
+        self.max_size = max_size
+        self.max_delay = int(max_delay * 1000000000)
+        self._pending = []
+        self._pending_size = 0
+        self._deadline = None
+        self.written = 0
+        self.write_time = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def write(self, text):
+        """
+        Append ``text`` to the buffer, flushing if a threshold is reached.
+        """
+        if self._deadline is None:
+            self._deadline = time.monotonic_ns() + self.max_delay
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= self.max_size or time.monotonic_ns() >= self._deadline:
+            self.flush()
+
+    @property
+    def size(self):
+        """
+        The number of characters (or bytes) written so far, including the
+        pending ones
+        """
+        return self.written + self._pending_size
+
+    def timeout(self):
+        """
+        :returns: the time in milliseconds until the pending text must be
+            flushed or ``None`` if nothing is pending, suitable for
+            :meth:`select.poll.poll`
+        """
+        if self._deadline is None:
+            return None
+        return max(0, (self._deadline - time.monotonic_ns()) // 1000000)
+
+    def flush_if_due(self):
+        """
+        Flush the buffer if the oldest pending text is older than
+        ``max_delay``.
+        """
+        if self._deadline is not None and time.monotonic_ns() >= self._deadline:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all pending text to the file and flush the file.
+        """
+        start = time.perf_counter_ns()
+        if self._pending:
+            pending = self._pending
+            self.file.write(pending[0][:0].join(pending))
+            self.written += self._pending_size
+            self._pending = []
+            self._pending_size = 0
+        self._deadline = None
+        self.file.flush()
+        self.write_time += time.perf_counter_ns() - start
+
+    def close(self):
+        """
+        Flush all pending text. This does not close the underlying file.
+        """
+        self.flush()
@@ -0,0 +1,1233 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Reading and writing of HID recordings.
+
+Two formats are supported. The text format is the one written by
+``hid-recorder``::
+
+    T: 1571212345.678901234         # capture origin, optional
+    D: 0                            # device index, multiple devices only
+    R: 4 05 01 09 02 ...            # report descriptor length and bytes
+    N: the device name
+    P: the physical path            # optional
+    I: 3 046d c52b                  # bustype, vendor, product
+    E: 000001.000002000 3 01 02 03  # sec.nsec, length, data
+
+Lines starting with ``#`` are comments. Older recordings use a
+microsecond timestamp, i.e. only six digits after the dot.
+
+The event timestamps are relative to the capture origin, the wall-clock
+time (``CLOCK_REALTIME``) the recording started at. The origin is what
+allows recordings of different devices or machines to be merged on a
+common time base, see :func:`merge_recordings`. Older recordings do not
+have one.
+
+The binary format holds the same information. All integers are
+little-endian. It starts with a file header, followed by one device
+header per device, followed by the events::
+
+    file header:    4s magic (b'HIDR'), u16 version, u16 device count,
+                    s64 capture origin in ns since the epoch, 0 if
+                    unknown (version 2 only)
+    device header:  u32 bustype, u16 vendor, u16 product,
+                    u16 name length, u16 phys length, u16 rdesc length,
+                    followed by the UTF-8 name, the UTF-8 phys and the
+                    report descriptor bytes
+    event:          s64 timestamp in ns, u16 device index, u16 length,
+                    followed by length bytes of data
+
+Every record has a fixed-size header followed by its payload, so a
+binary recording can be walked in place, e.g. in a :class:`mmap.mmap`.
+
+:class:`Recording` is the simplest way to read a recording in either
+format::
+
+    with Recording('rec.hid') as recording:
+        for idx, timestamp, data in recording[5000000000:6000000000]:
+            print(recording.devices[idx].name, timestamp, data.hex())
+
+Either format may be compressed, the compression is chosen by the file
+extension: ``.xz``/``.lzma``, ``.gz``, ``.bz2`` and, if the
+``zstandard`` module is available, ``.zst``. See :func:`open_file`.
+
+An uncompressed recording may have a sidecar index in a file of the same
+name with ``.idx`` appended, see :class:`RecordingIndex`. The index maps
+every n-th event to its byte offset so that readers can seek to a
+timestamp without reading everything before it::
+
+    index header:   4s magic (b'HIDI'), u16 version, u16 reserved,
+                    u32 stride, u64 recording size, u64 entry count
+    entry:          u64 event number, s64 timestamp in ns,
+                    u64 byte offset, u16 device index, 6 bytes padding
+"""
+
+import array
+import bisect
+import bz2
+import contextlib
+import gzip
+import heapq
+import io
+import itertools
+import lzma
+import mmap
+import os
+import struct
+import sys
+from hidtools.hid import ReportDescriptor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'HIDR'
+VERSION = 2
+
+#: File extension used for the binary format
+BINARY_EXTENSION = '.hidb'
+
+_FILE_HEADER = struct.Struct('<4sHH')
+_ORIGIN = struct.Struct('<q')
+_DEVICE_HEADER = struct.Struct('<IHHHHH')
+_EVENT_HEADER = struct.Struct('<qHH')
+
+INDEX_MAGIC = b'HIDI'
+INDEX_VERSION = 1
+
+#: Suffix appended to a recording's file name for its index
+INDEX_EXTENSION = '.idx'
+
+_INDEX_HEADER = struct.Struct('<4sHHIQQ')
+_INDEX_ENTRY = struct.Struct('<QqQH6x')
+
+# the amount of a mapped text recording split into lines at once
+_TEXT_CHUNK_SIZE = 1 << 20
+
+
+def parse_timestamp(timestamp):
+    """
+    Convert a recording timestamp string ``sec.frac`` into an integer in
+    nanoseconds. The fractional part may be given in microseconds (older
+    recordings) or nanoseconds.
+    """
+    sec, frac = timestamp.split('.')
+    if len(frac) > 9:
+        raise ValueError(f'Invalid timestamp {timestamp}')
+    return int(sec) * 1000000000 + int(frac) * 10 ** (9 - len(frac))
+
+
+def parse_text_event(line):
+    """
+    Parse an ``E:`` line of a text recording.
+
+    :returns: a tuple ``(timestamp, data)``
+    """
+    _, timestamp, size, data = line.split(' ', 3)
+    data = bytes.fromhex(data)
+    if len(data) != int(size):
+        raise ValueError(f'Invalid event length in "{line.strip()}"')
+    return parse_timestamp(timestamp), data
+
+
+def _read_binary_event(read):
+    """
+    Read the next event of a binary recording.
+
+    :param read: a function returning the given number of bytes or less
+        at the end of the recording, e.g. :meth:`io.BufferedReader.read`
+    :returns: a tuple ``(device index, timestamp, data)`` or ``None`` at
+        the end of the recording
+    """
+    header = read(_EVENT_HEADER.size)
+    if not header:
+        return None
+    if len(header) != _EVENT_HEADER.size:
+        raise ValueError('Truncated binary recording')
+    timestamp, idx, size = _EVENT_HEADER.unpack(header)
+    data = read(size)
+    if len(data) != size:
+        raise ValueError('Truncated binary recording')
+    return idx, timestamp, data
+
+
+def format_timestamp(timestamp):
+    """
+    Convert an integer timestamp in nanoseconds into the ``sec.nsec``
+    string used in text recordings.
+    """
+    sec, nsec = divmod(timestamp, 1000000000)
+    return f'{sec:06d}.{nsec:09d}'
+
+
+class RecordingDevice(object):
+    """
+    A device as stored in a recording.
+
+    .. attribute:: name
+
+        The device name
+
+    .. attribute:: bustype
+
+        The numerical bus type
+
+    .. attribute:: vendor_id
+
+        16-bit numerical vendor ID
+
+    .. attribute:: product_id
+
+        16-bit numerical product ID
+
+    .. attribute:: phys
+
+        The physical path or ``None``
+
+    .. attribute:: rdesc
+
+        The report descriptor as :class:`bytes`
+    """
+    def __init__(self, name='', bustype=0, vendor_id=0, product_id=0, rdesc=b'', phys=None):
+        self.name = name
+        self.bustype = bustype
+        self.vendor_id = vendor_id
+        self.product_id = product_id
+        self.rdesc = rdesc
+        self.phys = phys
+        self._report_descriptor = None
+
+    @property
+    def report_descriptor(self):
+        """
+        The :class:`hidtools.hid.ReportDescriptor` for this device, parsed
+        on first access
+        """
+        if self._report_descriptor is None:
+            self._report_descriptor = ReportDescriptor.from_bytes_cached(self.rdesc)
+        return self._report_descriptor
+
+    def __repr__(self):
+        return f'{self.name} bus: {self.bustype:02x} vendor: {self.vendor_id:04x} product: {self.product_id:04x}'
+
+
+def write_text_origin(file, origin):
+    """
+    Write the ``T:`` line with the capture origin of a text recording,
+    this must be the first line of the recording.
+
+    :param file: a file-like object opened in text mode
+    :param int origin: the wall-clock time of timestamp 0 in nanoseconds
+        since the epoch, or ``None`` if unknown. Nothing is written if
+        ``None``.
+    """
+    if origin is not None:
+        file.write(f'T: {format_timestamp(origin)}\n')
+
+
+def write_text_header(file, device):
+    """
+    Write the text recording header for the device, i.e. the report
+    descriptor as comment, followed by the ``R:``, ``N:``, ``P:`` and
+    ``I:`` lines.
+
+    :param file: a file-like object opened in text mode
+    :param device: a :class:`RecordingDevice` or
+        :class:`hidtools.hidraw.HidrawDevice`
+    """
+    file.write(f'# {device.name}\n')
+    output = io.StringIO()
+    device.report_descriptor.dump(output)
+    for line in output.getvalue().split('\n'):
+        file.write(f'# {line}\n')
+    output.close()
+
+    rdesc = bytes(device.rdesc)
+    file.write(f'R: {len(rdesc)} {rdesc.hex(" ")}\n')
+    file.write(f'N: {device.name}\n')
+    phys = getattr(device, 'phys', None)
+    if phys:
+        file.write(f'P: {phys}\n')
+    file.write(f'I: {device.bustype:x} {device.vendor_id:04x} {device.product_id:04x}\n')
+
+
+def format_text_annotation(report_descriptor, data):
+    """
+    Decode the report into the comment written before an ``E:`` line in
+    the text recording format.
+
+    :param report_descriptor: the :class:`hidtools.hid.ReportDescriptor`
+        used to decode the report
+    :param bytes data: the report
+    :returns: the comment lines including the trailing newline, or an
+        empty string if the report cannot be decoded
+    """
+    rdesc = report_descriptor.get(data[0], len(data))
+    if rdesc is None:
+        return ''
+
+    indent_2nd_line = 2
+    output = rdesc.format_report(data)
+    try:
+        first_row = output.split('\n')[0]
+    except IndexError:
+        pass
+    else:
+        # we have a multi-line output, find where the fields are split
+        try:
+            slash = first_row.index('/')
+        except ValueError:
+            pass
+        else:
+            # the `+1` below is to make a better visual effect
+            indent_2nd_line = slash + 1
+    indent = f'\n#{" " * indent_2nd_line}'
+    output = indent.join(output.split('\n'))
+    return f'# {output}\n'
+
+
+def write_text_event(file, report_descriptor, timestamp, data):
+    """
+    Write one event in the text recording format, preceded by a comment
+    with the decoded report if ``report_descriptor`` is not ``None``.
+
+    :param file: a file-like object opened in text mode
+    :param report_descriptor: the :class:`hidtools.hid.ReportDescriptor`
+        used to decode the report, or ``None``
+    :param int timestamp: the timestamp in nanoseconds
+    :param bytes data: the report
+    """
+    if report_descriptor is not None:
+        annotation = format_text_annotation(report_descriptor, data)
+        if annotation:
+            file.write(annotation)
+
+    file.write(f'E: {format_timestamp(timestamp)} {len(data)} {data.hex(" ")}\n')
+
+
+class TextRecordingReader(object):
+    """
+    Reader for the text recording format. The device headers are read
+    when the reader is created, the events are read by iterating over
+    :meth:`events`.
+
+    :param file: a file-like object opened in text mode
+
+    .. attribute:: devices
+
+        A dictionary of device index to :class:`RecordingDevice`
+
+    .. attribute:: origin
+
+        The capture origin in nanoseconds since the epoch or ``None`` if
+        the recording does not have one
+    """
+    def __init__(self, file):
+        self.file = file
+        self.devices = {}
+        self.origin = None
+        self._pending = None
+        self._index = 0
+
+        for line in file:
+            if line.startswith('E:'):
+                self._pending = line
+                break
+            self._parse_line(line)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the underlying file
+        """
+        self.file.close()
+
+    def _device(self):
+        try:
+            return self.devices[self._index]
+        except KeyError:
+            device = RecordingDevice()
+            self.devices[self._index] = device
+            return device
+
+    def _parse_line(self, line):
+        tag = line[:2]
+        if tag == 'D:':
+            self._index = int(line[2:])
+        elif tag == 'T:':
+            self.origin = parse_timestamp(line[2:].strip())
+        elif tag == 'R:':
+            length, _, data = line[2:].strip().partition(' ')
+            rdesc = bytes.fromhex(data)
+            if len(rdesc) != int(length):
+                raise ValueError(f'Invalid report descriptor length in "{line.strip()}"')
+            self._device().rdesc = rdesc
+        elif tag == 'N:':
+            self._device().name = line[2:].strip()
+        elif tag == 'P:':
+            self._device().phys = line[2:].strip()
+        elif tag == 'I:':
+            bus, vid, pid = (int(x, 16) for x in line[2:].split())
+            device = self._device()
+            device.bustype, device.vendor_id, device.product_id = bus, vid, pid
+
+    def events(self):
+        """
+        Iterate over the remaining events in the recording.
+
+        :returns: a generator of tuples ``(device index, timestamp, data)``
+            with the timestamp in nanoseconds and the data as
+            :class:`bytes`
+        """
+        lines = self.file
+        if self._pending is not None:
+            lines = itertools.chain([self._pending], lines)
+            self._pending = None
+
+        for line in lines:
+            if line.startswith('E:'):
+                yield (self._index, *parse_text_event(line))
+            elif line.startswith('D:'):
+                self._index = int(line[2:])
+
+    def seek(self, offset, device_index=0):
+        """
+        Continue reading the events at the given byte offset, e.g. from a
+        :class:`RecordingIndex`. This requires a seekable file opened with
+        :func:`open_recording`.
+
+        :param int offset: the byte offset of an ``E:`` line
+        :param int device_index: the device index in effect at ``offset``
+        """
+        # a text file cannot seek to byte offsets, so rewrap its buffer
+        buffer = self.file.detach()
+        buffer.seek(offset)
+        self.file = io.TextIOWrapper(buffer, encoding='utf-8')
+        self._pending = None
+        self._index = device_index
+
+
+class BinaryRecordingReader(object):
+    """
+    Reader for the binary recording format. The device headers are read
+    when the reader is created, the events are read by iterating over
+    :meth:`events`.
+
+    :param file: a file-like object opened in binary mode
+
+    .. attribute:: devices
+
+        A dictionary of device index to :class:`RecordingDevice`
+
+    .. attribute:: origin
+
+        The capture origin in nanoseconds since the epoch or ``None`` if
+        the recording does not have one
+    """
+    def __init__(self, file):
+        self.file = file
+        self.devices = {}
+        self.origin = None
+
+        magic, version, count = _FILE_HEADER.unpack(self._read(_FILE_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('Not a binary HID recording')
+        if version not in (1, VERSION):
+            raise ValueError(f'Unsupported binary recording version {version}')
+        if version >= 2:
+            origin, = _ORIGIN.unpack(self._read(_ORIGIN.size))
+            self.origin = origin or None
+
+        for idx in range(count):
+            bus, vid, pid, name_len, phys_len, rdesc_len = _DEVICE_HEADER.unpack(self._read(_DEVICE_HEADER.size))
+            name = self._read(name_len).decode('utf-8')
+            phys = self._read(phys_len).decode('utf-8') or None
+            rdesc = self._read(rdesc_len)
+            self.devices[idx] = RecordingDevice(name, bus, vid, pid, rdesc, phys)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the underlying file
+        """
+        self.file.close()
+
+    def _read(self, size):
+        data = self.file.read(size)
+        if len(data) != size:
+            raise ValueError('Truncated binary recording')
+        return data
+
+    def events(self):
+        """
+        Iterate over the remaining events in the recording.
+
+        :returns: a generator of tuples ``(device index, timestamp, data)``
+            with the timestamp in nanoseconds and the data as
+            :class:`bytes`
+        """
+        read = self.file.read
+        while True:
+            event = _read_binary_event(read)
+            if event is None:
+                break
+            yield event
+
+    def seek(self, offset, device_index=0):
+        """
+        Continue reading the events at the given byte offset, e.g. from a
+        :class:`RecordingIndex`. This requires a seekable file.
+
+        :param int offset: the byte offset of an event
+        :param int device_index: ignored, binary events store their device
+        """
+        self.file.seek(offset)
+
+
+class BinaryRecordingWriter(object):
+    """
+    Writer for the binary recording format. The file and device headers
+    are written when the writer is created.
+
+    :param file: a file-like object opened in binary mode, or a
+        :class:`hidtools.hidraw.RecordingWriter` wrapping one
+    :param list devices: the devices in the recording, each a
+        :class:`RecordingDevice` or :class:`hidtools.hidraw.HidrawDevice`.
+        The position in this list is the device index.
+    :param int origin: the capture origin in nanoseconds since the epoch
+        or ``None`` if unknown
+    """
+    def __init__(self, file, devices, origin=None):
+        self.file = file
+        header = [_FILE_HEADER.pack(MAGIC, VERSION, len(devices)), _ORIGIN.pack(origin or 0)]
+        for device in devices:
+            name = device.name.encode('utf-8')
+            phys = (getattr(device, 'phys', None) or '').encode('utf-8')
+            rdesc = bytes(device.rdesc)
+            header.append(_DEVICE_HEADER.pack(device.bustype, device.vendor_id, device.product_id,
+                                              len(name), len(phys), len(rdesc)))
+            header.extend((name, phys, rdesc))
+        file.write(b''.join(header))
+
+    def write_event(self, index, timestamp, data):
+        """
+        Append one event to the recording.
+
+        :param int index: the device index
+        :param int timestamp: the timestamp in nanoseconds
+        :param bytes data: the report
+        """
+        self.file.write(_EVENT_HEADER.pack(timestamp, index, len(data)) + data)
+
+
+_COMPRESSION = {
+    '.xz': lzma.open,
+    '.lzma': lzma.open,
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+}
+if zstandard is not None:
+    _COMPRESSION['.zst'] = zstandard.open
+
+
+def _compression_extension(path):
+    ext = os.path.splitext(os.fspath(path))[1]
+    if ext == '.zst' and zstandard is None:
+        raise ValueError(f'{path}: zstd compression requires the zstandard module')
+    return ext if ext in _COMPRESSION else None
+
+
+def is_compressed_path(path):
+    """
+    :returns: ``True`` if the file name asks for a compressed file
+    """
+    return _compression_extension(path) is not None
+
+
+def is_binary_path(path):
+    """
+    :returns: ``True`` if the file name asks for the binary format, a
+        compression extension is ignored, i.e. ``foo.hidb.xz`` is a binary
+        recording
+    """
+    path = os.fspath(path)
+    if is_compressed_path(path):
+        path = os.path.splitext(path)[0]
+    return path.endswith(BINARY_EXTENSION)
+
+
+def indexed_path(path, index):
+    """
+    Insert an index into the file name, before the recording and
+    compression extensions, e.g. ``foo.hidb.xz`` becomes ``foo.1.hidb.xz``
+    for index 1.
+
+    :param str path: the path to the file
+    :param index: the index to insert, usually an integer
+    """
+    path = os.fspath(path)
+    suffix = ''
+    if is_compressed_path(path):
+        path, suffix = os.path.splitext(path)
+    base, ext = os.path.splitext(path)
+    if ext not in ('.hid', BINARY_EXTENSION):
+        base, ext = path, ''
+    return f'{base}.{index}{ext}{suffix}'
+
+
+def open_file(path, mode='rb'):
+    """
+    Open the file at ``path``, compressing or decompressing it while it
+    is written or read if the file extension says so. The path ``-``
+    refers to stdin or stdout, depending on the mode.
+
+    :param str path: the path to the file
+    :param str mode: the mode as passed to :func:`open`, ``t`` or ``b``
+        must be given for compressed files
+    :returns: a file-like object
+    """
+    if path == '-':
+        f = sys.stdin if 'r' in mode else sys.stdout
+        return f.buffer if 'b' in mode else f
+
+    ext = _compression_extension(path)
+    if ext is None:
+        return open(path, mode)
+
+    if 'b' not in mode and 't' not in mode:
+        mode += 't'
+    f = _COMPRESSION[ext](path, mode)
+    if 'rb' in mode and not hasattr(f, 'peek'):
+        f = io.BufferedReader(f)
+    return f
+
+
+def is_binary_recording(file):
+    """
+    :param file: a buffered file-like object opened in binary mode. The
+        file position is not changed.
+    :returns: ``True`` if the file is a binary recording
+    """
+    return file.peek(len(MAGIC))[:len(MAGIC)] == MAGIC
+
+
+def open_recording(file):
+    """
+    Open a recording in either format.
+
+    :param file: a path or a buffered file-like object opened in binary
+        mode. Compressed files are decompressed, see :func:`open_file`.
+    :returns: a :class:`TextRecordingReader` or
+        :class:`BinaryRecordingReader`
+    """
+    if isinstance(file, (str, os.PathLike)):
+        file = open_file(file, 'rb')
+
+    if is_binary_recording(file):
+        return BinaryRecordingReader(file)
+    return TextRecordingReader(io.TextIOWrapper(file, encoding='utf-8'))
+
+
+def _event_writer(file, binary, devices, origin=None):
+    """
+    Write the headers for ``devices``, a dict of device index to
+    :class:`RecordingDevice`, and return a function that writes one event
+    given the device index, timestamp and data.
+    """
+    indices = sorted(devices)
+
+    if binary:
+        positions = {idx: pos for pos, idx in enumerate(indices)}
+        writer = BinaryRecordingWriter(file, [devices[idx] for idx in indices], origin)
+
+        def write_binary(idx, timestamp, data):
+            writer.write_event(positions[idx], timestamp, data)
+        return write_binary
+
+    write_text_origin(file, origin)
+    multiple = len(indices) > 1
+    for idx in indices:
+        if multiple:
+            file.write(f'D: {idx}\n')
+        write_text_header(file, devices[idx])
+
+    last_index = indices[-1] if indices else None
+
+    def write_text(idx, timestamp, data):
+        nonlocal last_index
+        if multiple and idx != last_index:
+            file.write(f'D: {idx}\n')
+            last_index = idx
+        write_text_event(file, devices[idx].report_descriptor, timestamp, data)
+    return write_text
+
+
+def convert(reader, file, binary):
+    """
+    Write the recording from ``reader`` to ``file``, in the binary format
+    if ``binary`` is ``True``, in the text format otherwise. The conversion
+    is lossless, except for comments in text recordings.
+
+    :param reader: a :class:`TextRecordingReader` or
+        :class:`BinaryRecordingReader`
+    :param file: a file-like object, opened in binary mode if ``binary``
+        is ``True``, in text mode otherwise
+    """
+    write = _event_writer(file, binary, reader.devices, reader.origin)
+    for idx, timestamp, data in reader.events():
+        write(idx, timestamp, data)
+
+
+def _renumbered_events(reader, first, shift):
+    for idx, timestamp, data in reader.events():
+        yield first[idx], timestamp + shift, data
+
+
+def merge_recordings(readers, file, binary):
+    """
+    Merge several recordings into one multi-device recording, ordered by
+    timestamp. The devices are numbered in the order of ``readers``, a
+    recording with two devices followed by one with a single device gives
+    the device indices 0, 1 and 2. Events with the same timestamp are
+    written in the order of ``readers``.
+
+    The merged recording starts at the earliest capture origin of the
+    recordings, the timestamps of the others are shifted by the
+    difference of their origins. If any of the recordings does not have
+    an origin, the timestamps are merged as they are and the recordings
+    must share the same time base, e.g. by starting at the same time.
+
+    The events are merged as they are read, only one event per recording
+    is held in memory.
+
+    :param list readers: :class:`TextRecordingReader`,
+        :class:`BinaryRecordingReader` or :class:`Recording` objects
+    :param file: a file-like object, opened in binary mode if ``binary``
+        is ``True``, in text mode otherwise
+    """
+    origins = [reader.origin for reader in readers]
+    if None in origins:
+        origin = None
+        origins = [0] * len(readers)
+    else:
+        origin = min(origins, default=None)
+
+    devices = {}
+    streams = []
+    for reader, reader_origin in zip(readers, origins):
+        first = {}
+        for idx in sorted(reader.devices):
+            first[idx] = len(devices)
+            devices[len(devices)] = reader.devices[idx]
+        streams.append(_renumbered_events(reader, first, reader_origin - (origin or 0)))
+
+    write = _event_writer(file, binary, devices, origin)
+    for idx, timestamp, data in heapq.merge(*streams, key=lambda e: e[1]):
+        write(idx, timestamp, data)
+
+
+def split_recording(reader, files, binary):
+    """
+    Split a multi-device recording into one recording per device. The
+    events are written as they are read, with their original timestamps.
+
+    :param reader: a :class:`TextRecordingReader`,
+        :class:`BinaryRecordingReader` or :class:`Recording`
+    :param dict files: a dict of device index to the file-like object to
+        write that device to, opened in binary mode if ``binary`` is
+        ``True``, in text mode otherwise. The events of devices not in
+        ``files`` are dropped.
+    """
+    writers = {idx: _event_writer(f, binary, {0: reader.devices[idx]}, reader.origin)
+               for idx, f in files.items()}
+    for idx, timestamp, data in reader.events():
+        write = writers.get(idx)
+        if write is not None:
+            write(0, timestamp, data)
+
+
+def events_in_window(reader, start=None, end=None, index=None):
+    """
+    Iterate over the events of a recording with ``start <= timestamp <
+    end``. If an ``index`` is given, the reader seeks close to ``start``
+    instead of reading all events before it.
+
+    :param reader: a :class:`TextRecordingReader` or
+        :class:`BinaryRecordingReader` positioned before the first event
+    :param int start: the first timestamp in nanoseconds or ``None``
+    :param int end: the timestamp in nanoseconds to stop at or ``None``
+    :param RecordingIndex index: the index for this recording or ``None``
+    :returns: a generator of tuples ``(device index, timestamp, data)``
+    """
+    if start is not None and index is not None:
+        entry = index.lookup_time(start)
+        if entry is not None:
+            reader.seek(entry.offset, entry.device_index)
+
+    for idx, timestamp, data in reader.events():
+        if end is not None and timestamp >= end:
+            break
+        if start is not None and timestamp < start:
+            continue
+        yield idx, timestamp, data
+
+
+class RecordingIndexEntry(object):
+    """
+    One entry of a :class:`RecordingIndex`.
+
+    .. attribute:: event
+
+        The event number, counting from 0
+
+    .. attribute:: timestamp
+
+        The event's timestamp in nanoseconds
+
+    .. attribute:: offset
+
+        The byte offset of the event in the recording
+
+    .. attribute:: device_index
+
+        The device index in effect at :attr:`offset`
+    """
+    __slots__ = ('event', 'timestamp', 'offset', 'device_index')
+
+    def __init__(self, event, timestamp, offset, device_index):
+        self.event = event
+        self.timestamp = timestamp
+        self.offset = offset
+        self.device_index = device_index
+
+
+class RecordingIndex(object):
+    """
+    A sparse index of an uncompressed recording, mapping every
+    :attr:`stride`-th event to its timestamp and byte offset. ::
+
+        index = RecordingIndex.build('rec.hid')
+        index.save(index_path('rec.hid'))
+
+        index = RecordingIndex.load(index_path('rec.hid'), 'rec.hid')
+        with open_recording('rec.hid') as reader:
+            for idx, timestamp, data in events_in_window(reader, start, end, index):
+                ...
+
+    Timestamps in a recording never decrease, so the index can be
+    searched by timestamp.
+
+    :param int stride: the number of events between two entries
+    :param int size: the size of the recording in bytes
+
+    .. attribute:: stride
+
+        The number of events between two entries
+
+    .. attribute:: size
+
+        The size in bytes of the recording this index was built for
+    """
+    def __init__(self, stride=1024, size=0):
+        self.stride = stride
+        self.size = size
+        self._events = array.array('Q')
+        self._timestamps = array.array('q')
+        self._offsets = array.array('Q')
+        self._devices = array.array('H')
+
+    def __len__(self):
+        return len(self._events)
+
+    def __getitem__(self, key):
+        return RecordingIndexEntry(self._events[key], self._timestamps[key],
+                                   self._offsets[key], self._devices[key])
+
+    def append(self, event, timestamp, offset, device_index):
+        """
+        Add an entry, entries must be added in event order
+        """
+        self._events.append(event)
+        self._timestamps.append(timestamp)
+        self._offsets.append(offset)
+        self._devices.append(device_index)
+
+    def lookup_time(self, timestamp):
+        """
+        :returns: the last :class:`RecordingIndexEntry` before
+            ``timestamp`` or ``None`` if there is none, i.e. the recording
+            must be read from the start
+        """
+        pos = bisect.bisect_left(self._timestamps, timestamp) - 1
+        return self[pos] if pos >= 0 else None
+
+    def lookup_event(self, event):
+        """
+        :returns: the last :class:`RecordingIndexEntry` at or before event
+            number ``event`` or ``None`` if there is none
+        """
+        pos = bisect.bisect_right(self._events, event) - 1
+        return self[pos] if pos >= 0 else None
+
+    def save(self, path):
+        """
+        Write the index to the file at ``path``. The index is written to
+        a temporary file first and then renamed, so a reader never sees a
+        partially written index.
+        """
+        tmp = f'{path}.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(_INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, self.stride, self.size, len(self)))
+                for entry in zip(self._events, self._timestamps, self._offsets, self._devices):
+                    f.write(_INDEX_ENTRY.pack(*entry))
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path, recording=None):
+        """
+        Read the index from the file at ``path``.
+
+        :param str recording: if not ``None``, the path to the recording.
+            The index is only returned if it matches the recording's size.
+        :returns: a :class:`RecordingIndex` or ``None`` if the index is
+            missing, outdated, unreadable or inconsistent. The index can
+            always be rebuilt from the recording.
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if recording is not None:
+                recording_size = os.path.getsize(recording)
+        except OSError:
+            return None
+
+        if len(data) < _INDEX_HEADER.size:
+            return None
+        magic, version, _, stride, size, count = _INDEX_HEADER.unpack_from(data)
+        if (magic != INDEX_MAGIC or version != INDEX_VERSION or stride == 0 or
+                len(data) != _INDEX_HEADER.size + count * _INDEX_ENTRY.size):
+            return None
+        if recording is not None and recording_size != size:
+            return None
+
+        index = cls(stride, size)
+        for entry in _INDEX_ENTRY.iter_unpack(data[_INDEX_HEADER.size:]):
+            index.append(*entry)
+        if index._offsets and index._offsets[-1] >= size:
+            return None
+        return index
+
+    @classmethod
+    def build(cls, path, stride=1024):
+        """
+        Build the index for the recording at ``path`` by reading it once.
+
+        :param str path: the path to an uncompressed recording
+        :param int stride: the number of events between two entries
+        :returns: a :class:`RecordingIndex`
+        """
+        if is_compressed_path(path):
+            raise ValueError(f'{path}: compressed recordings cannot be indexed')
+
+        index = cls(stride, os.path.getsize(path))
+        with open(path, 'rb') as f:
+            if is_binary_recording(f):
+                index._build_binary(f)
+            else:
+                index._build_text(f)
+        return index
+
+    def _build_binary(self, f):
+        BinaryRecordingReader(f)
+        offset = f.tell()
+        read = f.read
+        event = 0
+        while True:
+            e = _read_binary_event(read)
+            if e is None:
+                break
+            idx, timestamp, data = e
+            if event % self.stride == 0:
+                self.append(event, timestamp, offset, idx)
+            offset += _EVENT_HEADER.size + len(data)
+            event += 1
+
+    def _build_text(self, f):
+        offset = 0
+        device_index = 0
+        event = 0
+        for line in f:
+            if line.startswith(b'E:'):
+                if event % self.stride == 0:
+                    timestamp, _ = parse_text_event(line.decode())
+                    self.append(event, timestamp, offset, device_index)
+                event += 1
+            elif line.startswith(b'D:'):
+                device_index = int(line[2:])
+            offset += len(line)
+
+
+def index_path(path):
+    """
+    :returns: the path of the sidecar index for the recording at ``path``
+    """
+    return os.fspath(path) + INDEX_EXTENSION
+
+
+def build_index(path, stride=1024):
+    """
+    Build and save the sidecar index for the recording at ``path``, see
+    :class:`RecordingIndex`.
+
+    :returns: the :class:`RecordingIndex`
+    """
+    index = RecordingIndex.build(path, stride)
+    index.save(index_path(path))
+    return index
+
+
+def load_index(path):
+    """
+    Load the sidecar index for the recording at ``path``.
+
+    :returns: the :class:`RecordingIndex` or ``None`` if there is no index
+        for this recording or it is outdated
+    """
+    if path == '-' or is_compressed_path(path):
+        return None
+    return RecordingIndex.load(index_path(path), path)
+
+
+class Recording(object):
+    """
+    A recording in either format, mapped into memory with :class:`mmap.mmap`
+    instead of being read if it is a regular uncompressed file. The device
+    headers are parsed when the recording is opened, the events are only
+    parsed while iterating. ::
+
+        with Recording('rec.hidb') as recording:
+            for idx, timestamp, data in recording:
+                ...
+
+    Slicing with timestamps in nanoseconds returns a view of the events
+    with ``start <= timestamp < stop``. The view shares the mapping and
+    uses the sidecar index, if there is one, to skip the events before
+    ``start``, see :class:`RecordingIndex`. ::
+
+        window = recording[10000000000:20000000000]
+
+    Compressed recordings, pipes and stdin (``-``) cannot be mapped and
+    are read as a stream with :func:`open_recording` instead, each event
+    is available as soon as it was read. Slicing a stream does not skip
+    any events, and stdin and pipes can only be iterated over once.
+
+    :param str path: the path to the recording
+
+    .. attribute:: devices
+
+        A dictionary of device index to :class:`RecordingDevice`
+
+    .. attribute:: binary
+
+        ``True`` if this is a binary recording
+
+    .. attribute:: origin
+
+        The capture origin in nanoseconds since the epoch or ``None``, see
+        :class:`TextRecordingReader`
+
+    .. attribute:: start
+
+        The first timestamp of this view in nanoseconds or ``None``
+
+    .. attribute:: stop
+
+        The timestamp in nanoseconds this view stops at or ``None``
+
+    .. attribute:: index
+
+        The :class:`RecordingIndex` for this recording or ``None``
+    """
+    def __init__(self, path):
+        self.path = path
+        self.start = None
+        self.stop = None
+        self._mmap = None
+        self._reader = None
+        self.index = None
+
+        if path == '-' or is_compressed_path(path) or not os.path.isfile(path):
+            self._reader = open_recording(path)
+            self.devices = self._reader.devices
+            self.origin = self._reader.origin
+            self.binary = isinstance(self._reader, BinaryRecordingReader)
+            return
+
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._data = self._mmap
+            else:
+                # empty files cannot be mapped
+                self._data = b''
+        self.index = load_index(path)
+
+        self.binary = self._data[:len(MAGIC)] == MAGIC
+        if self.binary:
+            self._parse_binary_header()
+        else:
+            self._parse_text_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Unmap or close the recording. Views created by slicing become
+        unusable.
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._reader is not None:
+            self._reader.close()
+
+    def _parse_binary_header(self):
+        reader = BinaryRecordingReader(self._mmap)
+        self.devices = reader.devices
+        self.origin = reader.origin
+        self._first_event = self._mmap.tell()
+        self._first_device_index = 0
+
+    def _parse_text_header(self):
+        data = self._data
+        if data[:2] == b'E:':
+            end = 0
+        else:
+            end = data.find(b'\nE:')
+            end = len(data) if end < 0 else end + 1
+        reader = TextRecordingReader(io.StringIO(data[:end].decode('utf-8')))
+        self.devices = reader.devices
+        self.origin = reader.origin
+        self._first_event = end
+        self._first_device_index = reader._index
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('Recordings can only be sliced by timestamp')
+
+        view = object.__new__(Recording)
+        view.__dict__.update(self.__dict__)
+        if key.start is not None:
+            view.start = key.start if self.start is None else max(self.start, key.start)
+        if key.stop is not None:
+            view.stop = key.stop if self.stop is None else min(self.stop, key.stop)
+        return view
+
+    def __iter__(self):
+        return self.events()
+
+    def events(self):
+        """
+        Iterate over the events in this recording or view.
+
+        :returns: a generator of tuples ``(device index, timestamp, data)``
+            with the timestamp in nanoseconds and the data as
+            :class:`bytes`
+        """
+        if self._reader is not None:
+            return self._stream_events()
+        return self._mapped_events()
+
+    def _stream_events(self):
+        if self.path == '-' or not os.path.isfile(self.path):
+            yield from events_in_window(self._reader, self.start, self.stop)
+            return
+
+        # a compressed file can be read again, a new reader starts at the
+        # first event
+        with open_recording(self.path) as reader:
+            yield from events_in_window(reader, self.start, self.stop)
+
+    def _mapped_events(self):
+        offset, device_index = self._first_event, self._first_device_index
+        if self.start is not None and self.index is not None:
+            entry = self.index.lookup_time(self.start)
+            if entry is not None:
+                offset, device_index = entry.offset, entry.device_index
+
+        walk = self._binary_events if self.binary else self._text_events
+        start, stop = self.start, self.stop
+        for idx, timestamp, data in walk(offset, device_index):
+            if stop is not None and timestamp >= stop:
+                break
+            if start is not None and timestamp < start:
+                continue
+            yield idx, timestamp, data
+
+    def _binary_events(self, offset, device_index):
+        data = self._data
+
+        # views share the mapping, so each iteration keeps its own offset
+        def read(size):
+            nonlocal offset
+            offset += size
+            return data[offset - size:offset]
+
+        while True:
+            event = _read_binary_event(read)
+            if event is None:
+                break
+            yield event
+
+    def _text_events(self, offset, device_index):
+        data = self._data
+        end = len(data)
+        rest = b''
+        while offset < end:
+            # split the lines of one chunk at a time, only the chunk is
+            # copied out of the mapping
+            chunk = data[offset:offset + _TEXT_CHUNK_SIZE]
+            offset += len(chunk)
+            lines = (rest + chunk).split(b'\n')
+            rest = lines.pop() if offset < end else b''
+            for line in lines:
+                if line.startswith(b'E:'):
+                    yield (device_index, *parse_text_event(line.decode()))
+                elif line.startswith(b'D:'):
+                    device_index = int(line[2:])
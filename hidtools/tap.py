@@ -0,0 +1,363 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+A live tap of the events of a recording process, shared with any number
+of local consumers through a :mod:`multiprocessing.shared_memory` ring
+buffer. The producer never waits for the consumers, a consumer that falls
+too far behind loses events and is told how many.
+
+The shared memory block starts with a header::
+
+    magic       4 bytes, ``HIDT``
+    version     u16
+    reserved    u16
+    header size u32, the size of the device headers
+    capacity    u32, the size of the ring buffer
+    reserve     u64, the end of the event being written
+    commit      u64, the end of the last complete event
+    published   u64, the number of complete events
+    closed      u64, non-zero once the producer is done
+    tail        u64, the start of the oldest event not overwritten yet
+
+followed by the file and device headers of the binary recording format
+(see :mod:`hidtools.recording`) and, 8-byte aligned, the ring buffer. The
+integers are in native byte order, the block is only shared between local
+processes.
+
+``reserve``, ``commit`` and ``tail`` count the bytes written since the tap was
+created, the position in the ring buffer is the counter modulo the
+capacity. Each event is a header followed by the report::
+
+    sequence    u64, the event number, counting from 0
+    timestamp   s64, in nanoseconds
+    device      u16, the device index
+    size        u16, the report size in bytes
+
+An event never wraps around the end of the ring buffer, the producer
+skips to the start instead, after writing a header with the device index
+``0xffff`` if there is room for one.
+
+The producer moves ``tail`` and ``reserve`` before it writes an event and
+``commit`` after, a consumer checks ``reserve`` after copying an event to
+detect that it was overwritten while being copied. A consumer that fell
+behind continues at ``tail``.
+"""
+
+import collections
+import io
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+from hidtools.recording import BinaryRecordingReader, BinaryRecordingWriter
+
+if sys.version_info < (3, 13):
+    from multiprocessing import resource_tracker
+
+
+TAP_MAGIC = b'HIDT'
+TAP_VERSION = 1
+
+#: The name of the shared memory block of ``hid-recorder --tap``
+DEFAULT_TAP_NAME = 'hid-recorder'
+
+_TAP_HEADER = struct.Struct('=4sHHII')
+_TAP_COUNTERS = 5
+_TAP_EVENT = struct.Struct('=QqHH')
+_WRAP = 0xffff
+_RESERVE, _COMMIT, _PUBLISHED, _CLOSED, _TAIL = range(_TAP_COUNTERS)
+
+# the shared memory blocks created by an EventTap of this process
+_created = set()
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+
+    # older versions register the block with the resource tracker, which
+    # removes it when the reader exits. The tracker keeps one registration
+    # per block, a block of our own EventTap must stay registered.
+    shm = shared_memory.SharedMemory(name)
+    if shm._name not in _created:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _data_offset(header_size):
+    offset = _TAP_HEADER.size + _TAP_COUNTERS * 8 + header_size
+    return (offset + 7) & ~7
+
+
+class EventTap(object):
+    """
+    The producer side of a tap: creates the shared memory block and
+    publishes events into it. There can only be one producer per tap.
+
+    :param list devices: the devices whose events are published, each a
+        :class:`hidtools.recording.RecordingDevice` or
+        :class:`hidtools.hidraw.HidrawDevice`. The position in this list
+        is the device index.
+    :param str name: the name of the shared memory block, ``None`` for a
+        random name
+    :param int capacity: the size of the ring buffer in bytes
+    :param int origin: the capture origin of the event timestamps in
+        nanoseconds since the epoch, or ``None``
+
+    :raises FileExistsError: if a tap of that name exists already
+
+    .. attribute:: name
+
+        The name of the shared memory block, to be passed to
+        :class:`EventTapReader`
+
+    .. attribute:: published
+
+        The number of events published so far
+    """
+    def __init__(self, devices, name=None, capacity=1 << 20, origin=None):
+        header = io.BytesIO()
+        BinaryRecordingWriter(header, devices, origin)
+        header = header.getvalue()
+
+        self.capacity = capacity
+        self.published = 0
+        self._pos = 0
+        # the start of each event that was not overwritten yet
+        self._starts = collections.deque()
+        self._data_offset = _data_offset(len(header))
+        self._shm = shared_memory.SharedMemory(name, create=True, size=self._data_offset + capacity)
+        self.name = self._shm.name
+        _created.add(self._shm._name)
+
+        buf = self._shm.buf
+        _TAP_HEADER.pack_into(buf, 0, TAP_MAGIC, TAP_VERSION, 0, len(header), capacity)
+        offset = _TAP_HEADER.size + _TAP_COUNTERS * 8
+        buf[offset:offset + len(header)] = header
+        self._counters = buf[_TAP_HEADER.size:offset].cast('Q')
+        self._data = buf[self._data_offset:self._data_offset + capacity]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, idx, events):
+        """
+        Publish the events of one device. This never blocks, events the
+        consumers have not read yet are overwritten.
+
+        :param int idx: the device index
+        :param list events: a list of :class:`hidtools.hidraw.HidrawEvent`
+        """
+        capacity = self.capacity
+        counters = self._counters
+        data = self._data
+        starts = self._starts
+        pos = self._pos
+        for event in events:
+            report = event.bytes
+            size = _TAP_EVENT.size + len(report)
+            if size > capacity:
+                raise ValueError(f'Report of {len(report)} bytes does not fit into the tap')
+
+            offset = pos % capacity
+            wrap = capacity - offset < size
+            start = pos + capacity - offset if wrap else pos
+            starts.append(start)
+            while starts[0] < start + size - capacity:
+                starts.popleft()
+            counters[_TAIL] = starts[0]
+            counters[_RESERVE] = start + size
+
+            if wrap:
+                if capacity - offset >= _TAP_EVENT.size:
+                    _TAP_EVENT.pack_into(data, offset, 0, 0, _WRAP, 0)
+                pos = start
+                offset = 0
+
+            _TAP_EVENT.pack_into(data, offset, self.published, event.timestamp, idx, len(report))
+            data[offset + _TAP_EVENT.size:offset + size] = report
+            pos += size
+            self.published += 1
+            counters[_PUBLISHED] = self.published
+            counters[_COMMIT] = pos
+        self._pos = pos
+
+    def close(self):
+        """
+        Mark the tap as closed and remove the shared memory block.
+        Consumers that are attached already can still read the remaining
+        events.
+        """
+        if self._shm is None:
+            return
+        self._counters[_CLOSED] = 1
+        self._counters.release()
+        self._data.release()
+        self._shm.close()
+        self._shm.unlink()
+        _created.discard(self._shm._name)
+        self._shm = None
+
+
+class EventTapReader(object):
+    """
+    The consumer side of a tap. A reader only sees the events published
+    after it attached. Iterating over the reader yields the events until
+    the producer closes the tap, see :meth:`read_events` to poll for
+    events instead.
+
+    :param str name: the name of the shared memory block, see
+        :attr:`EventTap.name`
+    :param float interval: the time in seconds to sleep while waiting for
+        events when iterating
+
+    :raises FileNotFoundError: if there is no tap of that name
+
+    .. attribute:: devices
+
+        A dictionary of device index to
+        :class:`hidtools.recording.RecordingDevice`
+
+    .. attribute:: origin
+
+        The capture origin of the event timestamps in nanoseconds since
+        the epoch, or ``None``
+
+    .. attribute:: dropped
+
+        The number of events lost because this reader fell more than the
+        ring buffer capacity behind the producer. The reader then
+        continues with the oldest event that was not overwritten.
+    """
+    def __init__(self, name, interval=0.01):
+        self._shm = _attach(name)
+        self.interval = interval
+        self.dropped = 0
+        buf = self._shm.buf
+        magic, version, _, header_size, capacity = _TAP_HEADER.unpack_from(buf, 0)
+        if magic != TAP_MAGIC:
+            self._shm.close()
+            raise ValueError(f'{name} is not a HID event tap')
+        if version != TAP_VERSION:
+            self._shm.close()
+            raise ValueError(f'Unsupported HID event tap version {version}')
+
+        offset = _TAP_HEADER.size + _TAP_COUNTERS * 8
+        header = BinaryRecordingReader(io.BytesIO(bytes(buf[offset:offset + header_size])))
+        self.devices = header.devices
+        self.origin = header.origin
+        self.capacity = capacity
+        self._counters = buf[_TAP_HEADER.size:offset].cast('Q')
+        data_offset = _data_offset(header_size)
+        self._data = buf[data_offset:data_offset + capacity]
+        # the producer counts an event as published just before it commits
+        # it, so the first event after the commit may be the last one
+        # counted, see read_events
+        self._sequence = self._counters[_PUBLISHED]
+        self._pos = self._counters[_COMMIT]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def closed(self):
+        """
+        ``True`` once the producer closed the tap
+        """
+        return self._counters[_CLOSED] != 0
+
+    def _resync(self):
+        # we fell behind, continue with the oldest event that is still
+        # intact. If even that one is not complete yet, all events were
+        # overwritten and we wait for the next one.
+        tail = self._counters[_TAIL]
+        self._pos = min(tail, self._counters[_COMMIT])
+
+    def read_events(self, max_events=None):
+        """
+        Read the events published since the last call, without waiting.
+
+        :param int max_events: the maximum number of events to read, or
+            ``None`` for all
+        :returns: a list of tuples ``(device index, timestamp, data)``
+        """
+        capacity = self.capacity
+        counters = self._counters
+        data = self._data
+        events = []
+        while max_events is None or len(events) < max_events:
+            pos = self._pos
+            commit = counters[_COMMIT]
+            if pos == commit:
+                break
+            if commit - pos > capacity:
+                self._resync()
+                continue
+
+            offset = pos % capacity
+            if capacity - offset < _TAP_EVENT.size:
+                self._pos = pos + capacity - offset
+                continue
+            sequence, timestamp, idx, size = _TAP_EVENT.unpack_from(data, offset)
+            if idx == _WRAP:
+                self._pos = pos + capacity - offset
+                continue
+            report = bytes(data[offset + _TAP_EVENT.size:offset + _TAP_EVENT.size + size])
+
+            # the producer may have overwritten the event while we copied it
+            if counters[_RESERVE] - pos > capacity:
+                self._resync()
+                continue
+
+            self.dropped += max(sequence - self._sequence, 0)
+            self._sequence = sequence + 1
+            self._pos = pos + _TAP_EVENT.size + size
+            events.append((idx, timestamp, report))
+        return events
+
+    def __iter__(self):
+        while True:
+            closed = self.closed
+            events = self.read_events()
+            yield from events
+            if not events:
+                if closed:
+                    # events we fell behind on after the last one we read
+                    self.dropped += self._counters[_PUBLISHED] - self._sequence
+                    self._sequence = self._counters[_PUBLISHED]
+                    return
+                time.sleep(self.interval)
+
+    def close(self):
+        """
+        Detach from the tap.
+        """
+        if self._shm is None:
+            return
+        self._counters.release()
+        self._data.release()
+        self._shm.close()
+        self._shm = None
@@ -85,6 +85,12 @@ class UHIDDevice(object):
     UHID_OUTPUT_REPORT = 1
     UHID_INPUT_REPORT = 2
 
+    _report_types = {
+        UHID_FEATURE_REPORT: 'Feature',
+        UHID_OUTPUT_REPORT: 'Output',
+        UHID_INPUT_REPORT: 'Input',
+    }
+
     _polling_functions = {}
     _poll = select.poll()
     _devices = []
@@ -505,7 +511,7 @@ class UHIDDevice(object):
             ev, data, size, rtype = struct.unpack_from('< L 4096s H B', buf)
             self._output_report(data, size, rtype)
 
-    def create_report(self, data, global_data=None, reportID=None, application=None):
+    def create_report(self, data, global_data=None, reportID=None, application=None, rtype=UHID_INPUT_REPORT):
         """
         Convert the data object to an array of ints representing the report.
         Each property of the given data object is matched against the field
@@ -522,5 +528,24 @@ class UHIDDevice(object):
 
         The :class:`UHIDDevice` will create the report according to the
         device's report descriptor.
+
+        Use ``rtype`` to create the reply to a :meth:`get_report` request
+        for an Output or Feature report.
+
+        :param rtype: one of :attr:`UHID_FEATURE_REPORT`, :attr:`UHID_INPUT_REPORT`, or :attr:`UHID_OUTPUT_REPORT`
+        """
+        return self.parsed_rdesc.create_report(data, global_data, reportID, application,
+                                               type=UHIDDevice._report_types[rtype])
+
+    def get_values(self, data, rtype=UHID_INPUT_REPORT):
+        """
+        Extract the field values of the report in ``data``, e.g. the data
+        received in :meth:`set_report` or :meth:`output_report`.
+        See :meth:`hidtools.hid.ReportDescriptor.get_values`.
+
+        :param data: the report bytes, starting with the Report ID if any
+        :param rtype: one of :attr:`UHID_FEATURE_REPORT`, :attr:`UHID_INPUT_REPORT`, or :attr:`UHID_OUTPUT_REPORT`
+        :returns: a tuple of ``(HidReport, values)`` or ``None`` if no
+            report matches
         """
-        return self.parsed_rdesc.create_report(data, global_data, reportID, application)
+        return self.parsed_rdesc.get_values(data, UHIDDevice._report_types[rtype])
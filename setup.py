@@ -72,7 +72,10 @@ setup(name='hid-tools',
       license='GPL',
       entry_points={
           'console_scripts': [
+              'hid-convert = hidtools.cli.convert:main',
               'hid-decode= hidtools.cli.decode:main',
+              'hid-index = hidtools.cli.index:main',
+              'hid-merge = hidtools.cli.merge:main',
               'hid-recorder = hidtools.cli.record:main',
               'hid-replay = hidtools.cli.replay:main',
           ]
@@ -81,12 +84,15 @@ setup(name='hid-tools',
           'Development Status :: 3 - Alpha',
           'License :: OSI Approved :: GNU General Public License v2 or later (GPLv2+)',
           'Programming Language :: Python :: 3',
-          'Programming Language :: Python :: 3.6'
+          'Programming Language :: Python :: 3.8'
       ],
       data_files=[],  # man pages are added on success
-      python_requires='>=3.6',
+      python_requires='>=3.8',
       include_package_data=True,
       install_requires=['parse', 'pyudev', 'pyyaml'],
+      extras_require={
+          'zstd': ['zstandard'],
+      },
       cmdclass=dict(
           install=ManPageGenerator,
       )
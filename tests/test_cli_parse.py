@@ -0,0 +1,82 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import io
+import unittest
+from hidtools.cli.parse_hid import parse_text_recording
+import logging
+logger = logging.getLogger('hidtools.test.cli.parse')
+
+
+class TestParseTextRecording(unittest.TestCase):
+    header = [
+        '# a comment\n',
+        'D: 0\n',
+        'R: 16 06 00 ff 09 01 a1 01 75 08 95 02 09 02 81 02 c0\n',
+        'N: Vendor Device\n',
+        'I: 3 1234 5678\n',
+        'something else\n',
+    ]
+    events = [
+        'E: 0.000001 2 01 02\n',
+        'E: 0.000002 2 03 04\n',
+    ]
+
+    def parse(self, lines, **kwargs):
+        out = io.StringIO()
+        parse_text_recording(lines, out, **kwargs)
+        return out.getvalue()
+
+    def test_passthrough(self):
+        output = self.parse(self.header + self.events)
+        self.assertIn('Vendor Usage 1)', output)
+        self.assertIn('something else\n', output)
+        self.assertNotIn('a comment', output)
+        self.assertNotIn('Vendor Device', output)
+        self.assertIn('0.000001', output)
+        self.assertIn('0.000002', output)
+
+    def test_window(self):
+        output = self.parse(self.header + self.events, start=2000)
+        self.assertNotIn('0.000001', output)
+        self.assertIn('0.000002', output)
+        output = self.parse(self.header + self.events, end=2000)
+        self.assertIn('0.000001', output)
+        self.assertNotIn('0.000002', output)
+        output = self.parse(self.header + self.events, print_events=False)
+        self.assertIn('Vendor Usage 1)', output)
+        self.assertNotIn('0.000001', output)
+
+    def test_stream(self):
+        # the descriptor is printed before any event arrives, like from
+        # hid-recorder on a pipe
+        out = io.StringIO()
+
+        def lines():
+            yield from self.header
+            self.assertIn('Vendor Usage 1)', out.getvalue())
+            self.assertNotIn('0.000001', out.getvalue())
+            yield from self.events
+
+        parse_text_recording(lines(), out)
+        self.assertIn('0.000002', out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from test_hidraw import FakeHidraw
+from hidtools.cli.record import Recorder
+from hidtools.recording import (TextRecordingReader, format_timestamp, indexed_path, merge_recordings,
+                                open_recording)
+
+import logging
+logger = logging.getLogger('hidtools.test.cli.record')
+
+
+class TestRecorder(unittest.TestCase):
+    ndevices = 3
+    nevents = 20
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def record(self, *args, capacity=None, **kwargs):
+        """
+        Run a :class:`Recorder` on ``ndevices`` new devices while a thread
+        sends ``nevents`` reports to each device in turn, ``[1, n]`` for
+        the n-th event, then closes the devices so the recorder stops.
+        The devices keep at most ``capacity`` events.
+        """
+        fakes = [FakeHidraw(self, f'Fake Mouse {i}', nonblocking=True, capacity=capacity)
+                 for i in range(self.ndevices)]
+
+        def send():
+            for n in range(self.nevents):
+                for fake in fakes:
+                    fake.send([1, n])
+                time.sleep(0.001)
+            for fake in fakes:
+                fake.peer.close()
+
+        recorder = Recorder([fake.device for fake in fakes], *args, **kwargs)
+        thread = threading.Thread(target=send)
+        thread.start()
+        try:
+            recorder.run()
+        finally:
+            thread.join()
+            recorder.close()
+        return recorder
+
+    def check_events(self, path, indices):
+        with open_recording(path) as recording:
+            self.assertEqual([d.name for d in recording.devices.values()],
+                             [f'Fake Mouse {i}' for i in indices])
+            events = list(recording.events())
+
+        timestamps = [e[1] for e in events]
+        self.assertEqual(timestamps, sorted(timestamps))
+        for idx in recording.devices:
+            self.assertEqual([e[2] for e in events if e[0] == idx],
+                             [bytes([1, n]) for n in range(self.nevents)])
+        return events
+
+    def test_ordering(self):
+        for name in ('rec.hid', 'rec.hidb'):
+            for threads in (False, True):
+                with self.subTest(name=name, threads=threads):
+                    path = self.path(f'{threads}.{name}')
+                    recorder = self.record(path, name.endswith('.hidb'), threads=threads)
+                    events = self.check_events(path, range(self.ndevices))
+                    self.assertEqual(len(events), self.ndevices * self.nevents)
+                    self.assertGreater(recorder.wakeups, 0)
+                    self.assertLessEqual(recorder.wakeups, len(events))
+
+    def test_per_device(self):
+        path = self.path('rec.hid')
+        before = time.time_ns()
+        recorder = self.record(path, per_device=True, threads=True)
+        self.assertGreaterEqual(recorder.origin, before)
+        self.assertLessEqual(recorder.origin, time.time_ns())
+        for idx in range(self.ndevices):
+            events = self.check_events(indexed_path(path, idx), [idx])
+            self.assertEqual(len(events), self.nevents)
+
+        # the files share the capture origin, so merging them gives the
+        # same timestamps
+        paths = [indexed_path(path, idx) for idx in range(self.ndevices)]
+        expected = []
+        for idx, p in enumerate(paths):
+            with open_recording(p) as reader:
+                expected.extend((idx, timestamp, data) for _, timestamp, data in reader.events())
+        with contextlib.ExitStack() as stack:
+            readers = [stack.enter_context(open_recording(p)) for p in paths]
+            self.assertEqual({r.origin for r in readers}, {recorder.origin})
+            out = io.StringIO()
+            merge_recordings(readers, out, False)
+        out.seek(0)
+        reader = TextRecordingReader(out)
+        self.assertEqual(reader.origin, recorder.origin)
+        self.assertEqual(sorted(reader.events()), sorted(expected))
+
+    def check_segments(self, path):
+        segments = []
+        while os.path.exists(indexed_path(path, len(segments))):
+            with open_recording(indexed_path(path, len(segments))) as recording:
+                self.assertEqual([d.name for d in recording.devices.values()],
+                                 [f'Fake Mouse {i}' for i in range(self.ndevices)])
+                segments.append(list(recording.events()))
+        self.assertFalse(os.path.exists(path))
+        self.assertGreater(len(segments), 1)
+
+        # every segment is a complete recording and together they hold
+        # all events in order
+        events = [e for segment in segments for e in segment]
+        self.assertTrue(all(segments))
+        self.assertEqual([e[1] for e in events], sorted(e[1] for e in events))
+        for idx in range(self.ndevices):
+            self.assertEqual([e[2] for e in events if e[0] == idx],
+                             [bytes([1, n]) for n in range(self.nevents)])
+        return segments
+
+    def test_segment_size(self):
+        for name in ('rec.hid', 'rec.hidb'):
+            with self.subTest(name=name):
+                path = self.path(name)
+                recorder = self.record(path, name.endswith('.hidb'), segment_size=64, index=True)
+                segments = self.check_segments(path)
+                self.assertEqual(recorder.outputs[0].segment, len(segments) - 1)
+                for n in range(len(segments)):
+                    self.assertTrue(os.path.exists(indexed_path(path, n) + '.idx'))
+
+    def test_segment_duration(self):
+        path = self.path('rec.hid')
+        self.record(path, segment_duration=0.005)
+        for segment in self.check_segments(path):
+            # a segment spans the duration plus at most one batch
+            self.assertLess(segment[-1][1] - segment[0][1], 1000000000)
+
+    def test_snapshot(self):
+        path = self.path('rec.hid')
+        self.record(path, snapshot=True, capacity=5)
+        with open_recording(path) as recording:
+            events = list(recording.events())
+
+        # only the last events of each device, written when closed
+        timestamps = [e[1] for e in events]
+        self.assertEqual(timestamps, sorted(timestamps))
+        for idx in range(self.ndevices):
+            self.assertEqual([e[2] for e in events if e[0] == idx],
+                             [bytes([1, n]) for n in range(self.nevents - 5, self.nevents)])
+        with open(path) as f:
+            self.assertIn(f'# {self.nevents - 5} events dropped', f.read())
+
+    def test_annotations(self):
+        path = self.path('rec.hid')
+        annotations = self.path('annotations.txt')
+        self.record(path, annotations=annotations)
+
+        # the recording only holds the raw events
+        with open(path) as f:
+            self.assertNotIn('# ReportID', f.read())
+
+        with open(annotations) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[:self.ndevices],
+                         [f'# D: {i} Fake Mouse {i}' for i in range(self.ndevices)])
+        lines = lines[self.ndevices:]
+        events = self.check_events(path, range(self.ndevices))
+        self.assertEqual(len(lines), 2 * len(events))
+        for (idx, timestamp, data), header, annotation in zip(events, lines[::2], lines[1::2]):
+            self.assertEqual(header, f'# D: {idx} E: {format_timestamp(timestamp)}')
+            self.assertEqual(annotation.split(), ['#', 'ReportID:', '1', '/', 'Wheel:', str(data[1])])
+
+    def test_stats(self):
+        recorder = self.record(self.path('rec.hid'))
+        out = io.StringIO()
+        recorder.print_stats(file=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 1 + self.ndevices + 1)
+        for idx, line in enumerate(lines[1:1 + self.ndevices]):
+            self.assertIn(f'D: {idx} Fake Mouse {idx}:', line)
+            self.assertIn('since start', line)
+
+        # the per-interval counters start again
+        out = io.StringIO()
+        recorder.print_stats(file=out)
+        self.assertIn(' 0.0 events/s', out.getvalue())
+        self.assertIn('possible kernel overflows', out.getvalue())
+
+    def test_stats_blocking(self):
+        # a blocking device reads one event per batch, its overflows
+        # cannot be detected
+        fake = FakeHidraw(self)
+        recorder = Recorder([fake.device], self.path('rec.hid'))
+        recorder.close()
+        out = io.StringIO()
+        recorder.print_stats(file=out)
+        self.assertIn('D: 0 Fake Mouse:', out.getvalue())
+        self.assertNotIn('overflows', out.getvalue())
@@ -0,0 +1,443 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import asyncio
+import io
+import os
+import socket
+import tempfile
+import time
+import unittest
+import unittest.mock
+from hidtools.hid import ReportDescriptor
+from hidtools.hidraw import (HidrawDevice, HidrawEventStore, HidrawStats, RecordingWriter, ReportFilter,
+                             enumerate_devices)
+
+import logging
+logger = logging.getLogger('hidtools.test.hidraw')
+
+
+class TestHidrawEventStore(unittest.TestCase):
+    def setUp(self):
+        self.store = HidrawEventStore()
+        self.store.append(0, b'\x01\x02')
+        self.store.append(1500, memoryview(bytearray(b'\x01\x03\x04')))
+        self.store.append(1000002000, b'\x02')
+
+    def test_index(self):
+        store = self.store
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store[0].bytes, b'\x01\x02')
+        self.assertEqual(store[1].bytes, b'\x01\x03\x04')
+        self.assertEqual(store[1].timestamp, 1500)
+        self.assertEqual(store[-1].bytes, b'\x02')
+        self.assertEqual((store[-1].sec, store[-1].usec, store[-1].nsec), (1, 2, 2000))
+        with self.assertRaises(IndexError):
+            store[3]
+
+    def test_slice(self):
+        self.assertEqual([e.bytes for e in self.store[1:]], [b'\x01\x03\x04', b'\x02'])
+        self.assertEqual(self.store[3:], [])
+        self.assertEqual([e.timestamp for e in self.store], [0, 1500, 1000002000])
+
+
+class TestHidrawEventRing(unittest.TestCase):
+    def test_capacity(self):
+        store = HidrawEventStore(capacity=3)
+        for i in range(10):
+            store.append(i, bytes([i] * (i % 3 + 1)))
+        self.assertEqual(len(store), 10)
+        self.assertEqual(store.first, 7)
+        self.assertEqual(store.dropped, 7)
+        self.assertEqual([e.bytes for e in store], [b'\x07\x07', b'\x08\x08\x08', b'\x09'])
+        self.assertEqual([e.timestamp for e in store[5:]], [7, 8, 9])
+        self.assertEqual(store[-3].timestamp, 7)
+        with self.assertRaises(IndexError):
+            store[6]
+
+    def test_release(self):
+        store = HidrawEventStore(capacity=2)
+        for i in range(4):
+            store.append(i, b'\x01')
+        store.release(len(store))
+        for i in range(4, 7):
+            store.append(i, b'\x01')
+        # 0 and 1 were dropped unreleased, 2 and 3 released, 4 unreleased
+        self.assertEqual(store.dropped, 3)
+        self.assertEqual(store.first, 5)
+
+    def test_max_age(self):
+        store = HidrawEventStore(max_age=1.5)
+        for i in range(6):
+            store.append(i * 500000000, b'\x01')
+        self.assertEqual([e.timestamp // 500000000 for e in store], [2, 3, 4, 5])
+        self.assertEqual(store.dropped, 2)
+
+
+class TestRecordingWriter(unittest.TestCase):
+    def test_size_threshold(self):
+        out = io.StringIO()
+        writer = RecordingWriter(out, max_size=10, max_delay=100)
+        self.assertIsNone(writer.timeout())
+        writer.write('E: 1234\n')
+        self.assertEqual(out.getvalue(), '')
+        self.assertGreater(writer.timeout(), 0)
+        self.assertEqual(writer.size, 8)
+        writer.write('E: 5678\n')
+        self.assertEqual(out.getvalue(), 'E: 1234\nE: 5678\n')
+        self.assertEqual(writer.written, 16)
+        self.assertIsNone(writer.timeout())
+
+    def test_delay_threshold(self):
+        out = io.StringIO()
+        with RecordingWriter(out, max_delay=0) as writer:
+            writer.write('E: 1234\n')
+            self.assertEqual(out.getvalue(), 'E: 1234\n')
+            writer.max_delay = 100 * 1000000000
+            writer.write('E: 5678\n')
+            writer.flush_if_due()
+            self.assertEqual(out.getvalue(), 'E: 1234\n')
+        self.assertEqual(out.getvalue(), 'E: 1234\nE: 5678\n')
+        self.assertEqual(writer.written, 16)
+
+
+class TestHidrawStats(unittest.TestCase):
+    def test_batches(self):
+        stats = HidrawStats()
+        stats._add_batch(1, 8, 0)
+        stats._add_batch(3, 24, 5000)
+        before = stats.copy()
+        stats._add_batch(HidrawStats.KERNEL_QUEUE_SIZE, 512, 100)
+
+        self.assertEqual(stats.events, 4 + HidrawStats.KERNEL_QUEUE_SIZE)
+        self.assertEqual(stats.bytes, 544)
+        self.assertEqual(stats.reads, 3)
+        self.assertEqual(stats.max_batch, HidrawStats.KERNEL_QUEUE_SIZE)
+        self.assertEqual(stats.batches[1], 1)
+        self.assertEqual(stats.batches[2], 1)
+        self.assertEqual(stats.batches[7], 1)
+        self.assertEqual(stats.overflows, 1)
+        self.assertEqual(stats.max_interval, 5000)
+
+        self.assertEqual(before.events, 4)
+        self.assertEqual(before.overflows, 0)
+        self.assertEqual(sum(before.batches), 2)
+
+
+class TestEnumerateDevices(unittest.TestCase):
+    def add_device(self, sysfs, node, uevent, rdesc=b''):
+        path = os.path.join(sysfs, node, 'device')
+        os.makedirs(path)
+        with open(os.path.join(path, 'uevent'), 'w') as f:
+            f.write(uevent)
+        with open(os.path.join(path, 'report_descriptor'), 'wb') as f:
+            f.write(rdesc)
+
+    def test_sysfs(self):
+        with tempfile.TemporaryDirectory() as sysfs:
+            self.add_device(sysfs, 'hidraw10',
+                            'DRIVER=hid-generic\n'
+                            'HID_ID=0005:0000046D:0000B01A\n'
+                            'HID_NAME=Some Mouse\n'
+                            'HID_PHYS=aa:bb:cc:dd:ee:ff\n')
+            self.add_device(sysfs, 'hidraw2',
+                            'HID_ID=0003:00001234:00005678\n'
+                            'HID_NAME=Some Keyboard\n',
+                            b'\x05\x01\x09\x06')
+            self.add_device(sysfs, 'hidraw3', 'DRIVER=foo\n')
+
+            devices = enumerate_devices(sysfs)
+            self.assertEqual([d.path for d in devices], ['/dev/hidraw2', '/dev/hidraw10'])
+            keyboard, mouse = devices
+            self.assertEqual(keyboard.name, 'Some Keyboard')
+            self.assertEqual((keyboard.bustype, keyboard.vendor_id, keyboard.product_id), (0x3, 0x1234, 0x5678))
+            self.assertEqual(keyboard.phys, '')
+            self.assertEqual(keyboard.rdesc, b'\x05\x01\x09\x06')
+            self.assertEqual(mouse.name, 'Some Mouse')
+            self.assertEqual(mouse.bustype, 0x5)
+            self.assertEqual(mouse.phys, 'aa:bb:cc:dd:ee:ff')
+
+    def test_no_sysfs(self):
+        self.assertEqual(enumerate_devices('/does/not/exist'), [])
+
+
+class TestReportFilter(unittest.TestCase):
+    class Device(object):
+        def __init__(self, rdesc):
+            self.report_descriptor = ReportDescriptor.from_bytes(rdesc)
+
+    # a mouse wheel with report ID 1 and a vendor collection with report ID 2
+    composite = [
+        0x05, 0x01,        # Usage Page (Generic Desktop)
+        0x09, 0x02,        # Usage (Mouse)
+        0xa1, 0x01,        # Collection (Application)
+        0x85, 0x01,        # .Report ID (1)
+        0x09, 0x38,        # .Usage (Wheel)
+        0x15, 0x81,        # .Logical Minimum (-127)
+        0x25, 0x7f,        # .Logical Maximum (127)
+        0x75, 0x08,        # .Report Size (8)
+        0x95, 0x01,        # .Report Count (1)
+        0x81, 0x06,        # .Input (Data,Var,Rel)
+        0xc0,              # End Collection
+        0x06, 0x00, 0xff,  # Usage Page (Vendor Defined Page 1)
+        0x09, 0x01,        # Usage (Vendor Usage 1)
+        0xa1, 0x01,        # Collection (Application)
+        0x85, 0x02,        # .Report ID (2)
+        0x09, 0x02,        # .Usage (Vendor Usage 2)
+        0x15, 0x00,        # .Logical Minimum (0)
+        0x26, 0xff, 0x00,  # .Logical Maximum (255)
+        0x75, 0x08,        # .Report Size (8)
+        0x95, 0x04,        # .Report Count (4)
+        0x81, 0x02,        # .Input (Data,Var,Abs)
+        0xc0,              # End Collection
+    ]
+
+    def test_report_ids(self):
+        table, sizes = ReportFilter(report_ids=[1, 3], exclude_report_ids=[3]).compile(None)
+        self.assertEqual([i for i in range(256) if table[i]], [1])
+        self.assertIsNone(sizes)
+
+        table, sizes = ReportFilter(sizes=[2]).compile(None)
+        self.assertTrue(all(table))
+        self.assertEqual(sizes, {2})
+
+    def test_predicate(self):
+        device = self.Device(self.composite)
+        f = ReportFilter(predicate=lambda r: not ReportFilter.is_vendor_report(r))
+        table, sizes = f.compile(device)
+        self.assertTrue(table[1])
+        self.assertFalse(table[2])
+        # undeclared reports are kept
+        self.assertTrue(table[3])
+
+    # a mouse without report IDs, the first byte is the button mask
+    unnumbered = [
+        0x05, 0x01,        # Usage Page (Generic Desktop)
+        0x09, 0x02,        # Usage (Mouse)
+        0xa1, 0x01,        # Collection (Application)
+        0x05, 0x09,        # .Usage Page (Button)
+        0x19, 0x01,        # .Usage Minimum (1)
+        0x29, 0x08,        # .Usage Maximum (8)
+        0x15, 0x00,        # .Logical Minimum (0)
+        0x25, 0x01,        # .Logical Maximum (1)
+        0x75, 0x01,        # .Report Size (1)
+        0x95, 0x08,        # .Report Count (8)
+        0x81, 0x02,        # .Input (Data,Var,Abs)
+        0xc0,              # End Collection
+    ]
+
+    def test_unnumbered(self):
+        device = self.Device(self.unnumbered)
+        device.name = 'Some Mouse'
+        for f in (ReportFilter(report_ids=[1]), ReportFilter(exclude_report_ids=[1])):
+            with self.assertRaises(ValueError):
+                f.compile(device)
+
+        table, sizes = ReportFilter(sizes=[1]).compile(device)
+        self.assertTrue(all(table))
+        self.assertEqual(sizes, {1})
+
+        table, sizes = ReportFilter(predicate=ReportFilter.is_vendor_report).compile(device)
+        self.assertFalse(any(table))
+
+    def test_read_events(self):
+        fake = FakeHidraw(self, nonblocking=True, report_filter=ReportFilter(report_ids=[2]))
+        fake.send([1, 0x01], [2, 1, 2, 3, 4], [1, 0x02])
+        self.assertEqual(fake.device.read_events(), (0, 1))
+        self.assertEqual(fake.device.events[0].bytes, b'\x02\x01\x02\x03\x04')
+        self.assertEqual(fake.device.stats.filtered, 2)
+
+        fake.device.report_filter = ReportFilter(sizes=[2])
+        fake.send([1, 0x01], [2, 1, 2, 3, 4])
+        self.assertEqual(fake.device.read_events(), (1, 1))
+        self.assertEqual(fake.device.events[1].bytes, b'\x01\x01')
+
+
+class FakeHidraw(object):
+    """
+    A :class:`HidrawDevice` reading from one end of a
+    :func:`socket.socketpair`, with the hidraw ioctls patched. Like hidraw,
+    a ``SOCK_SEQPACKET`` socket returns one report per read. Write the
+    reports to :attr:`peer`.
+    """
+    # a mouse wheel with report ID 1 and a vendor collection with report ID 2
+    rdesc = bytes(TestReportFilter.composite)
+
+    def __init__(self, testcase, name='Fake Mouse', **kwargs):
+        self.socket, self.peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        testcase.addCleanup(self.socket.close)
+        testcase.addCleanup(self.peer.close)
+        with unittest.mock.patch.multiple('hidtools.hidraw',
+                                          _HIDIOCGRAWNAME=lambda fd: name,
+                                          _HIDIOCGRAWINFO=lambda fd: (3, 0x1234, 0x5678),
+                                          _HIDIOCGRDESCSIZE=lambda fd: len(self.rdesc),
+                                          _HIDIOCGRDESC=lambda fd, size: (size, self.rdesc)):
+            self.device = HidrawDevice(self.socket, **kwargs)
+
+    def send(self, *reports):
+        for report in reports:
+            self.peer.send(bytes(report))
+
+
+class TestHidrawDeviceRead(unittest.TestCase):
+    reports = [[1, i] for i in range(5)]
+
+    def test_drain(self):
+        fake = FakeHidraw(self, nonblocking=True)
+        fake.send(*self.reports)
+        # all pending reports in one call, then EAGAIN
+        self.assertEqual(fake.device.read_events(), (0, 5))
+        self.assertEqual([list(e.bytes) for e in fake.device.events], self.reports)
+        self.assertEqual(fake.device.read_events(), (5, 0))
+        self.assertEqual(fake.device.stats.reads, 1)
+        self.assertEqual(fake.device.stats.max_batch, 5)
+
+        timestamps = [e.timestamp for e in fake.device.events]
+        self.assertEqual(timestamps[0], 0)
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_max_batch(self):
+        fake = FakeHidraw(self, nonblocking=True)
+        fake.send(*self.reports)
+        self.assertEqual(fake.device.read_events(max_batch=2), (0, 2))
+        self.assertEqual(fake.device.read_events(max_batch=2), (2, 2))
+        self.assertEqual(fake.device.read_events(max_batch=2), (4, 1))
+        self.assertEqual(fake.device.read_events(max_batch=2), (5, 0))
+        self.assertEqual([list(e.bytes) for e in fake.device.events], self.reports)
+        self.assertEqual(fake.device.stats.max_batch, 2)
+
+    def test_buffer_reuse(self):
+        # the reports are read into one reusable buffer, the events must
+        # not alias it
+        fake = FakeHidraw(self)
+        fake.send([2, 1, 2, 3, 4])
+        self.assertEqual(fake.device.read_events(), (0, 1))
+        first = fake.device.events[0].bytes
+        self.assertIsInstance(first, bytes)
+
+        fake.send([1, 0xff])
+        self.assertEqual(fake.device.read_events(), (1, 1))
+        self.assertEqual(first, b'\x02\x01\x02\x03\x04')
+        self.assertEqual(fake.device.events[0].bytes, b'\x02\x01\x02\x03\x04')
+        self.assertEqual(fake.device.events[1].bytes, b'\x01\xff')
+
+    def test_dump(self):
+        fake = FakeHidraw(self, nonblocking=True)
+        fake.send([1, 0x05], [2, 1, 2, 3, 4])
+        fake.device.read_events()
+        for e in fake.device.events:
+            self.assertIsInstance(e.timestamp, int)
+        self.assertEqual(fake.device.events[0].timestamp, 0)
+
+        # an offset set before reading, as shared by the recorder
+        fake.device.time_offset = time.monotonic_ns() - 1500000000
+        fake.send([1, 0x06])
+        fake.device.read_events()
+        self.assertGreaterEqual(fake.device.events[2].timestamp, 1500000000)
+
+        out = io.StringIO()
+        fake.device.dump(out)
+        lines = out.getvalue().splitlines()
+        self.assertIn('N: Fake Mouse', lines)
+        self.assertIn('I: 3 1234 5678', lines)
+        events = [line for line in lines if line.startswith('E:')]
+        self.assertEqual(len(events), 3)
+        for line, e, data in zip(events, fake.device.events, ('2 01 05', '5 02 01 02 03 04', '2 01 06')):
+            self.assertRegex(line, r'^E: \d{6}\.\d{9} ')
+            sec, nsec = line.split()[1].split('.')
+            self.assertEqual(int(sec) * 1000000000 + int(nsec), e.timestamp)
+            self.assertTrue(line.endswith(f' {data}'))
+
+        # only the new events on the next call
+        out = io.StringIO()
+        fake.device.dump(out)
+        self.assertEqual(out.getvalue(), '')
+
+    def test_blocking(self):
+        fake = FakeHidraw(self)
+        fake.send(*self.reports[:2])
+        # one report per call in blocking mode
+        self.assertEqual(fake.device.read_events(), (0, 1))
+        self.assertEqual(fake.device.read_events(), (1, 1))
+        fake.peer.close()
+        self.assertEqual(fake.device.read_events(), (2, 0))
+
+
+class TestHidrawDeviceAsync(unittest.TestCase):
+    def test_aiter_events(self):
+        fake = FakeHidraw(self)
+        fd = fake.socket.fileno()
+
+        async def iterate():
+            loop = asyncio.get_running_loop()
+            loop.call_soon(fake.send, [1, 0xff], [2, 1, 2, 3, 4])
+            loop.call_later(0.01, fake.send, [1, 0x01])
+            events = []
+            gen = fake.device.aiter_events(decode=True)
+            async for event, values in gen:
+                self.assertFalse(os.get_blocking(fd))
+                events.append((event.bytes, values))
+                if len(events) == 3:
+                    break
+            await gen.aclose()
+            # the reader was unregistered
+            self.assertFalse(loop.remove_reader(fd))
+            return events
+
+        events = asyncio.run(iterate())
+        self.assertEqual([e[0] for e in events], [b'\x01\xff', b'\x02\x01\x02\x03\x04', b'\x01\x01'])
+        (report, values), (vendor_report, vendor_values) = events[0][1], events[1][1]
+        self.assertEqual((report.report_ID, values), (1, [[-1]]))
+        self.assertEqual((vendor_report.report_ID, vendor_values), (2, [[1], [2], [3], [4]]))
+        self.assertTrue(os.get_blocking(fd))
+        self.assertEqual(len(fake.device.events), 3)
+
+    def test_aiter_events_cancel(self):
+        fake = FakeHidraw(self)
+        fd = fake.socket.fileno()
+
+        async def iterate(events):
+            async for event in fake.device.aiter_events():
+                events.append(event.bytes)
+
+        async def cancel():
+            loop = asyncio.get_running_loop()
+            events = []
+            task = asyncio.ensure_future(iterate(events))
+            fake.send([1, 0x01])
+            while not events:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertFalse(loop.remove_reader(fd))
+            return events
+
+        self.assertEqual(asyncio.run(cancel()), [b'\x01\x01'])
+        self.assertTrue(os.get_blocking(fd))
+
+    def test_aiter_events_eof(self):
+        fake = FakeHidraw(self)
+        fake.send([1, 0x01], [1, 0x02])
+        fake.peer.close()
+
+        async def iterate():
+            return [event.bytes async for event in fake.device.aiter_events()]
+
+        self.assertEqual(asyncio.run(asyncio.wait_for(iterate(), 5)), [b'\x01\x01', b'\x01\x02'])
@@ -0,0 +1,283 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import io
+import os
+import tempfile
+import unittest
+from hidtools.recording import (BinaryRecordingReader, TextRecordingReader,
+                                convert, open_file, open_recording,
+                                parse_timestamp, format_timestamp,
+                                indexed_path, index_path, is_binary_path, build_index,
+                                load_index, events_in_window, Recording,
+                                merge_recordings, split_recording)
+
+import logging
+logger = logging.getLogger('hidtools.test.recording')
+
+
+class TestRecording(unittest.TestCase):
+    recording = '''D: 0
+# a comment
+R: 16 06 00 ff 09 01 a1 01 75 08 95 02 09 02 81 02 c0
+N: Vendor Device
+P: usb-0000:00:14.0-1/input0
+I: 3 046d c52b
+D: 1
+R: 16 06 00 ff 09 01 a1 01 75 08 95 02 09 02 81 02 c0
+N: Other Device
+I: 5 0001 0002
+D: 0
+E: 000000.000000 2 01 02
+E: 000000.001500 2 03 04
+D: 1
+E: 000001.000000500 2 05 06
+'''
+    events = [
+        (0, 0, b'\x01\x02'),
+        (0, 1500000, b'\x03\x04'),
+        (1, 1000000500, b'\x05\x06'),
+    ]
+
+    def check_recording(self, reader):
+        self.assertEqual(sorted(reader.devices), [0, 1])
+        d = reader.devices[0]
+        self.assertEqual(d.name, 'Vendor Device')
+        self.assertEqual(d.phys, 'usb-0000:00:14.0-1/input0')
+        self.assertEqual((d.bustype, d.vendor_id, d.product_id), (3, 0x046d, 0xc52b))
+        self.assertEqual(d.rdesc[:3], b'\x06\x00\xff')
+        self.assertEqual(len(d.rdesc), 16)
+        self.assertIsNone(reader.devices[1].phys)
+        self.assertEqual(list(reader.events()), self.events)
+
+    def test_timestamps(self):
+        self.assertEqual(parse_timestamp('000012.000034'), 12000034000)
+        self.assertEqual(parse_timestamp('000012.000034005'), 12000034005)
+        self.assertEqual(format_timestamp(12000034005), '000012.000034005')
+
+    def test_text(self):
+        self.check_recording(TextRecordingReader(io.StringIO(self.recording)))
+
+    def test_roundtrip(self):
+        binary = io.BytesIO()
+        convert(TextRecordingReader(io.StringIO(self.recording)), binary, True)
+        binary.seek(0)
+        reader = open_recording(io.BufferedReader(binary))
+        self.assertIsInstance(reader, BinaryRecordingReader)
+        self.check_recording(reader)
+
+        binary.seek(0)
+        text = io.StringIO()
+        convert(open_recording(io.BufferedReader(binary)), text, False)
+        self.check_recording(TextRecordingReader(io.StringIO(text.getvalue())))
+
+    def test_origin(self):
+        recording = 'T: 1571212345.000000500\n' + self.recording
+        reader = TextRecordingReader(io.StringIO(recording))
+        self.assertEqual(reader.origin, 1571212345000000500)
+        self.check_recording(reader)
+        self.assertIsNone(TextRecordingReader(io.StringIO(self.recording)).origin)
+
+        for binary in (False, True):
+            out = io.BytesIO() if binary else io.StringIO()
+            convert(TextRecordingReader(io.StringIO(recording)), out, binary)
+            out.seek(0)
+            reader = BinaryRecordingReader(out) if binary else TextRecordingReader(out)
+            self.assertEqual(reader.origin, 1571212345000000500)
+            self.check_recording(reader)
+
+        # version 1 binary recordings have no origin
+        reader = BinaryRecordingReader(io.BytesIO(b'HIDR\x01\x00\x00\x00'))
+        self.assertEqual(reader.devices, {})
+        self.assertIsNone(reader.origin)
+
+    def test_compressed(self):
+        self.assertTrue(is_binary_path('foo.hidb.xz'))
+        self.assertFalse(is_binary_path('foo.hid.gz'))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ('rec.hid.gz', 'rec.hidb.xz', 'rec.hidb.bz2'):
+                path = os.path.join(tmpdir, name)
+                binary = is_binary_path(path)
+                with open_file(path, 'wb' if binary else 'w') as f:
+                    convert(TextRecordingReader(io.StringIO(self.recording)), f, binary)
+                with open(path, 'rb') as f:
+                    self.assertNotIn(b'Vendor Device', f.read())
+                with open_recording(path) as reader:
+                    self.check_recording(reader)
+
+    def test_indexed_path(self):
+        self.assertEqual(indexed_path('rec.hid', 0), 'rec.0.hid')
+        self.assertEqual(indexed_path('a/rec.hidb.xz', 1), 'a/rec.1.hidb.xz')
+        self.assertEqual(indexed_path('a.b/rec', 2), 'a.b/rec.2')
+
+    def test_index(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ('rec.hid', 'rec.hidb'):
+                path = os.path.join(tmpdir, name)
+                binary = is_binary_path(path)
+                with open_file(path, 'wb' if binary else 'w') as f:
+                    convert(TextRecordingReader(io.StringIO(self.recording)), f, binary)
+
+                self.assertIsNone(load_index(path))
+                build_index(path, stride=2)
+                index = load_index(path)
+                self.assertEqual(len(index), 2)
+                self.assertEqual(index.lookup_event(1).event, 0)
+                # the last entry strictly before the timestamp
+                self.assertEqual(index.lookup_time(1000000500).event, 0)
+                entry = index.lookup_time(1000000501)
+                self.assertEqual((entry.event, entry.timestamp, entry.device_index), (2, 1000000500, 1))
+                self.assertIsNone(index.lookup_time(0))
+
+                for start, end in ((None, None), (1, None), (1500000, 1000000500), (1000000500, None)):
+                    expected = [e for e in self.events
+                                if (start is None or e[1] >= start) and (end is None or e[1] < end)]
+                    with open_recording(path) as reader:
+                        self.assertEqual(list(events_in_window(reader, start, end, index)), expected)
+
+                # an empty, truncated or corrupt index is ignored
+                with open(index_path(path), 'rb') as f:
+                    data = f.read()
+                for corrupt in (b'', data[:10], data[:-1], b'XXXX' + data[4:]):
+                    with open(index_path(path), 'wb') as f:
+                        f.write(corrupt)
+                    self.assertIsNone(load_index(path))
+                build_index(path, stride=2)
+                self.assertEqual(len(load_index(path)), 2)
+                self.assertFalse(os.path.exists(index_path(path) + '.tmp'))
+
+                # a failure to create the index is not hidden by the cleanup
+                missing = os.path.join(tmpdir, 'missing', 'rec.hid.idx')
+                with self.assertRaises(FileNotFoundError) as cm:
+                    load_index(path).save(missing)
+                self.assertIsNone(cm.exception.__context__)
+
+                # an outdated index is ignored
+                with open(path, 'ab') as f:
+                    f.write(b'\n')
+                self.assertIsNone(load_index(path))
+
+    def test_mmap_recording(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ('rec.hid', 'rec.hidb', 'rec.hid.xz', 'rec.hidb.gz'):
+                path = os.path.join(tmpdir, name)
+                binary = is_binary_path(path)
+                with open_file(path, 'wb' if binary else 'w') as f:
+                    convert(TextRecordingReader(io.StringIO(self.recording)), f, binary)
+                if name == 'rec.hid':
+                    build_index(path, stride=2)
+
+                with Recording(path) as recording:
+                    self.assertEqual(recording.binary, binary)
+                    self.assertEqual(recording.index is not None, name == 'rec.hid')
+                    self.check_recording(recording)
+                    self.assertEqual(list(recording), self.events)
+                    self.assertEqual(list(recording[1500000:]), self.events[1:])
+                    self.assertEqual(list(recording[:1500000]), self.events[:1])
+                    self.assertEqual(list(recording[1:][:1000000500]), self.events[1:2])
+                    self.assertEqual(list(recording[1000000501:]), [])
+                    self.assertEqual(sorted(recording[1:].devices), [0, 1])
+
+    def test_stream_recording(self):
+        for binary in (False, True):
+            with self.subTest(binary=binary):
+                out = io.BytesIO() if binary else io.StringIO()
+                convert(TextRecordingReader(io.StringIO(self.recording)), out, binary)
+                data = out.getvalue() if binary else out.getvalue().encode('utf-8')
+                # everything up to the end of the first event
+                first = data.index(b'\x01\x02') + 2 if binary else data.index(b' 01 02\n') + 7
+
+                r, w = os.pipe()
+                self.addCleanup(os.close, r)
+                with open(w, 'wb', buffering=0) as f:
+                    f.write(data[:first])
+                    with Recording(f'/dev/fd/{r}') as recording:
+                        self.assertEqual(recording.binary, binary)
+                        self.assertIsNone(recording.index)
+                        self.assertEqual(recording.devices[1].name, 'Other Device')
+                        # the first event is available while the pipe is
+                        # still open
+                        events = recording[:1000000500].events()
+                        self.assertEqual(next(events), self.events[0])
+                        f.write(data[first:])
+                        f.close()
+                        self.assertEqual(list(events), self.events[1:2])
+
+    def test_merge_split(self):
+        for binary in (False, True):
+            files = {0: io.BytesIO() if binary else io.StringIO(),
+                     1: io.BytesIO() if binary else io.StringIO()}
+            split_recording(TextRecordingReader(io.StringIO(self.recording)), files, binary)
+
+            readers = []
+            for idx, f in files.items():
+                f.seek(0)
+                reader = BinaryRecordingReader(f) if binary else TextRecordingReader(f)
+                self.assertEqual(list(reader.devices), [0])
+                readers.append(reader)
+            self.assertEqual(readers[0].devices[0].name, 'Vendor Device')
+            self.assertEqual(readers[1].devices[0].name, 'Other Device')
+
+            # the second device first, so the merge has to reorder
+            out = io.BytesIO() if binary else io.StringIO()
+            merge_recordings(readers[::-1], out, binary)
+            out.seek(0)
+            reader = BinaryRecordingReader(out) if binary else TextRecordingReader(out)
+            self.assertEqual(reader.devices[0].name, 'Other Device')
+            self.assertEqual(list(reader.events()),
+                             [(1 - idx, timestamp, data) for idx, timestamp, data in self.events])
+
+    def test_merge_origin(self):
+        first = '''T: 000100.000000000
+R: 16 06 00 ff 09 01 a1 01 75 08 95 02 09 02 81 02 c0
+N: First Device
+I: 3 0001 0001
+E: 000000.000000 2 01 02
+E: 000002.000000 2 03 04
+'''
+        second = '''T: 000101.000000000
+R: 16 06 00 ff 09 01 a1 01 75 08 95 02 09 02 81 02 c0
+N: Second Device
+I: 3 0001 0002
+E: 000000.000000 2 05 06
+E: 000000.500000 2 07 08
+'''
+        for binary in (False, True):
+            # the second recording started a second later
+            out = io.BytesIO() if binary else io.StringIO()
+            merge_recordings([TextRecordingReader(io.StringIO(second)),
+                              TextRecordingReader(io.StringIO(first))], out, binary)
+            out.seek(0)
+            reader = BinaryRecordingReader(out) if binary else TextRecordingReader(out)
+            self.assertEqual(reader.origin, 100000000000)
+            self.assertEqual(list(reader.events()),
+                             [(1, 0, b'\x01\x02'),
+                              (0, 1000000000, b'\x05\x06'),
+                              (0, 1500000000, b'\x07\x08'),
+                              (1, 2000000000, b'\x03\x04')])
+
+        # without an origin the timestamps are merged as they are
+        out = io.StringIO()
+        merge_recordings([TextRecordingReader(io.StringIO(second.split('\n', 1)[1])),
+                          TextRecordingReader(io.StringIO(first))], out, False)
+        out.seek(0)
+        reader = TextRecordingReader(out)
+        self.assertIsNone(reader.origin)
+        self.assertEqual([e[1] for e in reader.events()], [0, 0, 500000000, 2000000000])
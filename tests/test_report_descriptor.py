@@ -0,0 +1,346 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import unittest
+from hidtools.hid import ReportDescriptor, RangeError, HidMultitouchDecoder, HidReport
+
+import logging
+logger = logging.getLogger('hidtools.test.report_descriptor')
+
+
+class MouseData(object):
+    pass
+
+
+class TestReportCodec(unittest.TestCase):
+    # 3 buttons + 5 bits padding, then 16-bit X/Y and an 8-bit wheel
+    report_descriptor = [
+        0x05, 0x01,        # Usage Page (Generic Desktop)
+        0x09, 0x02,        # Usage (Mouse)
+        0xa1, 0x01,        # Collection (Application)
+        0x85, 0x02,        # .Report ID (2)
+        0x09, 0x01,        # .Usage (Pointer)
+        0xa1, 0x00,        # .Collection (Physical)
+        0x05, 0x09,        # ..Usage Page (Button)
+        0x19, 0x01,        # ..Usage Minimum (1)
+        0x29, 0x03,        # ..Usage Maximum (3)
+        0x15, 0x00,        # ..Logical Minimum (0)
+        0x25, 0x01,        # ..Logical Maximum (1)
+        0x75, 0x01,        # ..Report Size (1)
+        0x95, 0x03,        # ..Report Count (3)
+        0x81, 0x02,        # ..Input (Data,Var,Abs)
+        0x75, 0x05,        # ..Report Size (5)
+        0x95, 0x01,        # ..Report Count (1)
+        0x81, 0x03,        # ..Input (Cnst,Var,Abs)
+        0x05, 0x01,        # ..Usage Page (Generic Desktop)
+        0x09, 0x30,        # ..Usage (X)
+        0x09, 0x31,        # ..Usage (Y)
+        0x16, 0x01, 0x80,  # ..Logical Minimum (-32767)
+        0x26, 0xff, 0x7f,  # ..Logical Maximum (32767)
+        0x75, 0x10,        # ..Report Size (16)
+        0x95, 0x02,        # ..Report Count (2)
+        0x81, 0x06,        # ..Input (Data,Var,Rel)
+        0x09, 0x38,        # ..Usage (Wheel)
+        0x15, 0x81,        # ..Logical Minimum (-127)
+        0x25, 0x7f,        # ..Logical Maximum (127)
+        0x75, 0x08,        # ..Report Size (8)
+        0x95, 0x01,        # ..Report Count (1)
+        0x81, 0x06,        # ..Input (Data,Var,Rel)
+        0xc0,              # .End Collection
+        0xc0,              # End Collection
+    ]
+
+    def setUp(self):
+        self.rdesc = ReportDescriptor.from_bytes(self.report_descriptor)
+        self.report = self.rdesc.input_reports[2]
+
+    def test_struct_layout(self):
+        self.report._compile()
+        # report ID and the button byte are skipped, X, Y, Wheel are packed
+        self.assertEqual(self.report._struct.format, '<2x1h1h1b')
+        self.assertEqual(self.report._struct_slots, [None, None, None, None, 0, 1, 2])
+
+    def test_get_values(self):
+        data = [0x02, 0x05, 0x34, 0x12, 0xfe, 0xff, 0x81]
+        values = self.report.get_values(bytes(data))
+        self.assertEqual(values, [[1], [0], [1], None, [0x1234], [-2], [-127]])
+        # the fast path must match the bit extraction
+        for field, v in zip(self.report.fields, values):
+            if v is not None:
+                self.assertEqual(v, field.get_values(data))
+
+    def test_from_bytes_cached(self):
+        rdesc = ReportDescriptor.from_bytes_cached(bytes(self.report_descriptor))
+        self.assertIs(ReportDescriptor.from_bytes_cached(self.report_descriptor), rdesc)
+        self.assertIsNot(ReportDescriptor.from_bytes(self.report_descriptor), rdesc)
+        self.assertEqual(rdesc.bytes, self.rdesc.bytes)
+
+    def test_fill_values(self):
+        values = [[1], [1], [0], None, [-300], [300], [5]]
+        report = bytearray(self.report.size)
+        self.report.fill_values(report, values)
+        self.assertEqual(self.report.get_values(report), values)
+
+        as_list = [0] * self.report.size
+        as_list[0] = 2
+        self.report.fill_values(as_list, values)
+        self.assertEqual(list(report), as_list)
+
+    def test_fill_values_range(self):
+        values = [[1], [1], [0], None, [0], [0], [-128]]
+        with self.assertRaises(RangeError):
+            self.report.fill_values(bytearray(self.report.size), values)
+
+    def test_create_report(self):
+        mouse = MouseData()
+        mouse.b1, mouse.b2, mouse.b3 = 1, 0, 1
+        mouse.x, mouse.y = 1000, -1000
+        mouse.wheel = -1
+        r = self.rdesc.create_report(mouse, reportID=2)
+        self.assertEqual(r, [0x02, 0x05, 0xe8, 0x03, 0x18, 0xfc, 0xff])
+
+
+class TestCollections(unittest.TestCase):
+    finger = '''
+        Usage Page (Digitizers)
+        Usage (Finger)
+        Collection (Logical)
+         Report Size (1)
+         Report Count (1)
+         Logical Minimum (0)
+         Logical Maximum (1)
+         Usage (Tip Switch)
+         Input (Data,Var,Abs)
+         Report Size (7)
+         Input (Cnst,Var,Abs)
+         Report Size (8)
+         Logical Maximum (255)
+         Usage (Contact Id)
+         Input (Data,Var,Abs)
+         Report Size (16)
+         Logical Maximum (4095)
+         Usage Page (Generic Desktop)
+         Usage (X)
+         Input (Data,Var,Abs)
+         Usage (Y)
+         Input (Data,Var,Abs)
+        End Collection
+    '''
+    report_descriptor = f'''
+        Usage Page (Digitizers)
+        Usage (Touch Screen)
+        Collection (Application)
+         Report ID (1)
+         {finger * 2}
+         Usage Page (Digitizers)
+         Report Size (8)
+         Logical Maximum (255)
+         Usage (Contact Count)
+         Input (Data,Var,Abs)
+        End Collection
+    '''
+
+    def setUp(self):
+        self.rdesc = ReportDescriptor.from_human_descr(self.report_descriptor)
+
+    def test_tree(self):
+        collections = self.rdesc.collections
+        self.assertEqual(len(collections), 3)
+        app, f1, f2 = collections
+        self.assertIsNone(app.parent)
+        self.assertEqual(app.type, 'APPLICATION')
+        self.assertEqual(app.usage_name, 'Touch Screen')
+        self.assertEqual(app.children, [f1, f2])
+        self.assertEqual([c.index for c in collections], [0, 1, 2])
+        for f in (f1, f2):
+            self.assertEqual(f.type, 'LOGICAL')
+            self.assertEqual(f.usage_name, 'Finger')
+            self.assertIs(f.parent, app)
+            self.assertIs(f.application, app)
+            self.assertEqual([x.usage_name for x in f.fields if not x.is_const],
+                             ['Tip Switch', 'Contact Id', 'X', 'Y'])
+        self.assertEqual([f.usage_name for f in app.fields], ['Contact Count'])
+
+        for field in self.rdesc.input_reports[1]:
+            self.assertIn(field, field.collection_node.fields)
+
+    def test_get_collections(self):
+        fingers = self.rdesc.get_collections('Finger')
+        self.assertEqual(fingers, self.rdesc.collections[1:])
+        self.assertEqual(self.rdesc.get_collections(0x000d0022), fingers)
+        self.assertEqual(self.rdesc.get_collections('Stylus'), [])
+
+    def test_get_report_from_application(self):
+        report = self.rdesc.input_reports[1]
+        self.assertIs(self.rdesc.get_report_from_application('Touch Screen'), report)
+        self.assertIs(self.rdesc.get_report_from_application(0x000d0004), report)
+        self.assertIsNone(self.rdesc.get_report_from_application('Mouse'))
+
+    def test_contacts(self):
+        touches = []
+        for i in range(2):
+            t = MouseData()
+            t.tipswitch = 1
+            t.contactid = i
+            t.x, t.y = 100 * (i + 1), 200 * (i + 1)
+            touches.append(t)
+        g = MouseData()
+        g.contactcount = 2
+        r = self.rdesc.create_report(touches, g, reportID=1)
+        self.assertEqual(touches, [])
+        self.assertEqual(r, [1,
+                             1, 0, 100, 0, 200, 0,
+                             1, 1, 200, 0, 144, 1,
+                             2])
+        output = self.rdesc.format_report(r)
+        self.assertEqual(len(output.split('\n')), 2)
+
+    def test_fill_values_contact_id(self):
+        # Contact Id is exempt from the range check, negative values are
+        # written as two's complement
+        report = self.rdesc.input_reports[1]
+        values = [[1], None, [-1], [100], [200], [0], None, [-2], [0], [0], [2]]
+        data = bytearray(report.size)
+        report.fill_values(data, values)
+        self.assertEqual(list(data), [1,
+                                      1, 0xff, 100, 0, 200, 0,
+                                      0, 0xfe, 0, 0, 0, 0,
+                                      2])
+        as_list = [0] * report.size
+        as_list[0] = 1
+        report.fill_values(as_list, values)
+        self.assertEqual(list(data), as_list)
+
+        values[2] = [256]
+        with self.assertRaises(Exception):
+            report.fill_values(bytearray(report.size), values)
+
+    def test_multitouch_decoder(self):
+        report = self.rdesc.input_reports[1]
+        decoder = HidMultitouchDecoder(report)
+        self.assertEqual(decoder.slots, self.rdesc.collections[1:])
+        self.assertEqual(decoder.usages, ['Tip Switch', 'Contact Id', 'X', 'Y'])
+
+        data = bytes([1,
+                      1, 3, 100, 0, 200, 0,
+                      0, 4, 200, 0, 144, 1,
+                      1])
+        contact_count, scan_time, slots = decoder.decode(data)
+        self.assertEqual(contact_count, 1)
+        self.assertIsNone(scan_time)
+        self.assertEqual(slots, [[1, 3, 100, 200], [0, 4, 200, 400]])
+
+    def test_multitouch_decoder_multiple_values(self):
+        # a field with one value each for X and Y, as the parser splits
+        # Variable items into one field per value
+        fields = []
+        for f in self.rdesc.input_reports[1].fields:
+            if f.usage_name == 'Y':
+                continue
+            f = f.copy()
+            if f.usage_name == 'X':
+                f.count = 2
+                f.usages = [0x00010030, 0x00010031]
+            fields.append(f)
+        report = HidReport(1, self.rdesc.input_reports[1].application)
+        report.extend(fields)
+
+        decoder = HidMultitouchDecoder(report)
+        self.assertEqual(decoder.usages, ['Tip Switch', 'Contact Id', 'X', 'Y'])
+        data = bytes([1,
+                      1, 3, 100, 0, 200, 0,
+                      0, 4, 200, 0, 144, 1,
+                      1])
+        self.assertEqual(decoder.decode(data)[2], [[1, 3, 100, 200], [0, 4, 200, 400]])
+
+
+class TestFindFields(unittest.TestCase):
+    def setUp(self):
+        self.rdesc = ReportDescriptor.from_bytes(TestReportCodec.report_descriptor)
+
+    def test_find_fields(self):
+        self.assertEqual(self.rdesc.find_fields('Wheel'), [('Input', 2, 48, 8, 6)])
+        self.assertEqual(self.rdesc.find_fields(0x00010030), [('Input', 2, 16, 16, 4)])
+        self.assertEqual(self.rdesc.find_fields('B2'), [('Input', 2, 9, 1, 1)])
+        self.assertEqual(self.rdesc.find_fields('Resolution Multiplier'), [])
+
+    def test_find_fields_array(self):
+        rdesc = ReportDescriptor.from_human_descr('''
+            Usage Page (Generic Desktop)
+            Usage (Keyboard)
+            Collection (Application)
+             Usage Page (Keyboard)
+             Usage Minimum (0)
+             Usage Maximum (101)
+             Logical Minimum (0)
+             Logical Maximum (101)
+             Report Size (8)
+             Report Count (6)
+             Input (Data,Arr,Abs)
+            End Collection
+        ''')
+        self.assertEqual(rdesc.find_fields('a and A'), [('Input', -1, 0, 8, 0)])
+
+
+class TestReportTypes(unittest.TestCase):
+    report_descriptor = '''
+        Usage Page (Generic Desktop)
+        Usage (Mouse)
+        Collection (Application)
+         Report ID (1)
+         Usage (Pointer)
+         Collection (Physical)
+          Usage (Wheel)
+          Logical Minimum (-127)
+          Logical Maximum (127)
+          Report Size (8)
+          Report Count (1)
+          Input (Data,Var,Rel)
+         End Collection
+         Report ID (1)
+         Usage (Resolution Multiplier)
+         Logical Minimum (0)
+         Logical Maximum (3)
+         Report Size (2)
+         Feature (Data,Var,Abs)
+         Report Size (6)
+         Feature (Cnst,Var,Abs)
+        End Collection
+    '''
+
+    def setUp(self):
+        self.rdesc = ReportDescriptor.from_human_descr(self.report_descriptor)
+
+    def test_dispatch(self):
+        self.assertIs(self.rdesc.reports['Input'], self.rdesc.input_reports)
+        self.assertIs(self.rdesc.reports['Feature'], self.rdesc.feature_reports)
+        self.assertIs(self.rdesc.reports['Output'], self.rdesc.output_reports)
+        self.assertIsNot(self.rdesc.get(1, 2), self.rdesc.get(1, 2, 'Feature'))
+        self.assertIsNone(self.rdesc.get(1, 2, 'Output'))
+
+    def test_feature_report(self):
+        data = MouseData()
+        data.resolutionmultiplier = 2
+        r = self.rdesc.create_report(data, reportID=1, type='Feature')
+        self.assertEqual(r, [0x01, 0x02])
+
+        report, values = self.rdesc.get_values(bytes([0x01, 0x03]), 'Feature')
+        self.assertIs(report, self.rdesc.feature_reports[1])
+        self.assertEqual(values, [[3], None])
+        self.assertIn('Resolution Multiplier:  3', self.rdesc.format_report([0x01, 0x03], type='Feature'))
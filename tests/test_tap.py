@@ -0,0 +1,108 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2019 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import unittest
+from hidtools.hidraw import HidrawEvent
+from hidtools.recording import RecordingDevice
+from hidtools.tap import EventTap, EventTapReader, _COMMIT
+
+import logging
+logger = logging.getLogger('hidtools.test.tap')
+
+
+class TestEventTap(unittest.TestCase):
+    devices = [
+        RecordingDevice('Vendor Device', 3, 0x046d, 0xc52b, b'\x06\x00\xff', 'usb-0000:00:14.0-1/input0'),
+        RecordingDevice('Other Device', 5, 0x0001, 0x0002, b'\x05\x01'),
+    ]
+
+    def test_readers(self):
+        with EventTap(self.devices, origin=1571212345000000000) as tap:
+            tap.write(0, [HidrawEvent(0, b'\x01')])
+            with EventTapReader(tap.name) as first, EventTapReader(tap.name) as second:
+                self.assertEqual(first.origin, 1571212345000000000)
+                self.assertEqual(first.devices[0].name, 'Vendor Device')
+                self.assertEqual(first.devices[0].phys, 'usb-0000:00:14.0-1/input0')
+                self.assertEqual(first.devices[1].rdesc, b'\x05\x01')
+
+                # readers only see the events published after they attached
+                self.assertEqual(first.read_events(), [])
+                tap.write(1, [HidrawEvent(1000, b'\x02\x03'), HidrawEvent(2000, b'\x04')])
+                tap.write(0, [HidrawEvent(3000, b'\x05')])
+                events = [(1, 1000, b'\x02\x03'), (1, 2000, b'\x04'), (0, 3000, b'\x05')]
+                self.assertEqual(first.read_events(max_events=1), events[:1])
+                self.assertEqual(first.read_events(), events[1:])
+                self.assertEqual(second.read_events(), events)
+                self.assertEqual(first.read_events(), [])
+                self.assertFalse(first.closed)
+
+                tap.close()
+                self.assertTrue(first.closed)
+                self.assertEqual(list(first), [])
+                self.assertEqual((first.dropped, second.dropped), (0, 0))
+
+        with self.assertRaises(FileNotFoundError):
+            EventTapReader(tap.name)
+
+    def test_overrun(self):
+        with EventTap(self.devices, capacity=256) as tap:
+            with EventTapReader(tap.name) as reader:
+                # the events wrap around the end of the ring buffer
+                for i in range(10):
+                    tap.write(0, [HidrawEvent(i, bytes([i]) * 30)])
+                    self.assertEqual(reader.read_events(), [(0, i, bytes([i]) * 30)])
+
+                # the reader continues with the oldest intact event once
+                # it fell behind
+                for i in range(10, 100):
+                    tap.write(1, [HidrawEvent(i, bytes([i]) * 30)])
+                events = reader.read_events()
+                self.assertEqual(events, [(1, i, bytes([i]) * 30) for i in range(95, 100)])
+                self.assertEqual(reader.dropped, 85)
+                tap.write(1, [HidrawEvent(100, b'\x01')])
+                self.assertEqual(reader.read_events(), [(1, 100, b'\x01')])
+                self.assertEqual(reader.dropped, 85)
+
+                for i in range(101, 200):
+                    tap.write(1, [HidrawEvent(i, b'\x01')])
+                tap.close()
+                events = list(reader)
+                self.assertEqual(events[-1], (1, 199, b'\x01'))
+                self.assertEqual(len(events) + reader.dropped, 85 + 99)
+
+    def test_attach_while_publishing(self):
+        with EventTap(self.devices) as tap:
+            tap.write(0, [HidrawEvent(0, b'\x01')])
+            # attach between the producer counting an event as published
+            # and committing it
+            commit = tap._counters[_COMMIT]
+            tap._counters[_COMMIT] = 0
+            with EventTapReader(tap.name) as reader:
+                tap._counters[_COMMIT] = commit
+                self.assertEqual(reader.read_events(), [(0, 0, b'\x01')])
+                self.assertEqual(reader.dropped, 0)
+                tap.close()
+                self.assertEqual(list(reader), [])
+                self.assertEqual(reader.dropped, 0)
+
+    def test_capacity(self):
+        with EventTap(self.devices, capacity=16) as tap:
+            with self.assertRaises(ValueError):
+                tap.write(0, [HidrawEvent(0, b'\x01')])